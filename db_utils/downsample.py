@@ -0,0 +1,55 @@
+# db_utils/downsample.py
+
+import warnings
+
+import numpy as np
+
+
+def lttb_indices(x: np.ndarray, Y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets cho nhiều series dùng chung trục x (mỗi dòng của Y 1 series).
+    Trả về ma trận chỉ số cột (len(Y) x n_out), tăng dần theo dòng: điểm đầu + cuối giữ nguyên,
+    mỗi bucket giữa chọn điểm tạo tam giác lớn nhất với điểm đã chọn trước và trung bình
+    bucket sau -> đỉnh / đáy nhọn được giữ lại thay vì bị trung bình hoá.
+    Chạy lặp theo bucket (n_out bước), mỗi bước vector hoá trên mọi series.
+    NaN không bao giờ được chọn trừ khi cả bucket là NaN (giữ chỗ trống trên chart).
+    """
+    x = np.asarray(x, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    n_series, n = Y.shape
+    if n_out >= n or n_out < 3:
+        return np.broadcast_to(np.arange(n), (n_series, n))
+
+    idx = np.empty((n_series, n_out), dtype=np.int64)
+    idx[:, 0] = 0
+    idx[:, -1] = n - 1
+    rows = np.arange(n_series)
+    # biên bucket cho các điểm 1..n-2, bucket "sau" của bucket cuối là điểm n-1
+    edges = np.floor(np.linspace(1, n - 1, n_out - 1)).astype(np.int64)
+    edges[-1] = n - 1
+    a = np.zeros(n_series, dtype=np.int64)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)  # nanmean của bucket toàn NaN
+        for i in range(n_out - 2):
+            lo, hi = edges[i], max(edges[i + 1], edges[i] + 1)
+            nlo = hi
+            nhi = edges[i + 2] if i + 2 < len(edges) else n
+            nhi = max(nhi, nlo + 1)
+
+            xb = x[lo:hi]
+            yb = Y[:, lo:hi]
+            avg_x = x[nlo:nhi].mean()
+            avg_y = np.nanmean(Y[:, nlo:nhi], axis=1)
+            xa = x[a]
+            ya = Y[rows, a]
+            # điểm trước / bucket sau là NaN -> lấy trung bình gần nhất có giá trị
+            ya = np.where(np.isnan(ya), np.where(np.isnan(avg_y), np.nanmean(yb, axis=1), avg_y), ya)
+            avg_y = np.where(np.isnan(avg_y), ya, avg_y)
+
+            area = np.abs((xa - avg_x)[:, None] * (yb - ya[:, None])
+                          - (xa[:, None] - xb[None, :]) * (avg_y - ya)[:, None])
+            area = np.where(np.isnan(area), -1.0, area)
+            a = lo + np.argmax(area, axis=1)
+            idx[:, i + 1] = a
+    return idx
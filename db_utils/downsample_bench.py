@@ -0,0 +1,69 @@
+# db_utils/downsample_bench.py
+# Benchmark thủ công: payload /kpi_analysis/api theo độ dài cửa sổ, SAMPLE BY 3m cố định (cách cũ)
+# vs bucket theo cửa sổ + LTTB, tối đa KPI_ANALYSIS_POINTS điểm / series và
+# KPI_ANALYSIS_CHART_POINTS điểm / chart (cách mới).
+# Dữ liệu dạng dài sinh ngẫu nhiên như QuestDB trả về (mỗi series có 1 đáy nhọn để kiểm tra LTTB),
+# đo thời gian dựng chart + json.dumps và kích thước JSON.
+#   python -m db_utils.downsample_bench [nodes] [kpis]
+
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import KPI_ANALYSIS_POINTS, KPI_ANALYSIS_LTTB_FACTOR, KPI_ANALYSIS_CHART_POINTS
+from routers.kpi_analysis import _build_charts, _choose_sample_by, _series_points, _BUCKETS
+
+WINDOWS = [180, 1440, 4320, 20160]  # 3h, 1 ngày, 3 ngày, 14 ngày
+
+
+def make_long(nodes, kpis, minutes: int, bucket_min: int) -> pd.DataFrame:
+    n = max(1, minutes // bucket_min)
+    rng = np.random.default_rng(0)
+    ts = pd.date_range("2025-01-01", periods=n, freq=f"{bucket_min}min", tz="UTC")
+    v = rng.uniform(98, 100, (len(kpis), len(nodes), n))
+    v[:, :, n // 2] = 60.0  # đáy nhọn giữa cửa sổ
+    K, N, T = np.meshgrid(np.arange(len(kpis)), np.arange(len(nodes)), np.arange(n), indexing="ij")
+    return pd.DataFrame({
+        "ts": ts[T.ravel()],
+        "kpi_name": np.asarray(kpis)[K.ravel()],
+        "Node": np.asarray(nodes)[N.ravel()],
+        "v": v.ravel(),
+    })
+
+
+def run(label, df, kpis, nodes, points, lttb, chart_points):
+    t = time.perf_counter()
+    charts = _build_charts(df, kpis, nodes, {}, points, lttb, chart_points)
+    body = json.dumps({"charts": charts})
+    elapsed = time.perf_counter() - t
+    pts = max(len(s["data"]) for c in charts for s in c["series"])
+    per_chart = max(sum(len(s["data"]) for s in c["series"]) for c in charts)
+    dip = all(min(v for v in s["data"] if v is not None) <= 60.0 for c in charts for s in c["series"])
+    print(f"    {label:<22} {len(df):>10,} dòng  {pts:>5} điểm/series  {per_chart:>7,} điểm/chart"
+          f"  JSON {len(body) / 1e6:7.1f} MB  {elapsed * 1000:7.0f} ms  đáy còn: {'✅' if dip else '❌'}")
+
+
+def main():
+    n_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_kpis = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    nodes = [f"node{i:03d}" for i in range(n_nodes)]
+    kpis = [f"kpi_{i:02d}" for i in range(n_kpis)]
+    points = KPI_ANALYSIS_POINTS
+    per_series = _series_points(points, n_nodes, KPI_ANALYSIS_CHART_POINTS)
+    sizes = dict(_BUCKETS)
+    print(f"{n_nodes} node x {n_kpis} KPI, points={points}, chart_points={KPI_ANALYSIS_CHART_POINTS}"
+          f" -> {per_series} điểm/series, LTTB factor={KPI_ANALYSIS_LTTB_FACTOR}")
+    for minutes in WINDOWS:
+        print(f"  cửa sổ {minutes} phút")
+        if minutes <= 4320:  # 14 ngày @3m ~ 27M dòng: bỏ qua phần cũ cho nhẹ máy
+            run("SAMPLE BY 3m", make_long(nodes, kpis, minutes, 3), kpis, nodes, 10 ** 9, False, 10 ** 9)
+        bucket = _choose_sample_by(minutes, per_series * KPI_ANALYSIS_LTTB_FACTOR)
+        run(f"SAMPLE BY {bucket} + LTTB", make_long(nodes, kpis, minutes, sizes[bucket]), kpis, nodes, points, True,
+            KPI_ANALYSIS_CHART_POINTS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# db_utils/frame_cache.py
+
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+from config import LAST_KPI_CACHE_TTL, LAST_KPI_CACHE_SETTLE
+
+
+class _Flight:
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class FrameCache:
+    """
+    Cache kết quả tính toán (DataFrame, ...) theo key với TTL ngắn + single-flight:
+    nhiều request cùng key trong lúc đang tính chỉ chạy compute() 1 lần, các request
+    còn lại chờ và dùng chung kết quả. invalidate(key) trong lúc đang tính -> kết quả
+    vẫn trả cho request đang chờ nhưng không được lưu (có thể đã cũ).
+    Kết quả bắt đầu tính trong `settle` giây sau invalidate(key) chỉ được lưu tới hết khoảng
+    đó: invalidate đến từ flush ILP, dòng mới trên bảng WAL có thể chưa đọc được ngay.
+    Giá trị được dùng chung giữa các request: bên đọc không được sửa tại chỗ.
+    """
+
+    def __init__(self, ttl: float = LAST_KPI_CACHE_TTL, settle: float = LAST_KPI_CACHE_SETTLE):
+        self.ttl = ttl
+        self.settle = settle
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._generation: Dict[Hashable, int] = defaultdict(int)
+        self._settle_until: Dict[Hashable, float] = {}  # hết hạn "vừa invalidate" theo key
+        self._settle_all_until = 0.0                     # invalidate() không key
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.shared = self.invalidations = 0
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                generation = self._generation[key]
+                started = time.monotonic()
+                self.misses += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if flight.error is None and self.ttl > 0 and self._generation[key] == generation:
+                    expires = time.monotonic() + self.ttl
+                    settle_until = max(self._settle_until.get(key, 0.0), self._settle_all_until)
+                    if started < settle_until:
+                        # bắt đầu tính lúc WAL có thể chưa apply -> chỉ giữ tới hết settle
+                        expires = min(expires, settle_until)
+                    self._entries[key] = (expires, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def invalidate(self, key: Hashable = None) -> None:
+        """Bỏ entry của key (None = tất cả); compute đang chạy của key đó sẽ không được lưu."""
+        with self._lock:
+            keys = list(self._entries) + list(self._inflight) if key is None else [key]
+            until = time.monotonic() + self.settle
+            for k in keys:
+                self._entries.pop(k, None)
+                self._generation[k] += 1
+                if key is not None:
+                    self._settle_until[k] = until
+            if key is None:
+                self._settle_all_until = until
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "ttl_s": self.ttl,
+                "settle_s": self.settle,
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "invalidations": self.invalidations,
+                "keys": {str(k): round(exp - now, 1) for k, (exp, _) in self._entries.items() if exp > now},
+                "computing": [str(k) for k in self._inflight],
+            }
+
+
+# Frame của trang last_kpi theo node_type (MME/PGW/SBG); invalidate khi flush bảng cùng tên
+LAST_KPI_CACHE = FrameCache()
@@ -0,0 +1,385 @@
+# db_utils/ingest_spool.py
+
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+import requests
+
+from config import (
+    SPOOL_DIR, SPOOL_MAX_BYTES, SPOOL_SEGMENT_BYTES,
+    SPOOL_BACKOFF_MIN, SPOOL_BACKOFF_MAX,
+    QUESTDB_USER, QUESTDB_PASSWORD,
+)
+from jobs.log_service import get_logger
+
+_log = get_logger("IngestSpool", "questdb_ingest.log")
+
+# Mỗi bản ghi trong segment: MAGIC | len (uint32) | crc32 (uint32) | payload ILP
+_MAGIC = b"SP"
+_HEADER = struct.Struct("<2sII")
+_SEG_EXT = ".seg"
+_ACK_EXT = ".ack"
+
+
+class IngestSpool:
+    """
+    Spool trên đĩa cho các batch ILP ghi QuestDB thất bại.
+    - Append-only, chia segment theo bảng: <root>/<table>/<seq>.seg, có checksum.
+    - Thread nền replay theo thứ tự từng bảng (POST /write), backoff khi lỗi.
+    - Giới hạn dung lượng: vượt `max_bytes` thì bỏ segment cũ nhất (kể cả segment
+      đang replay: replay dừng ở batch kế tiếp, không ghi lại .ack).
+    - Batch bị QuestDB từ chối -> <table>/rejected.ilp, xoay vòng khi vượt segment_bytes
+      (giữ thêm 1 file rejected.ilp.1) -> tối đa 2 x segment_bytes / bảng.
+    """
+
+    def __init__(
+        self,
+        write_url: str,
+        root: str = SPOOL_DIR,
+        *,
+        auth: Optional[Tuple[str, str]] = (QUESTDB_USER, QUESTDB_PASSWORD),
+        segment_bytes: int = SPOOL_SEGMENT_BYTES,
+        max_bytes: int = SPOOL_MAX_BYTES,
+        backoff_min: float = SPOOL_BACKOFF_MIN,
+        backoff_max: float = SPOOL_BACKOFF_MAX,
+        timeout: float = 10.0,
+    ) -> None:
+        self.write_url = write_url
+        self.root = root
+        self.auth = auth
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        os.makedirs(self.root, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._active: Dict[str, tuple] = {}          # table -> (seq, file)
+        self._next_try: Dict[str, float] = {}        # table -> monotonic
+        self._backoff: Dict[str, float] = {}         # table -> giây
+        self._total_bytes = self._scan_total_bytes()
+
+        self.appended_batches = 0
+        self.replayed_batches = 0
+        self.rejected_batches = 0
+        self.dropped_bytes = 0
+
+        self._session = requests.Session()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._replay_loop, name="questdb-spool", daemon=True)
+        self._thread.start()
+
+    # ----------------- Layout -----------------
+    def _table_dir(self, table: str) -> str:
+        return os.path.join(self.root, table)
+
+    def _segments(self, table: str) -> list:
+        try:
+            names = os.listdir(self._table_dir(table))
+        except FileNotFoundError:
+            return []
+        return sorted(int(n[:-len(_SEG_EXT)]) for n in names if n.endswith(_SEG_EXT))
+
+    def _seg_path(self, table: str, seq: int, ext: str = _SEG_EXT) -> str:
+        return os.path.join(self._table_dir(table), f"{seq:012d}{ext}")
+
+    def _tables(self) -> list:
+        return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+
+    def _scan_total_bytes(self) -> int:
+        total = 0
+        for table in self._tables():
+            for seq in self._segments(table):
+                total += os.path.getsize(self._seg_path(table, seq))
+        return total
+
+    # ----------------- Append -----------------
+    def append(self, table: str, payload: bytes) -> bool:
+        """Ghi 1 batch ILP vào spool (fsync). Trả về False nếu không ghi được."""
+        if not payload:
+            return True
+        record = _HEADER.pack(_MAGIC, len(payload), zlib.crc32(payload)) + payload
+        try:
+            with self._lock:
+                self._enforce_limit(len(record))
+                seq, f = self._active_file(table)
+                f.write(record)
+                f.flush()
+                os.fsync(f.fileno())
+                self._total_bytes += len(record)
+                self.appended_batches += 1
+                if f.tell() >= self.segment_bytes:
+                    self._seal(table)
+            self._wakeup.set()
+            return True
+        except OSError as e:
+            _log.error(f"❌ Spool append error ({table}): {e}")
+            return False
+
+    def _active_file(self, table: str):
+        active = self._active.get(table)
+        if active is None:
+            os.makedirs(self._table_dir(table), exist_ok=True)
+            segs = self._segments(table)
+            seq = (segs[-1] + 1) if segs else 1
+            _remove(self._seg_path(table, seq, _ACK_EXT))  # .ack cũ cùng số (nếu còn sót) không áp cho segment mới
+            active = (seq, open(self._seg_path(table, seq), "ab"))
+            self._active[table] = active
+        return active
+
+    def _seal(self, table: str) -> None:
+        active = self._active.pop(table, None)
+        if active:
+            active[1].close()
+
+    def _enforce_limit(self, incoming: int) -> None:
+        """Bỏ segment cũ nhất (toàn spool) cho tới khi đủ chỗ."""
+        while self._total_bytes + incoming > self.max_bytes:
+            oldest = None
+            for table in self._tables():
+                segs = self._segments(table)
+                if segs:
+                    path = self._seg_path(table, segs[0])
+                    mtime = os.path.getmtime(path)
+                    if oldest is None or mtime < oldest[0]:
+                        oldest = (mtime, table, segs[0])
+            if oldest is None:
+                return
+            _, table, seq = oldest
+            active = self._active.get(table)
+            if active and active[0] == seq:
+                self._seal(table)
+            size = self._drop_segment(table, seq)
+            self.dropped_bytes += size
+            _log.warning(f"⚠ Spool đầy, bỏ segment {table}/{seq} ({size} bytes)")
+
+    def _drop_segment(self, table: str, seq: int) -> int:
+        path = self._seg_path(table, seq)
+        size = 0
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        _remove(self._seg_path(table, seq, _ACK_EXT))
+        self._total_bytes = max(0, self._total_bytes - size)
+        return size
+
+    def _write_rejected(self, table: str, payload: bytes) -> None:
+        """Lưu batch bị từ chối để xem lại; xoay vòng rejected.ilp -> rejected.ilp.1 khi đầy."""
+        path = os.path.join(self._table_dir(table), "rejected.ilp")
+        with self._lock:
+            try:
+                if os.path.getsize(path) + len(payload) > self.segment_bytes:
+                    os.replace(path, path + ".1")
+            except FileNotFoundError:
+                pass
+            with open(path, "ab") as rf:
+                rf.write(payload)
+
+    # ----------------- Replay -----------------
+    def _replay_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                busy = False
+                for table in self._tables():
+                    if self._stop.is_set():
+                        return
+                    busy = self._replay_table(table) or busy
+            except Exception as e:
+                _log.error(f"❌ Spool replay error: {e}")
+                busy = False
+            if not busy:
+                self._wakeup.wait(self.backoff_min)
+                self._wakeup.clear()
+
+    def _replay_table(self, table: str) -> bool:
+        """Replay segment cũ nhất của bảng. Trả về True nếu còn việc làm ngay."""
+        if time.monotonic() < self._next_try.get(table, 0.0):
+            return False
+        with self._lock:
+            segs = self._segments(table)
+            if not segs:
+                return False
+            seq = segs[0]
+            active = self._active.get(table)
+            if active and active[0] == seq:
+                self._seal(table)  # đóng segment đang ghi để replay, append sau sẽ mở segment mới
+
+        path = self._seg_path(table, seq)
+        ack_path = self._seg_path(table, seq, _ACK_EXT)
+        offset = _read_ack(ack_path)
+
+        with open(path, "rb") as f:
+            f.seek(offset)
+            while not self._stop.is_set():
+                header = f.read(_HEADER.size)
+                if not header:
+                    break
+                if len(header) < _HEADER.size:
+                    _log.warning(f"⚠ Spool {table}/{seq}: header cụt tại {offset}, bỏ phần còn lại")
+                    break
+                magic, length, crc = _HEADER.unpack(header)
+                payload = f.read(length) if magic == _MAGIC else b""
+                if magic != _MAGIC or len(payload) != length or zlib.crc32(payload) != crc:
+                    _log.warning(f"⚠ Spool {table}/{seq}: checksum sai tại {offset}, bỏ phần còn lại")
+                    break
+
+                status = self._post(payload)
+                if status == "retry":
+                    self._schedule_retry(table)
+                    return False
+                if status == "rejected":
+                    self.rejected_batches += 1
+                    self._write_rejected(table, payload)
+                else:
+                    self.replayed_batches += 1
+                offset = f.tell()
+                with self._lock:
+                    if not os.path.exists(path):
+                        # _enforce_limit đã bỏ segment trong lúc replay (và xoá .ack) -> dừng
+                        return True
+                    _write_ack(ack_path, offset)
+            else:
+                return False
+
+        with self._lock:
+            self._drop_segment(table, seq)
+        self._backoff.pop(table, None)
+        self._next_try.pop(table, None)
+        return True
+
+    def _post(self, payload: bytes) -> str:
+        try:
+            resp = self._session.post(self.write_url, data=payload, auth=self.auth, timeout=self.timeout)
+        except requests.RequestException:
+            return "retry"
+        if resp.status_code < 300:
+            return "ok"
+        # 4xx do dữ liệu (không phải auth/timeout/rate limit) -> replay cũng không qua được
+        if 400 <= resp.status_code < 500 and resp.status_code not in (401, 403, 408, 429):
+            _log.warning(f"⚠ Spool: QuestDB từ chối batch ({resp.status_code}): {resp.text[:200]}")
+            return "rejected"
+        return "retry"
+
+    def _schedule_retry(self, table: str) -> None:
+        delay = min(self.backoff_max, self._backoff.get(table, self.backoff_min / 2) * 2)
+        self._backoff[table] = delay
+        self._next_try[table] = time.monotonic() + delay
+
+    # ----------------- Thống kê / đóng -----------------
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "write_url": self.write_url,
+                "pending_bytes": self._total_bytes,
+                "appended_batches": self.appended_batches,
+                "replayed_batches": self.replayed_batches,
+                "rejected_batches": self.rejected_batches,
+                "dropped_bytes": self.dropped_bytes,
+                "backoff": {t: round(d, 1) for t, d in self._backoff.items()},
+            }
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout=self.timeout + 1)
+        with self._lock:
+            for table in list(self._active):
+                self._seal(table)
+        self._session.close()
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _read_ack(path: str) -> int:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def _write_ack(path: str, offset: int) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(str(offset))
+    os.replace(tmp, path)
+
+
+# ----------------- Singleton theo đích ghi -----------------
+_spools: Dict[str, IngestSpool] = {}
+_spools_lock = threading.Lock()
+
+
+def get_spool(host: str, port: int) -> IngestSpool:
+    write_url = f"http://{host}:{port}/write"
+    with _spools_lock:
+        spool = _spools.get(write_url)
+        if spool is None:
+            spool = IngestSpool(write_url, os.path.join(SPOOL_DIR, f"{host}_{port}"))
+            _spools[write_url] = spool
+        return spool
+
+
+def all_spool_stats() -> list:
+    with _spools_lock:
+        spools = list(_spools.values())
+    return [s.stats() for s in spools]
+
+
+def shutdown_spools() -> None:
+    with _spools_lock:
+        spools = list(_spools.values())
+        _spools.clear()
+    for spool in spools:
+        spool.close()
+
+
+# Test thủ công: endpoint giả lập từ chối 3 lần đầu rồi nhận
+if __name__ == "__main__":
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    state = {"calls": 0, "received": []}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            state["calls"] += 1
+            if state["calls"] <= 3:
+                self.send_response(503)
+            else:
+                state["received"].append(body)
+                self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    httpd = HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_port}/write"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        spool = IngestSpool(url, tmp, backoff_min=0.1, backoff_max=0.5, segment_bytes=64)
+        for i in range(5):
+            spool.append("MME", f"MME,Node=n1,kpi_name=k ratio={i}.0 {i}000000000\n".encode())
+        deadline = time.time() + 10
+        while spool.stats()["pending_bytes"] and time.time() < deadline:
+            time.sleep(0.1)
+        print(spool.stats())
+        print([b.decode().strip() for b in state["received"]])
+        spool.close()
+    httpd.shutdown()
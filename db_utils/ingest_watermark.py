@@ -0,0 +1,91 @@
+# db_utils/ingest_watermark.py
+
+import datetime
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+import pandas as pd
+
+from db_utils.kpi_record import KpiRecord
+
+
+class WatermarkCache:
+    """
+    Mốc thời gian đã ghi gần nhất theo (table, Node, kpi_name).
+    Dùng ở luồng ghi live: bỏ các KpiRecord có ts <= mốc (cửa sổ chồng lấn,
+    job chạy lại). Mốc chỉ tiến khi batch đã flush (advance gọi từ callback flush
+    của IngestService) -> flush lỗi thì lần chạy sau ghi lại được.
+    Bảng QuestDB vẫn có DEDUP UPSERT KEYS làm lớp bảo vệ cuối.
+    """
+
+    SEED_RETRY_S = 60.0
+
+    def __init__(self) -> None:
+        self._marks: Dict[Tuple[str, str, str], datetime.datetime] = {}
+        self._seeded: set = set()
+        self._seed_retry_at: Dict[str, float] = {}  # table -> monotonic được thử seed lại
+        self._lock = threading.Lock()
+
+    def filter(self, table: str, records: Iterable[KpiRecord]) -> List[KpiRecord]:
+        """Trả về các record mới hơn mốc (không đổi mốc)."""
+        with self._lock:
+            marks = self._marks
+            return [
+                r for r in records
+                if (mark := marks.get((table, r.node, r.kpi_name))) is None or r.ts > mark
+            ]
+
+    def advance(self, table: str, records: Iterable[KpiRecord]) -> None:
+        """Đẩy mốc tới ts lớn nhất của các record đã flush thành công."""
+        with self._lock:
+            marks = self._marks
+            for r in records:
+                key = (table, r.node, r.kpi_name)
+                mark = marks.get(key)
+                if mark is None or r.ts > mark:
+                    marks[key] = r.ts
+
+    def seed(self, table: str, qdb=None) -> int:
+        """
+        Nạp mốc từ QuestDB (LATEST ON) 1 lần cho mỗi bảng. Chỉ đánh dấu đã seed khi
+        query thành công; lỗi thì bỏ qua và thử lại sau SEED_RETRY_S giây.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if table in self._seeded or self._seed_retry_at.get(table, 0.0) > now:
+                return 0
+            # chặn các thread khác query cùng lúc trong khi đang seed
+            self._seed_retry_at[table] = now + self.SEED_RETRY_S
+        try:
+            if qdb is None:
+                from db_utils.questdb_query import QuestDBQuery
+                qdb = QuestDBQuery(pool_size=1, max_overflow=0)
+            df = qdb.query(
+                f"SELECT Node, kpi_name, timestamp FROM {table} "
+                f"LATEST ON timestamp PARTITION BY Node, kpi_name"
+            )
+        except Exception as e:
+            print(f"⚠ Không nạp được watermark {table}: {e}")
+            return 0
+        with self._lock:
+            self._seeded.add(table)
+            self._seed_retry_at.pop(table, None)
+        if df.empty:
+            return 0
+        ts = pd.to_datetime(df["timestamp"], utc=True)
+        with self._lock:
+            for node, kpi_name, t in zip(df["Node"].astype(str), df["kpi_name"].astype(str), ts):
+                key = (table, node, kpi_name)
+                t = t.to_pydatetime()
+                if key not in self._marks or t > self._marks[key]:
+                    self._marks[key] = t
+        return len(df)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"keys": len(self._marks), "seeded_tables": sorted(self._seeded)}
+
+
+# Dùng chung toàn process
+WATERMARKS = WatermarkCache()
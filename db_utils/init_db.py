@@ -25,8 +25,30 @@ def create_questdb_table_pg(sql: str):
             with conn.cursor() as cur:
                 cur.execute(sql)
         print("✅ QuestDB table created or already exists")
+        return True
     except Exception as e:
         print(f"❌ Failed to create QuestDB table: {e}")
+        return False
+
+
+def questdb_table_flags() -> dict:
+    """{table_name: (walEnabled, dedup)} từ tables(); lỗi -> {}"""
+    try:
+        if QUESTDB_PGWIRE_DSN.startswith("questdb://"):
+            conn = psycopg2.connect(**parse_pg_dsn(QUESTDB_PGWIRE_DSN))
+        else:
+            conn = psycopg2.connect(QUESTDB_PGWIRE_DSN)
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT table_name, walEnabled, dedup FROM tables()")
+                return {name: (bool(wal), bool(dedup)) for name, wal, dedup in cur.fetchall()}
+    except Exception as e:
+        print(f"❌ Failed to read QuestDB tables(): {e}")
+        return {}
+
+# Bảng KPI ghi bởi các worker: khoá upsert (timestamp, Node, kpi_name)
+DEDUP_TABLES = ["MME", "PGW", "SBG", "SBG_Long"]
+
 
 def init_questdb_tables():
     tables = {
@@ -40,6 +62,8 @@ def init_questdb_tables():
             ) TIMESTAMP(timestamp)
             PARTITION BY HOUR
             TTL 15 DAY
+            WAL
+            DEDUP UPSERT KEYS(timestamp, Node, kpi_name)
         """,
         "MME": """
             CREATE TABLE IF NOT EXISTS MME (
@@ -50,6 +74,8 @@ def init_questdb_tables():
             ) TIMESTAMP(timestamp)
             PARTITION BY HOUR
             TTL 15 DAY
+            WAL
+            DEDUP UPSERT KEYS(timestamp, Node, kpi_name)
         """,
         "SBG": """
             CREATE TABLE IF NOT EXISTS SBG (
@@ -60,6 +86,8 @@ def init_questdb_tables():
             ) TIMESTAMP(timestamp)
             PARTITION BY HOUR
             TTL 15 DAY
+            WAL
+            DEDUP UPSERT KEYS(timestamp, Node, kpi_name)
         """,
          "KPI": """
             CREATE TABLE IF NOT EXISTS KPI (
@@ -70,13 +98,58 @@ def init_questdb_tables():
 				Nguong SYMBOL
             ) TIMESTAMP(timestamp)
             PARTITION BY HOUR
-    """
+    """,
+        # Thời gian từng phase thu thập / node / chu kỳ (jobs/collector_stats.py)
+        "collector_stats": """
+            CREATE TABLE IF NOT EXISTS collector_stats (
+                timestamp TIMESTAMP,
+                type SYMBOL,
+                Node SYMBOL,
+                phase SYMBOL,
+                ms DOUBLE,
+                bytes LONG,
+                ok BOOLEAN
+            ) TIMESTAMP(timestamp)
+            PARTITION BY DAY
+            TTL 30 DAY
+            WAL
+            DEDUP UPSERT KEYS(timestamp, type, Node, phase)
+        """,
     }
 
     for name, sql in tables.items():
         print(f"🔧 Creating QuestDB table: {name}")
         create_questdb_table_pg(sql)
 
+    migrate_dedup_tables()
+
+
+def migrate_dedup_tables():
+    """
+    Bảng đã tạo từ trước (hoặc do ILP tự tạo như SBG_Long) -> bật DEDUP.
+    DEDUP chỉ có trên bảng WAL: bảng non-WAL được chuyển bằng SET TYPE WAL, QuestDB chỉ
+    áp dụng khi restart -> sau restart chạy lại init_db (khởi động app) để bật DEDUP.
+    Dòng trùng đã ghi trước đó vẫn còn (DEDUP chỉ áp cho lần ghi mới, hết hạn theo TTL)
+    -> phía đọc vẫn bỏ trùng (last_kpi: GROUP BY trong last_n_sql, check_signal: drop_duplicates).
+    """
+    flags = questdb_table_flags()
+    for name in DEDUP_TABLES:
+        if flags and name not in flags:
+            continue  # chưa có bảng (SBG_Long do ILP tạo khi có dữ liệu)
+        wal, dedup = flags.get(name, (True, False))
+        if not wal:
+            print(f"🔧 Convert QuestDB table {name} to WAL")
+            if create_questdb_table_pg(f"ALTER TABLE {name} SET TYPE WAL"):
+                print(f"⚠ {name}: cần restart QuestDB rồi chạy lại init_db để bật DEDUP (xem README)")
+            continue
+        if dedup:
+            continue
+        print(f"🔧 Enable DEDUP on QuestDB table: {name}")
+        if not create_questdb_table_pg(
+            f"ALTER TABLE {name} DEDUP ENABLE UPSERT KEYS(timestamp, Node, kpi_name)"
+        ):
+            print(f"⚠ {name}: chưa bật được DEDUP -> dòng trùng vẫn có thể được ghi")
+
 
 def init_db():
     """Khởi tạo database SQLite + QuestDB"""
@@ -0,0 +1,48 @@
+# db_utils/kpi_record.py
+
+import datetime
+from typing import Iterable, List, NamedTuple, Optional
+
+UTC = datetime.timezone.utc
+
+
+class KpiRecord(NamedTuple):
+    """1 giá trị KPI đã parse sẵn (collector -> ingestion, không qua file log)."""
+    node: str
+    kpi_name: str
+    ts: datetime.datetime   # UTC
+    ratio: float
+    att: Optional[float] = None  # chỉ PGW có cột att
+
+
+def parse_ts(value: str) -> datetime.datetime:
+    """'YYYY-MM-DD HH:MM[:SS]' hoặc ISO 'YYYY-MM-DDTHH:MM:SS' -> datetime UTC."""
+    dt = datetime.datetime.fromisoformat(value.strip())
+    if dt.tzinfo is None:
+        return dt.replace(tzinfo=UTC)
+    return dt.astimezone(UTC)
+
+
+def format_insertdb(records: Iterable[KpiRecord], time_format: str = "%Y-%m-%d %H:%M") -> str:
+    """Dựng lại dòng insertDB;node;time;kpi;value (chỉ dùng cho log debug)."""
+    return "".join(
+        f"insertDB;{r.node};{r.ts.strftime(time_format)};{r.kpi_name};{r.ratio}\n"
+        for r in records
+    )
+
+
+def parse_insertdb_lines(lines: Iterable[str]) -> List[KpiRecord]:
+    """Parse các dòng insertDB;node;time;kpi;value (log cũ) thành KpiRecord."""
+    records = []
+    for line in lines:
+        line = line.strip()
+        if "insertDB;" not in line:
+            continue
+        parts = line[line.index("insertDB;"):].split(";")
+        if len(parts) != 5:
+            continue
+        try:
+            records.append(KpiRecord(parts[1], parts[3], parse_ts(parts[2]), float(parts[4])))
+        except ValueError:
+            continue
+    return records
@@ -0,0 +1,93 @@
+# db_utils/kpi_window.py
+
+import numpy as np
+import pandas as pd
+
+
+def last_n_sql(table: str, kpi_clause: str, node_filter_sql: str = "", n: int = 7) -> str:
+    """
+    SQL lấy n điểm gần nhất mỗi (Node, kpi_name) ngay trong QuestDB (row_number() theo
+    partition), trả về đã sắp theo Node, kpi_name, timestamp tăng dần -> mỗi series là
+    1 đoạn liên tiếp. Chỉ n dòng / series đi qua PGWire thay vì cả cửa sổ thời gian.
+    Dòng trùng (Node, kpi_name, timestamp) gộp bằng GROUP BY trước row_number() (giữ giá trị
+    ghi sau cùng, như DEDUP UPSERT) -> luôn đủ n timestamp khác nhau nếu có.
+    Bind: :cutoff + các tham số của kpi_clause / node_filter_sql.
+    """
+    return f"""
+        SELECT timestamp, Node, kpi_name, kpi_value
+        FROM (
+          SELECT
+            timestamp,
+            Node,
+            kpi_name,
+            kpi_value,
+            row_number() OVER (PARTITION BY Node, kpi_name ORDER BY timestamp DESC) AS rn
+          FROM (
+            SELECT timestamp, Node, kpi_name, last(ratio) AS kpi_value
+            FROM {table}
+            WHERE kpi_name IN ({kpi_clause})
+              {node_filter_sql}
+              AND timestamp > CAST(:cutoff AS TIMESTAMP)
+            GROUP BY timestamp, Node, kpi_name
+          )
+        )
+        WHERE rn <= {int(n)}
+        ORDER BY Node, kpi_name, timestamp
+    """
+
+
+def group_starts(keys: np.ndarray) -> np.ndarray:
+    """Mask True ở dòng đầu mỗi đoạn key liên tiếp (mảng đã sắp theo key)."""
+    starts = np.ones(len(keys), dtype=bool)
+    if len(keys) > 1:
+        starts[1:] = keys[1:] != keys[:-1]
+    return starts
+
+
+def group_ends(keys: np.ndarray) -> np.ndarray:
+    """Mask True ở dòng cuối mỗi đoạn key liên tiếp."""
+    ends = np.ones(len(keys), dtype=bool)
+    if len(keys) > 1:
+        ends[:-1] = keys[1:] != keys[:-1]
+    return ends
+
+
+def ema_by_group(values: np.ndarray, starts: np.ndarray, span: int = 3) -> np.ndarray:
+    """
+    EMA (adjust=False, ignore_na=False, như pandas ewm(span).mean()) cho nhiều series
+    nối liền: lặp theo vị trí trong series (<= n bước) thay vì lặp theo series ->
+    vectorized trên mọi series cùng lúc. Ô NaN giữ EMA của điểm trước; điểm có giá trị
+    sau g vị trí kể từ điểm có giá trị trước: trọng số cũ decay = (1 - alpha)^g,
+    ema = (decay * ema_trước + w * giá_trị) / (decay + w), w = alpha
+    (com == 1 tức span=3: w = 1 - decay, đúng nhánh riêng của pandas).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    ema = values.copy()
+    if not len(values):
+        return ema
+    com = (span - 1) / 2.0
+    alpha = 1.0 / (1.0 + com)
+    idx = np.arange(len(values))
+    pos = idx - np.maximum.accumulate(np.where(starts, idx, 0))
+    gap = np.ones(len(values))  # số vị trí từ điểm có giá trị gần nhất tới vị trí kế tiếp
+    for k in range(1, int(pos.max()) + 1):
+        at = np.flatnonzero(pos == k)
+        prev = ema[at - 1]
+        cur = values[at]
+        decay = (1.0 - alpha) ** gap[at - 1]
+        w = 1.0 - decay if com == 1 else alpha
+        ema[at] = np.where(np.isnan(cur), prev,
+                           np.where(np.isnan(prev), cur, (decay * prev + w * cur) / (decay + w)))
+        gap[at] = np.where(np.isnan(cur), gap[at - 1] + 1.0, 1.0)
+    return ema
+
+
+def frame_with_ema(df: pd.DataFrame, span: int = 3) -> pd.DataFrame:
+    """Kết quả last_n_sql -> thêm kpi_node + ema_kpi (không groupby / sort lại)."""
+    df = df.copy()
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True, errors="coerce")
+    df["kpi_value"] = pd.to_numeric(df["kpi_value"], errors="coerce")
+    df["kpi_node"] = df["Node"].astype(str) + "-" + df["kpi_name"].astype(str)
+    starts = group_starts(df["kpi_node"].to_numpy())
+    df["ema_kpi"] = ema_by_group(df["kpi_value"].to_numpy(), starts, span)
+    return df
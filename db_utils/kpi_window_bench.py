@@ -0,0 +1,113 @@
+# db_utils/kpi_window_bench.py
+# Benchmark thủ công: last_kpi lấy cả cửa sổ 180 phút rồi sort + groupby().head(7) + ewm lambda
+# trong pandas (cách cũ) vs QuestDB trả sẵn 7 điểm / series (row_number) + EMA numpy (cách mới).
+# Dữ liệu sinh ngẫu nhiên, phần "QuestDB trả về" dựng sẵn nên chỉ đo CPU phía app + số dòng truyền.
+#   python -m db_utils.kpi_window_bench [nodes] [kpis] [điểm/series trong cửa sổ]
+# Có QuestDB (bảng MME có dữ liệu): thêm --questdb để đo luôn 2 câu SQL thật.
+
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+import pandas as pd
+
+from db_utils.kpi_window import last_n_sql, frame_with_ema
+
+N_LAST = 7
+
+
+def make_window(nodes: int, kpis: int, points: int) -> pd.DataFrame:
+    """Kết quả câu SQL cũ: mọi điểm trong cửa sổ, ORDER BY kpi_name, Node, timestamp DESC."""
+    rng = np.random.default_rng(0)
+    node = np.repeat([f"node{i:03d}" for i in range(nodes)], kpis * points)
+    kpi = np.tile(np.repeat([f"kpi_{i:02d}" for i in range(kpis)], points), nodes)
+    end = np.datetime64("2025-01-01T03:00:00", "ns")
+    ts = np.tile(end - np.arange(points)[::-1] * np.timedelta64(3, "m"), nodes * kpis)
+    df = pd.DataFrame({
+        "timestamp": ts,
+        "Node": node,
+        "kpi_name": kpi,
+        "kpi_value": rng.uniform(95, 100, len(ts)).round(2),
+    })
+    return df.sort_values(["kpi_name", "Node", "timestamp"], ascending=[True, True, False], ignore_index=True)
+
+
+def server_last_n(window: pd.DataFrame, n: int) -> pd.DataFrame:
+    """Giả lập kết quả last_n_sql (phần QuestDB làm, không tính vào thời gian)."""
+    out = window.sort_values(["Node", "kpi_name", "timestamp"], ignore_index=True)
+    return out.groupby(["Node", "kpi_name"], sort=False).tail(n).reset_index(drop=True)
+
+
+def pipeline_old(df: pd.DataFrame) -> pd.DataFrame:
+    # Đúng như _build_frames cũ (bước 7-8)
+    df = df.copy()
+    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True, errors="coerce")
+    df["kpi_value"] = pd.to_numeric(df["kpi_value"], errors="coerce")
+    df["kpi_node"] = df["Node"].astype(str) + "-" + df["kpi_name"].astype(str)
+    df = (
+        df.sort_values(["kpi_node", "timestamp"], ascending=[True, False])
+          .groupby("kpi_node", as_index=False, group_keys=False)
+          .head(N_LAST)
+          .sort_values(["kpi_node", "timestamp"], ascending=[True, True])
+    )
+    df["ema_kpi"] = (
+        df.groupby("kpi_node")["kpi_value"]
+          .transform(lambda s: s.ewm(span=3, adjust=False).mean())
+    )
+    return df
+
+
+def timed(fn, *args, repeat: int = 3):
+    best, out = None, None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn(*args)
+        dt = time.perf_counter() - t
+        best = dt if best is None else min(best, dt)
+    return out, best
+
+
+def bench_questdb(nodes_limit: int = 500):
+    from db_utils.questdb_query import QuestDBQuery
+    q = QuestDBQuery(pool_size=1, max_overflow=0)
+    kpis = q.query("SELECT DISTINCT kpi_name FROM MME")["kpi_name"].astype(str).tolist()
+    kpi_clause, binds = q.make_in_params("k", kpis)
+    params = {"cutoff": (datetime.now(timezone.utc) - timedelta(minutes=180)).isoformat(), **binds}
+    old_sql = f"""
+        SELECT timestamp, Node, kpi_name, ratio AS kpi_value
+        FROM MME
+        WHERE kpi_name IN ({kpi_clause}) AND timestamp > CAST(:cutoff AS TIMESTAMP)
+        ORDER BY kpi_name, Node, timestamp DESC
+    """
+    for label, sql in (("SQL cũ", old_sql), ("SQL row_number", last_n_sql("MME", kpi_clause, "", N_LAST))):
+        df, t = timed(q.query, sql, params)
+        print(f"  {label:<16} {t * 1000:8.1f} ms  {len(df):>9,} dòng")
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    nodes = int(args[0]) if len(args) > 0 else 300
+    kpis = int(args[1]) if len(args) > 1 else 15
+    points = int(args[2]) if len(args) > 2 else 60
+    window = make_window(nodes, kpis, points)
+    last_n = server_last_n(window, N_LAST)
+    print(f"{nodes} node x {kpis} KPI, {points} điểm / series trong cửa sổ")
+    print(f"  dòng qua PGWire: cũ {len(window):,}  mới {len(last_n):,}  (x{len(window) / len(last_n):.1f} ít hơn)")
+
+    old, t_old = timed(pipeline_old, window)
+    new, t_new = timed(frame_with_ema, last_n)
+    print(f"  pandas sort/head/ewm : {t_old * 1000:8.1f} ms")
+    print(f"  numpy EMA (7 điểm)   : {t_new * 1000:8.1f} ms  (x{t_old / t_new:.1f})")
+
+    a = old.sort_values(["kpi_node", "timestamp"])[["kpi_node", "kpi_value", "ema_kpi"]].to_numpy()
+    b = new.sort_values(["kpi_node", "timestamp"])[["kpi_node", "kpi_value", "ema_kpi"]].to_numpy()
+    assert (a[:, 0] == b[:, 0]).all() and np.allclose(a[:, 1:].astype(float), b[:, 1:].astype(float))
+    print("  kết quả giống nhau ✅")
+
+    if "--questdb" in sys.argv:
+        bench_questdb()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# db_utils/kpi_window_test.py
+# Test: EMA numpy (ema_by_group / frame_with_ema) phải khớp pandas ewm(span, adjust=False),
+# kể cả series có NaN (pandas giảm trọng số theo số vị trí đã qua).
+#   python -m pytest db_utils/kpi_window_test.py   hoặc   python -m db_utils.kpi_window_test
+
+import numpy as np
+import pandas as pd
+
+from db_utils.kpi_window import ema_by_group, frame_with_ema, group_starts, group_ends
+
+
+def pandas_ema(values, keys, span):
+    s = pd.Series(values, dtype="float64")
+    return s.groupby(np.asarray(keys), sort=False).transform(lambda g: g.ewm(span=span, adjust=False).mean()).to_numpy()
+
+
+def test_ema_gap_matches_pandas():
+    v = np.array([1.0, np.nan, 3.0])
+    out = ema_by_group(v, group_starts(np.zeros(3)), span=3)
+    assert np.allclose(out, [1.0, 1.0, 2.5])
+
+
+def test_ema_nan_series_match_pandas():
+    series = [
+        [1, np.nan, 3],
+        [np.nan, 1, np.nan, np.nan, 4],
+        [1, np.nan, np.nan, 3, 5, np.nan, 7],
+        [np.nan, np.nan],
+        [5],
+        [98.5, 99.1, np.nan, 97.0, 99.9, 99.8, np.nan],
+    ]
+    keys = np.repeat(np.arange(len(series)), [len(s) for s in series])
+    values = np.concatenate([np.asarray(s, dtype=float) for s in series])
+    for span in (3, 5):
+        out = ema_by_group(values, group_starts(keys), span=span)
+        assert np.allclose(out, pandas_ema(values, keys, span), equal_nan=True)
+
+
+def test_ema_random_match_pandas():
+    rng = np.random.default_rng(1)
+    keys = np.sort(rng.integers(0, 200, 3000))
+    values = rng.uniform(90, 100, len(keys))
+    values[rng.random(len(keys)) < 0.2] = np.nan
+    out = ema_by_group(values, group_starts(keys), span=3)
+    assert np.allclose(out, pandas_ema(values, keys, 3), equal_nan=True)
+
+
+def test_frame_with_ema_and_group_ends():
+    df = pd.DataFrame({
+        "timestamp": pd.date_range("2025-01-01", periods=5, freq="3min", tz="UTC").tolist() * 2,
+        "Node": ["n1"] * 5 + ["n2"] * 5,
+        "kpi_name": ["attach_lte"] * 10,
+        "kpi_value": [99, np.nan, 98, 97, np.nan, 95, 96, np.nan, np.nan, 99],
+    })
+    out = frame_with_ema(df, span=3)
+    assert np.allclose(out["ema_kpi"], pandas_ema(df["kpi_value"].to_numpy(float), out["kpi_node"], 3), equal_nan=True)
+    assert out.loc[group_ends(out["kpi_node"].to_numpy()), "kpi_node"].tolist() == ["n1-attach_lte", "n2-attach_lte"]
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"✅ {name}")
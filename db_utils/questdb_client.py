@@ -1,42 +1,112 @@
 # questdb_client.py
 
-from questdb.ingress import Sender, IngressError
+from questdb.ingress import IngressError
 import datetime
 import os
 
+import numpy as np
+import pandas as pd
+
+from db_utils.questdb_ingest import build_ilp_conf, get_ingest_service
+from db_utils.ingest_spool import get_spool
+from config import SPOOL_ENABLED
+from db_utils.kpi_record import KpiRecord
+from db_utils.ingest_watermark import WATERMARKS
+from jobs.log_service import get_logger
+
+# Log chi tiết từng dòng khi nạp lại file log (DEBUG, giới hạn tốc độ; mặc định tắt)
+_log = get_logger("QuestDBClient", "questdb_client.log")
+
 class QuestDBClient:
     def __init__(self,
                  host="localhost",
                  port=9000,
                  username="admin",
                  password="quest",
-                 flush_rows=1,
-                 flush_interval=1000):
-        self.conf = (
-            f"http::addr={host}:{port};"
-            f"username={username};password={password};"
-            f"auto_flush_rows={flush_rows};"
-            f"auto_flush_interval={flush_interval};"
-        )
+                 flush_rows=None,
+                 flush_interval=None):
+        self.conf = build_ilp_conf(host, port, username, password)
+        # Dùng chung Sender/buffer toàn process thay vì mở Sender mới mỗi lần ghi
+        options = {}
+        if flush_rows is not None:
+            options["flush_rows"] = flush_rows
+        if flush_interval is not None:
+            options["flush_interval"] = flush_interval / 1000.0  # ms -> s như auto_flush_interval cũ
+        spool = get_spool(host, port) if SPOOL_ENABLED else None  # batch lỗi -> spool, replay nền
+        self.ingest = get_ingest_service(self.conf, spool=spool, **options)
+
+    def flush(self, table: str = None) -> bool:
+        """Đẩy ngay dữ liệu đang chờ trong buffer (vd: trước khi check signal)."""
+        return self.ingest.flush(table)
 
     def insert_kpi(self, table: str, node: str, kpi_name: str, kpi_value: float, dt: datetime.datetime = None):
         try:
             if dt is None:
                 dt = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc)
 
-            with Sender.from_conf(self.conf) as sender:
-                sender.row(
-                    table,
-                    symbols={"Node": node, "kpi_name": kpi_name},
-                    columns={"kpi_value": kpi_value},
-                    at=dt
+            self.ingest.write_row(
+                table,
+                symbols={"Node": node, "kpi_name": kpi_name},
+                columns={"kpi_value": kpi_value},
+                at=dt
+            )
+            _log.debug(f"✅ Queued {kpi_name}={kpi_value} for {node} at {dt.isoformat()}")
+        except IngressError as e:
+            _log.error(f"❌ Ingress error: {e}")
+
+
+
+    def insert_records(self, table: str, records: list[KpiRecord], skip_written: bool = True) -> int:
+        """
+        Ghi thẳng KpiRecord từ collector (không qua file log).
+        skip_written: bỏ record đã ghi (theo watermark table/Node/kpi_name).
+        """
+        on_flushed = None
+        if skip_written and records:
+            WATERMARKS.seed(table)
+            records = WATERMARKS.filter(table, records)
+            # mốc chỉ tiến khi batch chứa các record này flush xong
+            on_flushed = lambda: WATERMARKS.advance(table, records)
+        if not records:
+            return 0
+        try:
+            n = self.ingest.write_rows(table, (
+                (
+                    {"Node": r.node, "kpi_name": r.kpi_name},
+                    {"ratio": r.ratio} if r.att is None else {"att": r.att, "ratio": r.ratio},
+                    r.ts,
                 )
-                sender.flush()
-                print(f"✅ Inserted {kpi_name}={kpi_value} for {node} at {dt.isoformat()}")
+                for r in records
+            ), on_flushed=on_flushed)
+            _log.debug(f"✅ Queued {n} records into {table}")
+            return n
         except IngressError as e:
-            print(f"❌ Ingress error: {e}")
+            _log.error(f"❌ Ingress error: {e}")
+            return 0
 
+    def insert_dataframe(self, table: str, df: pd.DataFrame,
+                         symbols=("Node", "kpi_name"), at: str = "timestamp", on_flushed=None) -> int:
+        """
+        Ghi DataFrame dạng cột (backfill / lô lớn).
+        - `at`: cột datetime64[ns] (UTC) làm designated timestamp.
+        - `symbols`: các cột SYMBOL (nên là dtype category).
+        - `on_flushed()`: gọi khi buffer chứa các dòng này flush thành công.
+        """
+        try:
+            n = self.ingest.write_dataframe(table, df, symbols=list(symbols), at=at, on_flushed=on_flushed)
+            _log.debug(f"✅ Queued {n} rows (columnar) into {table}")
+            return n
+        except IngressError as e:
+            _log.error(f"❌ Ingress error: {e}")
+            return 0
 
+    def insert_columns(self, table: str, node, kpi_name, ts_ns, ratio, att=None, on_flushed=None) -> int:
+        """
+        Ghi các mảng NumPy cùng độ dài:
+        node/kpi_name (str hoặc Categorical), ts_ns (int64 nanoseconds UTC), ratio/att (float).
+        """
+        return self.insert_dataframe(table, columns_to_frame(node, kpi_name, ts_ns, ratio, att),
+                                     on_flushed=on_flushed)
 
     def parse_datetime_from_day_time(self, day_str: str, time_str: str) -> datetime.datetime:
         try:
@@ -71,7 +141,7 @@ class QuestDBClient:
 
                         if day and time_str:
                             dt = self.parse_datetime_from_day_time(day, time_str)
-                            print(f"{node} | {dt.isoformat()} | {kpi_name} | {kpi_value}")
+                            _log.debug(f"{node} | {dt.isoformat()} | {kpi_name} | {kpi_value}")
                             records.append({
                                 "node": node,
                                 "kpi_name": kpi_name,
@@ -79,26 +149,25 @@ class QuestDBClient:
                                 "dt": dt
                             })
                     except Exception as e:
-                        print(f"❌ Lỗi dòng: {line} | {e}")
+                        _log.warning(f"❌ Lỗi dòng: {line} | {e}")
 
         if records:
             self.insert_bulk(table, records)
         else:
-            print("⚠️ Không có bản ghi hợp lệ trong file.")
+            _log.warning("⚠️ Không có bản ghi hợp lệ trong file.")
 
 
     def insert_log_to_db_PGW(self, file_path: str, table: str = "PGW_Short"):
         records = []
-        print('insert_log_to_db_PGW', file_path)
+        _log.info(f"insert_log_to_db_PGW {file_path}")
         with open(file_path, "r", encoding="utf-8") as f:
             for line in f:
                 line = line.strip()
                 if "insertDB;" in line:
-                    print(line)
+                    _log.debug(line)
                     parts = line.split(";")
                     # print(parts)
                     if len(parts) >= 6:
-                        print(parts)
                         node = parts[1]
                         time = parts[2]
                         # dt = datetime.datetime.strptime(f"{time}", "%Y-%m-%d %H:%M").replace(
@@ -107,33 +176,31 @@ class QuestDBClient:
                         time = time[:16].replace("T", " ")
                         dt = datetime.datetime.strptime(f"{time}", "%Y-%m-%d %H:%M").replace(
                             tzinfo=datetime.timezone.utc)
-                        print(dt)
                         kpi_name = parts[3]
                         att = float(parts[4])
                         ratio = float(parts[5])
                         records.append({"node": node, "kpi_name": kpi_name, "att": att, "ratio": ratio, "dt": dt})
-            print(records)
+            _log.debug(f"insert_log_to_db_PGW: {len(records)} records")
 
         if records:
             self.insert_bulk_pgw(table, records)
         else:
-            print("⚠️ Không có bản ghi hợp lệ trong file.")
+            _log.warning("⚠️ Không có bản ghi hợp lệ trong file.")
 
     def insert_bulk_pgw(self, table: str, records: list):
         try:
-            with Sender.from_conf(self.conf) as sender:
-                for rec in records:
-                    dt = rec.get("dt", datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc))
-                    sender.row(
-                        table,
-                        symbols={"Node": rec["node"], "kpi_name": rec["kpi_name"]},
-                        columns={"att": rec["att"],"ratio": rec["ratio"]},
-                        at=dt
-                    )
-                sender.flush()
-                print(f"✅ Bulk insert {len(records)} records into {table}")
+            now = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc)
+            n = self.ingest.write_rows(table, (
+                (
+                    {"Node": rec["node"], "kpi_name": rec["kpi_name"]},
+                    {"att": rec["att"], "ratio": rec["ratio"]},
+                    rec.get("dt", now),
+                )
+                for rec in records
+            ))
+            _log.debug(f"✅ Bulk insert {n} records into {table}")
         except IngressError as e:
-            print(f"❌ Ingress error: {e}")
+            _log.error(f"❌ Ingress error: {e}")
 
     def insert_from_log_db(self, file_path: str, node: str, table: str = "MME_Short"):
         records = []
@@ -158,23 +225,22 @@ class QuestDBClient:
         if records:
             self.insert_bulk(table, records)
         else:
-            print("⚠️ Không có bản ghi hợp lệ trong file.")
+            _log.warning("⚠️ Không có bản ghi hợp lệ trong file.")
 
     def insert_bulk(self, table: str, records: list):
         try:
-            with Sender.from_conf(self.conf) as sender:
-                for rec in records:
-                    dt = rec.get("dt", datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc))
-                    sender.row(
-                        table,
-                        symbols={"Node": rec["node"], "kpi_name": rec["kpi_name"]},
-                        columns={"ratio": rec["ratio"]},
-                        at=dt
-                    )
-                sender.flush()
-                print(f"✅ Bulk insert {len(records)} records into {table}")
+            now = datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc)
+            n = self.ingest.write_rows(table, (
+                (
+                    {"Node": rec["node"], "kpi_name": rec["kpi_name"]},
+                    {"ratio": rec["ratio"]},
+                    rec.get("dt", now),
+                )
+                for rec in records
+            ))
+            _log.debug(f"✅ Bulk insert {n} records into {table}")
         except IngressError as e:
-            print(f"❌ Ingress error: {e}")
+            _log.error(f"❌ Ingress error: {e}")
 
     def insert_from_log_PGW_db(self, file_path: str, node: str, table: str = "PGW"):
         records = []
@@ -202,4 +268,34 @@ class QuestDBClient:
         if records:
             self.insert_bulk(table, records)
         else:
-            print("⚠️ Không có bản ghi hợp lệ trong file.")
\ No newline at end of file
+            _log.warning("⚠️ Không có bản ghi hợp lệ trong file.")
+
+
+def _symbol_column(values) -> pd.Categorical:
+    """Mảng chuỗi -> Categorical với categories dtype object (yêu cầu của client QuestDB)."""
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    return pd.Categorical.from_codes(codes, categories=pd.Index(uniques, dtype=object))
+
+
+def columns_to_frame(node, kpi_name, ts_ns, ratio, att=None) -> pd.DataFrame:
+    """Dựng DataFrame đúng kiểu cho ingestion dạng cột (symbol = category, ts = datetime64[ns, UTC])."""
+    data = {
+        "Node": _symbol_column(node),
+        "kpi_name": _symbol_column(kpi_name),
+    }
+    if att is not None:
+        data["att"] = np.asarray(att, dtype=np.float64)
+    data["ratio"] = np.asarray(ratio, dtype=np.float64)
+    data["timestamp"] = pd.to_datetime(np.asarray(ts_ns, dtype=np.int64), unit="ns", utc=True)
+    return pd.DataFrame(data)
+
+
+def records_to_frame(records: list[KpiRecord]) -> pd.DataFrame:
+    """list[KpiRecord] -> DataFrame dạng cột."""
+    if not records:
+        return columns_to_frame([], [], [], [])
+    node, kpi_name, ts, ratio, att = zip(*records)
+    ts_ns = pd.DatetimeIndex(ts).as_unit("ns").asi8
+    has_att = any(a is not None for a in att)
+    att_arr = [np.nan if a is None else a for a in att] if has_att else None
+    return columns_to_frame(node, kpi_name, ts_ns, ratio, att_arr)
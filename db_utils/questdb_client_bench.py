@@ -0,0 +1,68 @@
+# db_utils/questdb_client_bench.py
+# Benchmark thủ công: ghi theo từng dòng (dict + datetime) vs ghi dạng cột (DataFrame).
+# Chỉ đo phần serialize vào buffer ILP (không cần QuestDB chạy):
+#   python -m db_utils.questdb_client_bench [rows]
+
+import datetime
+import sys
+import time
+
+import numpy as np
+from questdb.ingress import Sender
+
+from db_utils.questdb_client import columns_to_frame
+from db_utils.questdb_ingest import build_ilp_conf
+
+
+def make_data(rows: int, nodes: int = 500, kpis: int = 15):
+    rng = np.random.default_rng(0)
+    node = np.array([f"node{i:03d}" for i in range(nodes)])[rng.integers(0, nodes, rows)]
+    kpi = np.array([f"kpi_{i}" for i in range(kpis)])[rng.integers(0, kpis, rows)]
+    start = np.datetime64("2025-01-01T00:00:00", "ns").astype(np.int64)
+    ts_ns = start + np.arange(rows, dtype=np.int64) * 300_000_000_000 // max(1, nodes * kpis)
+    ratio = rng.uniform(90, 100, rows)
+    return node, kpi, ts_ns, ratio
+
+
+def bench_per_row(buf, node, kpi, ts_ns, ratio):
+    # Đúng như insert_bulk cũ: list[dict] có datetime từng dòng
+    records = [
+        {
+            "node": n, "kpi_name": k, "ratio": float(r),
+            "dt": datetime.datetime.fromtimestamp(t / 1e9, tz=datetime.timezone.utc),
+        }
+        for n, k, t, r in zip(node.tolist(), kpi.tolist(), ts_ns.tolist(), ratio.tolist())
+    ]
+    started = time.perf_counter()
+    for rec in records:
+        buf.row("MME", symbols={"Node": rec["node"], "kpi_name": rec["kpi_name"]},
+                columns={"ratio": rec["ratio"]}, at=rec["dt"])
+    return time.perf_counter() - started
+
+
+def bench_columnar(buf, node, kpi, ts_ns, ratio):
+    started = time.perf_counter()
+    df = columns_to_frame(node, kpi, ts_ns, ratio)
+    buf.dataframe(df, table_name="MME", symbols=["Node", "kpi_name"], at="timestamp")
+    return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    sender = Sender.from_conf(build_ilp_conf())
+    sender.establish()
+    data = make_data(rows)
+
+    buf = sender.new_buffer()
+    t_row = bench_per_row(buf, *data)
+    size_row = len(buf)
+
+    buf = sender.new_buffer()
+    t_col = bench_columnar(buf, *data)
+    size_col = len(buf)
+
+    print(f"rows={rows:,}")
+    print(f"per-row  : {t_row:8.3f}s  {rows / t_row:12,.0f} rows/s  buffer={size_row:,} B")
+    print(f"columnar : {t_col:8.3f}s  {rows / t_col:12,.0f} rows/s  buffer={size_col:,} B")
+    print(f"speedup  : x{t_row / t_col:.1f}")
+    sender.close(flush=False)
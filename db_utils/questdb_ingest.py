@@ -0,0 +1,322 @@
+# db_utils/questdb_ingest.py
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, Optional, Tuple
+
+from questdb.ingress import Sender, IngressError
+
+from db_utils.ingest_spool import shutdown_spools
+from jobs.log_service import get_logger
+from config import (
+    QUESTDB_HOST, QUESTDB_HTTP_PORT, QUESTDB_USER, QUESTDB_PASSWORD,
+    INGEST_POOL_SIZE, INGEST_FLUSH_ROWS, INGEST_FLUSH_BYTES, INGEST_FLUSH_INTERVAL,
+)
+
+# flush chạy trong thread thu thập / thread flush -> log qua hàng đợi, không print
+_log = get_logger("QuestDBIngest", "questdb_ingest.log")
+
+
+def build_ilp_conf(host: str = QUESTDB_HOST,
+                   port: int = QUESTDB_HTTP_PORT,
+                   username: str = QUESTDB_USER,
+                   password: str = QUESTDB_PASSWORD) -> str:
+    """Conf ILP/HTTP: tắt auto flush, service tự quyết định khi nào flush."""
+    return (
+        f"http::addr={host}:{port};"
+        f"username={username};password={password};"
+        f"protocol_version=1;"
+        f"auto_flush=off;"
+    )
+
+
+# fn(table) gọi sau mỗi lần flush thành công (vd xoá cache dashboard của bảng đó)
+_flush_listeners = []
+
+
+def add_flush_listener(fn) -> None:
+    if fn not in _flush_listeners:
+        _flush_listeners.append(fn)
+
+
+def _notify_flushed(table: str) -> None:
+    for fn in list(_flush_listeners):
+        try:
+            fn(table)
+        except Exception as e:
+            _log.warning(f"⚠ Flush listener lỗi ({table}): {e}")
+
+
+class _TableBuffer:
+    """Buffer ILP riêng cho 1 bảng (giữ thứ tự ghi theo bảng)."""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.rows = 0
+        self.first_row_at: Optional[float] = None
+        self.on_flushed = []                # callback của các dòng trong buffer, gọi khi flush OK
+        self.lock = threading.Lock()        # bảo vệ buffer khi các thread cùng append
+        self.flush_lock = threading.Lock()  # tuần tự hoá các lần flush của cùng 1 bảng
+
+
+class IngestService:
+    """
+    Dịch vụ ghi QuestDB dùng chung toàn process:
+    - Giữ sẵn `pool_size` Sender HTTP (không mở session mới mỗi lần ghi).
+    - Các thread thu thập chỉ append vào buffer theo bảng; flush khi đủ
+      số dòng / số byte, hoặc sau `flush_interval` giây (thread nền).
+    - Thống kê rows/sec và độ trễ flush qua `stats()`.
+    """
+
+    def __init__(
+        self,
+        conf: Optional[str] = None,
+        *,
+        pool_size: int = INGEST_POOL_SIZE,
+        flush_rows: int = INGEST_FLUSH_ROWS,
+        flush_bytes: int = INGEST_FLUSH_BYTES,
+        flush_interval: float = INGEST_FLUSH_INTERVAL,
+        spool=None,
+    ) -> None:
+        self.conf = conf or build_ilp_conf()
+        self.spool = spool  # IngestSpool: nhận batch khi flush lỗi
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_bytes = max(1, int(flush_bytes))
+        self.flush_interval = max(0.05, float(flush_interval))
+
+        self._all_senders = []
+        self._senders: "queue.Queue[Sender]" = queue.Queue()
+        for _ in range(max(1, int(pool_size))):
+            sender = Sender.from_conf(self.conf)
+            sender.establish()
+            self._all_senders.append(sender)
+            self._senders.put(sender)
+
+        self._tables: Dict[str, _TableBuffer] = {}
+        self._tables_lock = threading.Lock()
+
+        # Thống kê
+        self._stats_lock = threading.Lock()
+        self._rows_total = 0
+        self._bytes_total = 0
+        self._flush_count = 0
+        self._flush_errors = 0
+        self._flush_ms_last = 0.0
+        self._flush_ms_max = 0.0
+        self._flush_ms_sum = 0.0
+        self._recent = deque()  # (monotonic, rows) trong 60s gần nhất
+
+        self._closed = False
+        self._stop = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_loop, name="questdb-ingest", daemon=True)
+        self._flusher.start()
+
+    # ----------------- Ghi dữ liệu -----------------
+    def _table(self, table: str) -> _TableBuffer:
+        tb = self._tables.get(table)
+        if tb is None:
+            with self._tables_lock:
+                tb = self._tables.get(table)
+                if tb is None:
+                    tb = _TableBuffer(self._all_senders[0].new_buffer())
+                    self._tables[table] = tb
+        return tb
+
+    def write_rows(self, table: str, rows: Iterable[Tuple[dict, dict, object]], on_flushed=None) -> int:
+        """
+        Append nhiều dòng (symbols, columns, at) vào buffer của `table`.
+        Trả về số dòng đã nhận; flush ngay nếu buffer vượt ngưỡng.
+        on_flushed(): gọi khi buffer chứa các dòng này flush thành công (hoặc đã vào spool).
+        """
+        if self._closed:
+            raise RuntimeError("IngestService đã đóng")
+        tb = self._table(table)
+        n = 0
+        with tb.lock:
+            for symbols, columns, at in rows:
+                tb.buffer.row(table, symbols=symbols, columns=columns, at=at)
+                n += 1
+            if n and tb.first_row_at is None:
+                tb.first_row_at = time.monotonic()
+            if n and on_flushed is not None:
+                tb.on_flushed.append(on_flushed)
+            tb.rows += n
+            full = tb.rows >= self.flush_rows or len(tb.buffer) >= self.flush_bytes
+        if full:
+            self._flush_table(table, tb)
+        return n
+
+    def write_row(self, table: str, symbols: dict, columns: dict, at) -> None:
+        self.write_rows(table, [(symbols, columns, at)])
+
+    def write_dataframe(self, table: str, df, symbols="auto", at="timestamp", on_flushed=None) -> int:
+        """
+        Append cả DataFrame vào buffer của `table` (serialize dạng cột trong
+        client QuestDB, không lặp từng dòng bằng Python). on_flushed như write_rows.
+        """
+        if self._closed:
+            raise RuntimeError("IngestService đã đóng")
+        n = len(df)
+        if not n:
+            return 0
+        tb = self._table(table)
+        with tb.lock:
+            tb.buffer.dataframe(df, table_name=table, symbols=symbols, at=at)
+            if tb.first_row_at is None:
+                tb.first_row_at = time.monotonic()
+            if on_flushed is not None:
+                tb.on_flushed.append(on_flushed)
+            tb.rows += n
+            full = tb.rows >= self.flush_rows or len(tb.buffer) >= self.flush_bytes
+        if full:
+            self._flush_table(table, tb)
+        return n
+
+    # ----------------- Flush -----------------
+    def _flush_table(self, table: str, tb: _TableBuffer) -> bool:
+        with tb.flush_lock:
+            with tb.lock:
+                if not tb.rows:
+                    return True
+                buf, rows, callbacks = tb.buffer, tb.rows, tb.on_flushed
+                tb.buffer = self._all_senders[0].new_buffer()
+                tb.rows = 0
+                tb.first_row_at = None
+                tb.on_flushed = []
+
+            nbytes = len(buf)
+            sender = self._senders.get()
+            started = time.perf_counter()
+            try:
+                sender.flush(buf, clear=False)
+                ok = True
+                _notify_flushed(table)
+            except IngressError as e:
+                ok = False
+                spooled = self.spool is not None and self.spool.append(table, bytes(buf))
+                _log.error(f"❌ Ingress error ({table}, {rows} rows{', spooled' if spooled else ''}): {e}")
+                if not spooled:
+                    callbacks = []  # dữ liệu mất -> không xác nhận cho bên ghi
+            finally:
+                self._senders.put(sender)
+            for fn in callbacks:
+                try:
+                    fn()
+                except Exception as e:
+                    _log.warning(f"⚠ on_flushed lỗi ({table}): {e}")
+            self._record_flush(rows, nbytes, (time.perf_counter() - started) * 1000.0, ok)
+            return ok
+
+    def flush(self, table: Optional[str] = None) -> bool:
+        """Flush ngay (1 bảng hoặc tất cả). Trả về False nếu có lần flush lỗi."""
+        with self._tables_lock:
+            items = list(self._tables.items())
+        ok = True
+        for name, tb in items:
+            if table is None or name == table:
+                ok = self._flush_table(name, tb) and ok
+        return ok
+
+    def _flush_loop(self) -> None:
+        tick = min(self.flush_interval, 1.0)
+        while not self._stop.wait(tick):
+            now = time.monotonic()
+            with self._tables_lock:
+                items = list(self._tables.items())
+            for name, tb in items:
+                started = tb.first_row_at
+                if started is not None and now - started >= self.flush_interval:
+                    try:
+                        self._flush_table(name, tb)
+                    except Exception as e:
+                        _log.error(f"❌ Flush thread error ({name}): {e}")
+
+    # ----------------- Thống kê -----------------
+    def _record_flush(self, rows: int, nbytes: int, elapsed_ms: float, ok: bool) -> None:
+        now = time.monotonic()
+        with self._stats_lock:
+            self._flush_count += 1
+            self._flush_ms_last = elapsed_ms
+            self._flush_ms_max = max(self._flush_ms_max, elapsed_ms)
+            self._flush_ms_sum += elapsed_ms
+            if ok:
+                self._rows_total += rows
+                self._bytes_total += nbytes
+                self._recent.append((now, rows))
+            else:
+                self._flush_errors += 1
+            while self._recent and now - self._recent[0][0] > 60.0:
+                self._recent.popleft()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._stats_lock:
+            while self._recent and now - self._recent[0][0] > 60.0:
+                self._recent.popleft()
+            recent_rows = sum(r for _, r in self._recent)
+            flushes = self._flush_count
+            return {
+                "rows_total": self._rows_total,
+                "bytes_total": self._bytes_total,
+                "rows_per_sec_60s": round(recent_rows / 60.0, 2),
+                "flush_count": flushes,
+                "flush_errors": self._flush_errors,
+                "flush_ms_last": round(self._flush_ms_last, 2),
+                "flush_ms_avg": round(self._flush_ms_sum / flushes, 2) if flushes else 0.0,
+                "flush_ms_max": round(self._flush_ms_max, 2),
+                "pending_rows": sum(tb.rows for tb in list(self._tables.values())),
+                "pool_size": len(self._all_senders),
+            }
+
+    # ----------------- Đóng -----------------
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._stop.set()
+        self._flusher.join(timeout=5)
+        try:
+            self.flush()
+        finally:
+            self._closed = True
+            for sender in self._all_senders:
+                try:
+                    sender.close(flush=False)
+                except Exception:
+                    pass
+
+
+# ----------------- Singleton theo process -----------------
+_services: Dict[tuple, IngestService] = {}
+_services_lock = threading.Lock()
+
+
+def get_ingest_service(conf: Optional[str] = None, spool=None, **kwargs) -> IngestService:
+    """Trả về IngestService dùng chung cho cùng đích (conf + tham số flush)."""
+    key = (conf or build_ilp_conf(), tuple(sorted(kwargs.items())))
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            service = IngestService(key[0], spool=spool, **kwargs)
+            _services[key] = service
+        return service
+
+
+def all_ingest_stats() -> list:
+    with _services_lock:
+        services = list(_services.values())
+    return [s.stats() for s in services]
+
+
+def shutdown_ingest_service() -> None:
+    """Flush nốt dữ liệu và đóng toàn bộ Sender (gọi khi FastAPI shutdown)."""
+    with _services_lock:
+        services = list(_services.values())
+        _services.clear()
+    for service in services:
+        try:
+            service.close()
+        except Exception as e:
+            print(f"❌ Lỗi khi đóng IngestService: {e}")
+    shutdown_spools()
@@ -0,0 +1,111 @@
+# db_utils/tail_cursor.py
+
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple, Optional
+
+from config import TAIL_CURSOR_DB
+
+
+class TailCursor(NamedTuple):
+    """Vị trí đã đọc tới của 1 file remote (theo node)."""
+    size: int        # kích thước file lúc đọc
+    mtime: int       # st_mtime lúc đọc
+    head_len: int    # số byte đầu file dùng làm fingerprint
+    head_crc: int    # crc32 của head_len byte đầu (SFTP không có inode)
+    offset: int      # đã đọc tới byte này
+    state: bytes     # dữ liệu cần giữ giữa các chu kỳ (vd: block cuối, các dòng cuối)
+
+
+class TailCursorStore:
+    """
+    Lưu cursor trong SQLite riêng (TAIL_CURSOR_DB), khoá (node, path).
+    Mỗi lần get/put mở 1 connection ngắn như các helper SQLite khác.
+    """
+
+    def __init__(self, db_file: str = TAIL_CURSOR_DB):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self.hits = 0         # file không đổi -> không đọc
+        self.appends = 0      # chỉ đọc phần ghi thêm
+        self.resets = 0       # không có cursor / rotate / truncate -> quét lại
+        self.bytes_read = 0
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sftp_tail_cursor (
+                    node TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime INTEGER NOT NULL,
+                    head_len INTEGER NOT NULL,
+                    head_crc INTEGER NOT NULL,
+                    offset INTEGER NOT NULL,
+                    state BLOB,
+                    updated_at REAL,
+                    PRIMARY KEY (node, path)
+                )
+            ''')
+
+    def _connect(self):
+        return sqlite3.connect(self.db_file, timeout=10)
+
+    def get(self, node: str, path: str) -> Optional[TailCursor]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT size, mtime, head_len, head_crc, offset, state "
+                "FROM sftp_tail_cursor WHERE node=? AND path=?",
+                (node, path),
+            ).fetchone()
+        return TailCursor(*row[:5], bytes(row[5] or b"")) if row else None
+
+    def put(self, node: str, path: str, cursor: TailCursor) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sftp_tail_cursor "
+                "(node, path, size, mtime, head_len, head_crc, offset, state, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (node, path, *cursor[:5], sqlite3.Binary(cursor.state), time.time()),
+            )
+
+    def delete(self, node: str, path: str = None) -> None:
+        with self._connect() as conn:
+            if path is None:
+                conn.execute("DELETE FROM sftp_tail_cursor WHERE node=?", (node,))
+            else:
+                conn.execute("DELETE FROM sftp_tail_cursor WHERE node=? AND path=?", (node, path))
+
+    def count(self, kind: str, nbytes: int = 0) -> None:
+        with self._lock:
+            setattr(self, kind, getattr(self, kind) + 1)
+            self.bytes_read += nbytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "appends": self.appends,
+                "resets": self.resets,
+                "bytes_read": self.bytes_read,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_tail_cursor_store() -> TailCursorStore:
+    """Store dùng chung toàn process (tạo file SQLite khi dùng lần đầu)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TailCursorStore()
+        return _store
+
+
+def tail_cursor_stats() -> dict:
+    with _store_lock:
+        return _store.stats() if _store is not None else {}
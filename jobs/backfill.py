@@ -0,0 +1,325 @@
+# jobs/backfill.py
+"""
+Nạp lại dữ liệu lịch sử vào QuestDB từ file lưu trữ.
+
+    python -m jobs.backfill <thư mục> [--type MME|PGW|SBG] [--node NAME] [--workers N]
+
+Tự nhận dạng định dạng từng file:
+  - insertdb : log_<node>.txt cũ (dòng insertDB;node;time;kpi;value)
+  - pgw_csv  : bản sao pm_job_epg-kpi.csv (phân cách '|', header ở dòng 2)
+  - sbg_log  : file sbgKPIsLog (nhiều block bắt đầu bằng header Timestamp,PmpId,...)
+Parse song song bằng process pool (tối đa 2 x workers file cùng lúc), ghi dạng cột
+(insert_columns). File đã flush thành công được ghi vào manifest
+(.backfill_manifest.json) để chạy lại thì bỏ qua.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from db_utils.kpi_record import parse_insertdb_lines, parse_ts
+from jobs.module_PGWE import PGW_KPI_DEFS
+from jobs.pgw_kpi_engine import compute_intervals
+from jobs.module_SBG import SBG_HEADER_LINE, analyze_sbg_lines
+
+TYPES = ("MME", "PGW", "SBG")
+MANIFEST_NAME = ".backfill_manifest.json"
+_LOG_NAME = re.compile(r"^log_(?P<node>.+)\.txt$")
+
+
+# ----------------- Nhận dạng -----------------
+def detect_format(path: str) -> Optional[str]:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        head = f.read(65536)
+    if "insertDB;" in head:
+        return "insertdb"
+    if SBG_HEADER_LINE[:16] in head:
+        return "sbg_log"
+    lines = head.splitlines()[:3]
+    if len(lines) >= 2 and lines[1].count("|") >= 3:
+        return "pgw_csv"
+    return None
+
+
+def guess_node(path: str, fmt: str) -> Optional[str]:
+    m = _LOG_NAME.match(os.path.basename(path))
+    if m:
+        return m.group("node")
+    if fmt != "insertdb":
+        # export thô thường để theo thư mục node: <root>/<node>/<file>
+        return os.path.basename(os.path.dirname(os.path.abspath(path))) or None
+    return None
+
+
+def guess_type(path: str, fmt: str) -> Optional[str]:
+    if fmt == "pgw_csv":
+        return "PGW"
+    if fmt == "sbg_log":
+        return "SBG"
+    # logs/<TYPE>/log_<node>.txt
+    for part in reversed(os.path.abspath(path).split(os.sep)[:-1]):
+        if part.upper() in TYPES:
+            return part.upper()
+    return None
+
+
+# ----------------- Parser (chạy trong process con) -----------------
+def _empty_columns():
+    return {"node": [], "kpi_name": [], "ts_ns": np.empty(0, dtype=np.int64), "ratio": [], "att": None}
+
+
+def _records_to_columns(records) -> dict:
+    if not records:
+        return _empty_columns()
+    node, kpi_name, ts, ratio, _ = zip(*records)
+    return {
+        "node": np.asarray(node, dtype=object),
+        "kpi_name": np.asarray(kpi_name, dtype=object),
+        "ts_ns": pd.DatetimeIndex(ts).as_unit("ns").asi8,
+        "ratio": np.asarray(ratio, dtype=np.float64),
+        "att": None,
+    }
+
+
+def parse_insertdb_file(path: str, node: Optional[str]) -> dict:
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        records = parse_insertdb_lines(f)
+    if node:
+        records = [r._replace(node=node) for r in records]
+    return _records_to_columns(records)
+
+
+def parse_pgw_csv_file(path: str, node: str) -> dict:
+    """Giá trị từng khoảng (không lấy trung bình) cho mọi cặp dòng liên tiếp."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        f.readline()  # line1
+        header = f.readline().rstrip("\r\n")
+        lines = [ln.rstrip("\r\n") for ln in f if ln.strip()]
+
+    iv = compute_intervals(header, lines, PGW_KPI_DEFS)
+    if not iv.times:
+        return _empty_columns()
+    times = pd.to_datetime(iv.times, utc=True, format="ISO8601").as_unit("ns").asi8
+    # (khoảng x KPI) -> cột phẳng, bỏ ô hỏng
+    rows, kpis = np.nonzero(iv.valid)
+    return {
+        "node": np.full(len(rows), node, dtype=object),
+        "kpi_name": np.asarray(iv.kpi_names, dtype=object)[kpis],
+        "ts_ns": times[rows],
+        "ratio": np.round(iv.ratio[rows, kpis], 2),
+        "att": iv.att[rows, kpis].astype(np.float64),
+    }
+
+
+def parse_sbg_log_file(path: str, node: str) -> dict:
+    """Mỗi block (từ header tới header kế tiếp) -> 1 mốc KPI, thời gian lấy từ cột Timestamp."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    records = []
+    for block in text.split(SBG_HEADER_LINE)[1:]:
+        lines = [ln.strip() for ln in block.split("\n") if "IPv" in ln and "access" in ln]
+        if not lines:
+            continue
+        try:
+            ts = parse_ts(lines[0].split(",", 1)[0]).replace(second=0, microsecond=0)
+        except ValueError:
+            continue
+        records.extend(analyze_sbg_lines(node, lines, ts))
+    return _records_to_columns(records)
+
+
+PARSERS = {
+    "insertdb": parse_insertdb_file,
+    "pgw_csv": parse_pgw_csv_file,
+    "sbg_log": parse_sbg_log_file,
+}
+
+
+def parse_file(path: str, fmt: str, node: Optional[str]) -> dict:
+    return PARSERS[fmt](path, node)
+
+
+# ----------------- Manifest -----------------
+def load_manifest(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(path: str, manifest: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+# ----------------- Chạy -----------------
+def discover(root: str, type_filter: Optional[str], node: Optional[str], manifest: dict):
+    jobs = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if name.startswith(MANIFEST_NAME):
+                continue
+            path = os.path.join(dirpath, name)
+            rel = os.path.relpath(path, root)
+            st = os.stat(path)
+            done = manifest.get(rel)
+            if done and done.get("size") == st.st_size and done.get("mtime") == int(st.st_mtime):
+                continue
+            fmt = detect_format(path)
+            if fmt is None:
+                continue
+            table = type_filter or guess_type(path, fmt)
+            file_node = node or guess_node(path, fmt)
+            if table is None or (fmt != "insertdb" and not file_node):
+                print(f"⚠ Bỏ qua {rel}: không xác định được type/node")
+                continue
+            jobs.append((rel, path, fmt, table, file_node, st.st_size, int(st.st_mtime)))
+    return jobs
+
+
+def _iter_parsed(pool, jobs, limit: int):
+    """
+    Như as_completed nhưng chỉ submit tối đa `limit` file cùng lúc: kết quả parse
+    (mảng cột) chờ ghi trong bộ nhớ không vượt quá `limit` file.
+    """
+    in_flight = {}
+    it = iter(jobs)
+    while True:
+        for rel, path, fmt, table, file_node, size, mtime in itertools.islice(it, limit - len(in_flight)):
+            in_flight[pool.submit(parse_file, path, fmt, file_node)] = (rel, table, size, mtime)
+        if not in_flight:
+            return
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for fut in done:
+            yield fut, in_flight.pop(fut)
+
+
+def run_backfill(root: str, type_filter: Optional[str] = None, node: Optional[str] = None,
+                 workers: Optional[int] = None, manifest_path: Optional[str] = None,
+                 checkpoint: int = 20, dry_run: bool = False) -> dict:
+    manifest_path = manifest_path or os.path.join(root, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    jobs = discover(root, type_filter, node, manifest)
+    total_bytes = sum(j[5] for j in jobs)
+    print(f"🔎 {len(jobs)} file cần nạp ({total_bytes / 1e6:.1f} MB)")
+
+    client = None
+    if not dry_run:
+        from db_utils.questdb_client import QuestDBClient
+        client = QuestDBClient()
+
+    # file vào manifest khi mọi bảng đích của nó đã flush thành công (callback từ IngestService);
+    # flush lỗi mà không vào được spool -> không xác nhận, lần chạy sau nạp lại
+    flushed = queue.SimpleQueue()
+    waiting = set()
+
+    def on_all_flushed(n: int, rel: str, entry: dict):
+        left, lock = [n], threading.Lock()
+
+        def callback():
+            with lock:
+                left[0] -= 1
+                last = left[0] == 0
+            if last:
+                flushed.put((rel, entry))
+        return callback
+
+    def checkpoint_manifest() -> None:
+        if client is not None:
+            client.flush()
+        while not flushed.empty():
+            rel, entry = flushed.get()
+            waiting.discard(rel)
+            manifest[rel] = entry
+        if not dry_run:
+            save_manifest(manifest_path, manifest)
+
+    workers = workers or os.cpu_count()
+    started = time.perf_counter()
+    rows_total = bytes_done = 0
+    since_checkpoint = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for i, (fut, (rel, table, size, mtime)) in enumerate(_iter_parsed(pool, jobs, 2 * workers), 1):
+            try:
+                cols = fut.result()
+            except Exception as e:
+                print(f"❌ [{i}/{len(jobs)}] {rel}: {e}")
+                continue
+
+            rows = len(cols["ts_ns"])
+            entry = {"size": size, "mtime": mtime, "rows": rows, "table": table}
+            if client is not None and rows:
+                tables = [table, f"{table}_Long"] if table == "SBG" else [table]
+                waiting.add(rel)
+                callback = on_all_flushed(len(tables), rel, entry)
+                for t in tables:
+                    client.insert_columns(t, cols["node"], cols["kpi_name"], cols["ts_ns"], cols["ratio"], cols["att"],
+                                          on_flushed=callback)
+            else:
+                flushed.put((rel, entry))
+            del cols
+
+            rows_total += rows
+            bytes_done += size
+            since_checkpoint += 1
+            elapsed = time.perf_counter() - started
+            print(f"[{i}/{len(jobs)}] {rel}: {rows} rows | {rows_total / max(elapsed, 1e-9):,.0f} rows/s")
+
+            if since_checkpoint >= checkpoint:
+                checkpoint_manifest()
+                since_checkpoint = 0
+
+    checkpoint_manifest()
+    if waiting:
+        print(f"⚠ {len(waiting)} file chưa ghi được vào QuestDB, không lưu manifest -> chạy lại để nạp lại")
+
+    elapsed = time.perf_counter() - started
+    report = {
+        "files": len(jobs),
+        "rows": rows_total,
+        "seconds": round(elapsed, 2),
+        "rows_per_sec": round(rows_total / elapsed, 1) if elapsed else 0.0,
+        "mb_per_sec": round(bytes_done / 1e6 / elapsed, 2) if elapsed else 0.0,
+    }
+    print(f"✅ Backfill xong: {report}")
+    return report
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Backfill KPI lịch sử vào QuestDB")
+    parser.add_argument("root", help="Thư mục chứa file log/export")
+    parser.add_argument("--type", choices=TYPES, help="Ép bảng đích (mặc định tự đoán)")
+    parser.add_argument("--node", help="Ép tên node (mặc định lấy từ tên file / thư mục)")
+    parser.add_argument("--workers", type=int, help="Số process parse (mặc định = số CPU)")
+    parser.add_argument("--manifest", help=f"Đường dẫn manifest (mặc định <root>/{MANIFEST_NAME})")
+    parser.add_argument("--checkpoint", type=int, default=20, help="Flush + lưu manifest sau N file")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ parse, không ghi QuestDB")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        print(f"❌ Không tìm thấy thư mục {args.root}")
+        return 1
+    try:
+        run_backfill(args.root, args.type, args.node, args.workers, args.manifest, args.checkpoint, args.dry_run)
+    finally:
+        from db_utils.questdb_ingest import shutdown_ingest_service
+        shutdown_ingest_service()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+# jobs/collection_scheduler.py
+
+import asyncio
+import sqlite3
+import threading
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Type
+
+from config import (
+    DB_FILE, COLLECTOR_MAX_CONCURRENCY, COLLECTOR_TYPE_OFFSET, COLLECTOR_JITTER_SECONDS,
+    COLLECTOR_TYPE_LIMITS, COLLECTOR_HOST_LIMIT,
+)
+from jobs.collector_engine import get_engine
+from jobs.log_service import get_logger
+from jobs.node_health import CircuitOpen
+
+# type node -> class driver (WorkerMME, WorkerPGW, WorkerSBG, ...)
+_DRIVERS: Dict[str, Type] = {}
+_drivers_lock = threading.Lock()
+
+
+def register_driver(node_type: str, driver_cls: Type) -> None:
+    """
+    Đăng ký driver cho 1 type node. Driver được tạo mỗi chu kỳ bằng
+    driver_cls(db_file, type_filter=node_type) và cần có:
+      - prepare() -> ctx           (blocking, 1 lần / chu kỳ, vd KPI list)
+      - run_task(row, ctx)         (blocking, 1 node; lỗi thì raise)
+      - finish(ctx)                (blocking, sau khi mọi node của type xong, vd flush)
+    row là dòng config_node_schedule: (node, ip, user, password, path, type).
+    """
+    with _drivers_lock:
+        _DRIVERS[node_type.upper()] = driver_cls
+
+
+def registered_types():
+    with _drivers_lock:
+        return sorted(_DRIVERS)
+
+
+def start_delay(node_type: str, node: str, jitter: float, offsets: dict) -> float:
+    """Giây sau mốc chu kỳ: offset của type + jitter cố định theo crc32(type/node)."""
+    base = offsets.get(node_type, 0)
+    if jitter <= 0:
+        return base
+    return base + (zlib.crc32(f"{node_type}/{node}".encode()) % int(jitter * 1000)) / 1000
+
+
+class CollectionScheduler:
+    """
+    1 chu kỳ thu thập cho mọi type đã đăng ký driver:
+    - Đọc config_node_schedule 1 lần (mọi type).
+    - Node bắt đầu rải đều trong [offset type, offset + jitter) theo crc32 -> cùng node
+      luôn chạy ở cùng vị trí trong chu kỳ, tải CPU/mạng phẳng thay vì dồn vào đầu phút.
+    - Ngân sách đồng thời chung (budget) + giới hạn theo type + theo IP.
+    - Node đi qua NODE_HEALTH của engine (circuit breaker, timeout thích nghi).
+    """
+
+    def __init__(self, db_file: str = DB_FILE, budget: int = COLLECTOR_MAX_CONCURRENCY,
+                 type_limits: dict = None, host_limit: int = COLLECTOR_HOST_LIMIT,
+                 jitter: float = COLLECTOR_JITTER_SECONDS, offsets: dict = None):
+        self.db_file = db_file
+        self.budget = max(1, budget)
+        self.type_limits = dict(COLLECTOR_TYPE_LIMITS if type_limits is None else type_limits)
+        self.host_limit = max(1, host_limit)
+        self.jitter = jitter
+        self.offsets = dict(COLLECTOR_TYPE_OFFSET if offsets is None else offsets)
+        self.last_cycle = {}
+        self.logger = self._init_logger()
+
+    def _init_logger(self):
+        return get_logger("CollectionScheduler", "collector_schedule.log")
+
+    def _load_rows(self) -> Dict[str, list]:
+        with sqlite3.connect(self.db_file) as conn:
+            rows = conn.execute('''
+                SELECT node, ip, user, password, path, type
+                FROM config_node_schedule
+                WHERE status = 1
+                ORDER BY type, node
+            ''').fetchall()
+        by_type = defaultdict(list)
+        for row in rows:
+            by_type[str(row[5]).upper()].append(row)
+        return by_type
+
+    async def run_cycle(self) -> dict:
+        """Chạy 1 chu kỳ; trả về thống kê (cũng lưu ở self.last_cycle)."""
+        engine = get_engine()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        started_at = datetime.now()
+
+        rows_by_type = await engine.run_blocking(self._load_rows)
+        with _drivers_lock:
+            drivers = dict(_DRIVERS)
+        unknown = sorted(set(rows_by_type) - set(drivers))
+        if unknown:
+            self.logger.warning(f"⚠ Không có driver cho type: {', '.join(unknown)} (bỏ qua)")
+
+        budget = asyncio.Semaphore(self.budget)
+        hosts = defaultdict(lambda: asyncio.Semaphore(self.host_limit))
+
+        async def run_node(node_type, driver, ctx, type_sem, row):
+            delay = started + start_delay(node_type, row[0], self.jitter, self.offsets) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # thứ tự lấy cố định type -> host -> budget: không giữ budget khi còn chờ host
+            async with type_sem, hosts[row[1]], budget:
+                return await engine.run_guarded(node_type, row, lambda r: driver.run_task(r, ctx))
+
+        async def run_type(node_type, driver_cls, rows):
+            summary = {"nodes": len(rows), "ok": 0, "failed": 0, "skipped": 0}
+            try:
+                # tạo driver mở QuestDBClient/Sender, spool... -> blocking, không chạy trên event loop
+                driver = await engine.run_blocking(driver_cls, self.db_file, type_filter=node_type)
+                ctx = await engine.run_blocking(driver.prepare)
+            except Exception as e:
+                self.logger.error(f"[{node_type}] ❌ prepare lỗi: {e}")
+                summary["failed"] = len(rows)
+                return node_type, summary
+
+            type_sem = asyncio.Semaphore(max(1, self.type_limits.get(node_type, self.budget)))
+            results = await asyncio.gather(
+                *(run_node(node_type, driver, ctx, type_sem, row) for row in rows),
+                return_exceptions=True,
+            )
+            for r in results:
+                if isinstance(r, CircuitOpen):
+                    summary["skipped"] += 1
+                elif isinstance(r, BaseException):
+                    summary["failed"] += 1
+                else:
+                    summary["ok"] += 1
+            try:
+                await engine.run_blocking(driver.finish, ctx)
+            except Exception as e:
+                self.logger.error(f"[{node_type}] ❌ finish lỗi: {e}")
+            summary["seconds"] = round(loop.time() - started, 1)
+            return node_type, summary
+
+        done = await asyncio.gather(*(
+            run_type(t, drivers[t], rows) for t, rows in rows_by_type.items() if t in drivers
+        ))
+        stats = {
+            "started_at": started_at.isoformat(timespec="seconds"),
+            "seconds": round(loop.time() - started, 1),
+            "types": dict(done),
+            "unknown_types": unknown,
+        }
+        self.last_cycle = stats
+        self.logger.info(
+            f"✅ Chu kỳ thu thập xong ⏱ {stats['seconds']}s: "
+            + ", ".join(f"{t} ok={s['ok']} lỗi={s['failed']} bỏ qua={s['skipped']}" for t, s in stats["types"].items())
+        )
+        return stats
+
+    def stats(self) -> dict:
+        return {
+            "drivers": registered_types(),
+            "budget": self.budget,
+            "type_limits": self.type_limits,
+            "host_limit": self.host_limit,
+            "jitter_s": self.jitter,
+            "offsets_s": self.offsets,
+            "last_cycle": self.last_cycle,
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_collection_scheduler() -> CollectionScheduler:
+    """Scheduler dùng chung (job cron 'collector' + /status/scheduler)."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = CollectionScheduler()
+        return _scheduler
@@ -0,0 +1,105 @@
+# jobs/collector_engine.py
+
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List
+
+from config import COLLECTOR_MAX_CONCURRENCY, NODE_PROBE_TIMEOUT, SSH_PORT
+from jobs.collector_stats import COLLECTOR_STATS, COMMAND, CONNECT, READ
+from jobs.node_health import NODE_HEALTH, PROBE, SKIP, CircuitOpen, probe_tcp
+
+
+class CollectorEngine:
+    """
+    Điều phối task thu thập từng node từ event loop của AsyncIOScheduler.
+    Giới hạn đồng thời bằng asyncio.Semaphore, nhưng I/O node KHÔNG phải coroutine:
+    shell MME (SSH + SSH_POOL) và đọc SFTP PGW/SBG (BackwardReader, sftp_tail, SBG_DIR_INDEX,
+    kênh exec 'sudo sftp-server') đều dựng trên API đồng bộ của paramiko, và mỗi
+    paramiko.Transport tự chạy 1 thread / kết nối. Vì vậy mỗi node đang chạy giữ 1 thread
+    trong ThreadPoolExecutor riêng của engine (max_concurrency thread, mặc định 128)
+    -> số node chạy đồng thời thực tế = max_concurrency, không phải hàng nghìn session.
+    Hàng nghìn session cần chuyển toàn bộ shell + SFTP sang client async (asyncssh),
+    chưa làm (xem README "Thu thập đồng thời").
+    Event loop chỉ lên lịch / chờ; mọi việc blocking (SSH, SQLite, tạo worker/Sender
+    QuestDB, flush) phải đi qua run_blocking để không chặn event loop của FastAPI.
+    """
+
+    def __init__(self, max_concurrency: int = COLLECTOR_MAX_CONCURRENCY):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="collector"
+        )
+
+    async def run_blocking(self, fn: Callable, *args, **kwargs):
+        """Chạy 1 hàm blocking trong executor của engine (cả khởi tạo class: run_blocking(Cls, ...))."""
+        loop = asyncio.get_running_loop()
+        if kwargs:
+            fn = functools.partial(fn, **kwargs)
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def run_nodes(self, rows: Iterable, task: Callable, limit: int = None, node_type: str = None) -> List:
+        """
+        Chạy task(row) cho mọi node, tối đa `limit` node cùng lúc.
+        Trả về list kết quả theo thứ tự rows (Exception nếu task lỗi).
+        Có node_type -> qua NODE_HEALTH (row[0] = node, row[1] = ip): node đang mở
+        circuit không chạy, kết quả là CircuitOpen.
+        """
+        sem = asyncio.Semaphore(min(limit or self.max_concurrency, self.max_concurrency))
+
+        async def one(row):
+            async with sem:
+                if node_type is None:
+                    return await self.run_blocking(task, row)
+                return await self.run_guarded(node_type, row, task)
+
+        return await asyncio.gather(*(one(r) for r in rows), return_exceptions=True)
+
+    async def run_guarded(self, node_type: str, row, task: Callable):
+        """task(row) qua NODE_HEALTH: CircuitOpen nếu node đang bị bỏ qua, ghi nhận độ trễ / lỗi."""
+        node, ip = row[0], row[1]
+        action = NODE_HEALTH.before(node_type, node)
+        if action == SKIP:
+            return CircuitOpen(f"{node_type}/{node}")
+        if action == PROBE and not await self.run_blocking(probe_tcp, ip, SSH_PORT, NODE_PROBE_TIMEOUT):
+            NODE_HEALTH.record_failure(node_type, node, "probe TCP failed")
+            return CircuitOpen(f"{node_type}/{node}")
+
+        started = time.monotonic()
+        try:
+            # thời gian theo phase (connect/command/read/parse/ingest) -> COLLECTOR_STATS
+            result, timing = await self.run_blocking(COLLECTOR_STATS.timed, node_type, node, task, row)
+        except Exception as e:
+            NODE_HEALTH.record_failure(node_type, node, e)
+            raise
+        # connect / lệnh (MME: command, PGW/SBG: read) đo riêng -> timeout riêng
+        io = [timing.phases[p] for p in (COMMAND, READ) if p in timing.phases]
+        NODE_HEALTH.record_success(node_type, node, time.monotonic() - started,
+                                   connect=timing.phases.get(CONNECT), command=sum(io) if io else None)
+        return result
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> CollectorEngine:
+    """Engine dùng chung cho mọi worker (MME/PGW/SBG)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = CollectorEngine()
+        return _engine
+
+
+def shutdown_engine() -> None:
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.shutdown()
+            _engine = None
@@ -0,0 +1,131 @@
+# jobs/collector_stats.py
+
+import datetime
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from questdb.ingress import IngressError
+
+COLLECTOR_STATS_TABLE = "collector_stats"
+
+# Các phase chuẩn (node chỉ có phase mà collector của nó đi qua)
+CONNECT, COMMAND, READ, PARSE, INGEST, TOTAL = "connect", "command", "read", "parse", "ingest", "total"
+
+_local = threading.local()
+
+
+class NodeTiming:
+    """Thời gian (giây) + số byte theo phase của 1 node trong 1 chu kỳ."""
+
+    __slots__ = ("node_type", "node", "started_at", "t0", "total", "phases", "nbytes", "ok")
+
+    def __init__(self, node_type: str, node: str):
+        self.node_type = node_type
+        self.node = node
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self.t0 = time.perf_counter()
+        self.total = 0.0
+        self.phases: Dict[str, float] = {}
+        self.nbytes: Dict[str, int] = {}
+        self.ok = True
+
+    def add(self, phase_name: str, seconds: float = 0.0, nbytes: int = 0) -> None:
+        self.phases[phase_name] = self.phases.get(phase_name, 0.0) + seconds
+        if nbytes:
+            self.nbytes[phase_name] = self.nbytes.get(phase_name, 0) + nbytes
+
+    def rows(self):
+        """Dòng ILP (symbols, columns, at): mỗi phase 1 dòng + 1 dòng 'total'."""
+        items = list(self.phases.items()) + [(TOTAL, self.total)]
+        for phase_name, seconds in items:
+            nbytes = sum(self.nbytes.values()) if phase_name == TOTAL else self.nbytes.get(phase_name, 0)
+            yield (
+                {"type": self.node_type, "Node": self.node, "phase": phase_name},
+                {"ms": round(seconds * 1000, 3), "bytes": int(nbytes), "ok": self.ok},
+                self.started_at,
+            )
+
+
+def current() -> Optional[NodeTiming]:
+    return getattr(_local, "timing", None)
+
+
+@contextmanager
+def phase(name: str):
+    """Đo 1 phase của node đang chạy trong thread này (không có node -> không làm gì)."""
+    timing = current()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - started)
+
+
+def add_bytes(name: str, nbytes: int) -> None:
+    timing = current()
+    if timing is not None and nbytes:
+        timing.add(name, 0.0, nbytes)
+
+
+class CollectorStats:
+    """
+    Gom NodeTiming của các node trong chu kỳ, ghi theo lô vào bảng collector_stats
+    (drain ở finish() của worker, sau khi mọi node của type đã xong).
+    """
+
+    def __init__(self):
+        self._pending: List[NodeTiming] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, node_type: str, node: str):
+        """Gắn NodeTiming vào thread hiện tại trong lúc chạy task của node."""
+        timing = NodeTiming(node_type, node)
+        prev, _local.timing = current(), timing
+        try:
+            yield timing
+        except BaseException:
+            timing.ok = False
+            raise
+        finally:
+            timing.total = time.perf_counter() - timing.t0
+            _local.timing = prev
+            with self._lock:
+                self._pending.append(timing)
+
+    def timed(self, node_type: str, node: str, fn, *args):
+        """
+        fn(*args) trong track() (dùng ở CollectorEngine.run_guarded, chạy trong thread executor).
+        Trả về (kết quả, NodeTiming) để bên gọi lấy thời gian từng phase.
+        """
+        with self.track(node_type, node) as timing:
+            result = fn(*args)
+        return result, timing
+
+    def drain(self, ingest, node_type: str = None) -> int:
+        """
+        Đưa các node đã xong (chỉ của node_type nếu có) vào buffer IngestService;
+        trả về số dòng. Gọi trước client.flush() ở finish() để đi chung lượt flush.
+        """
+        with self._lock:
+            if node_type is None:
+                batch, self._pending = self._pending, []
+            else:
+                batch = [t for t in self._pending if t.node_type == node_type]
+                self._pending = [t for t in self._pending if t.node_type != node_type]
+        if not batch:
+            return 0
+        try:
+            return ingest.write_rows(COLLECTOR_STATS_TABLE, (row for t in batch for row in t.rows()))
+        except IngressError as e:
+            print(f"❌ Ingress error ({COLLECTOR_STATS_TABLE}): {e}")
+            return 0
+
+
+# Dùng chung cho mọi worker
+COLLECTOR_STATS = CollectorStats()
@@ -0,0 +1,42 @@
+# jobs/debug_log.py
+
+import os
+import queue
+import threading
+
+from config import NODE_DEBUG_LOG
+
+# Ghi log debug từng node (logs/<TYPE>/log_<node>.txt) ở thread nền,
+# để thread thu thập không phải chờ I/O file.
+_queue: "queue.Queue[tuple[str, str]]" = queue.Queue(maxsize=10000)
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _writer_loop():
+    while True:
+        path, text = _queue.get()
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        except Exception as e:
+            print(f"❌ Debug log error {path}: {e}")
+        finally:
+            _queue.task_done()
+
+
+def write_debug_log(path: str, text: str) -> None:
+    """Đưa nội dung log debug vào hàng đợi (bỏ qua nếu tắt hoặc hàng đợi đầy)."""
+    global _writer
+    if not NODE_DEBUG_LOG or not path:
+        return
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = threading.Thread(target=_writer_loop, name="node-debug-log", daemon=True)
+                _writer.start()
+    try:
+        _queue.put_nowait((path, text))
+    except queue.Full:
+        pass
@@ -0,0 +1,194 @@
+# jobs/log_service.py
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional, Tuple
+
+from config import (
+    LOG_DIR, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_ROTATE_BYTES, LOG_ROTATE_BACKUPS,
+    LOG_DEBUG_RATE, LOG_DEBUG_BURST,
+)
+
+# Log của worker / scheduler / driver node đi chung 1 hàng đợi, 1 thread listener ghi file:
+# thread thu thập chỉ put_nowait bản ghi đã format, không chờ I/O file.
+_FORMATTER = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+_TRUNCATE = "__truncate__"
+
+# tên logger -> (file schedule rotate, file last job ghi đè mỗi chu kỳ)
+_routes: Dict[str, Tuple[str, Optional[str]]] = {}
+_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_listener: Optional[QueueListener] = None
+_handler: Optional["_DropQueueHandler"] = None
+_lock = threading.Lock()
+
+
+class _DropQueueHandler(QueueHandler):
+    """Hàng đợi đầy -> bỏ bản ghi (đếm lại) thay vì chặn thread thu thập."""
+
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket theo call site (logger, file, dòng) cho bản ghi <= DEBUG:
+    tối đa `rate` dòng/giây (burst `burst`); số dòng bị bỏ được ghi kèm dòng kế tiếp.
+    """
+
+    def __init__(self, rate: float = LOG_DEBUG_RATE, burst: int = LOG_DEBUG_BURST, max_level: int = logging.DEBUG):
+        super().__init__()
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_level = max_level
+        self._buckets: Dict[tuple, list] = {}  # key -> [tokens, last, dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level or self.rate <= 0:
+            return True
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            b = self._buckets.get(key)
+            if b is None:
+                b = self._buckets[key] = [float(self.burst), now, 0]
+            b[0] = min(self.burst, b[0] + (now - b[1]) * self.rate)
+            b[1] = now
+            if b[0] < 1:
+                b[2] += 1
+                return False
+            b[0] -= 1
+            dropped, b[2] = b[2], 0
+        if dropped:
+            record.msg = f"{record.getMessage()} (+{dropped} dòng bị bỏ qua)"
+            record.args = None
+        return True
+
+
+class _Router(logging.Handler):
+    """
+    Chạy trong thread listener: chọn file theo tên logger. Handler file mở 1 lần / process
+    (không còn mỗi node / mỗi chu kỳ 1 FileHandler mới).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._files: Dict[str, logging.Handler] = {}
+
+    def _open(self, path: str, rotating: bool) -> logging.Handler:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if rotating:
+            h = RotatingFileHandler(path, maxBytes=LOG_ROTATE_BYTES, backupCount=LOG_ROTATE_BACKUPS, encoding="utf-8")
+        else:
+            h = logging.FileHandler(path, mode="w", encoding="utf-8")
+        h.setFormatter(_FORMATTER)
+        return h
+
+    def _get(self, path: str, rotating: bool) -> logging.Handler:
+        h = self._files.get(path)
+        if h is None:
+            h = self._files[path] = self._open(path, rotating)
+        return h
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.name == _TRUNCATE:
+            old = self._files.pop(record.msg, None)
+            if old is not None:
+                old.close()
+            self._files[record.msg] = self._open(record.msg, rotating=False)
+            return
+        schedule_path, last_path = _routes.get(record.name, (None, None))
+        if schedule_path:
+            self._get(schedule_path, rotating=True).handle(record)
+        if last_path:
+            self._get(last_path, rotating=False).handle(record)
+
+    def close(self) -> None:
+        for h in self._files.values():
+            h.close()
+        self._files.clear()
+        super().close()
+
+
+def _ensure_started() -> _DropQueueHandler:
+    global _listener, _handler
+    with _lock:
+        if _listener is None:
+            _handler = _DropQueueHandler(_queue)
+            _handler.addFilter(RateLimitFilter())
+            _listener = QueueListener(_queue, _Router(), respect_handler_level=False)
+            _listener.start()
+            atexit.register(stop_logging)
+        return _handler
+
+
+def get_logger(name: str, filename: str, last_filename: str = None) -> logging.Logger:
+    """
+    Logger ghi qua hàng đợi vào LOG_DIR/filename (rotate) và LOG_DIR/last_filename (nếu có,
+    ghi đè khi gọi begin_run). Gọi nhiều lần (mỗi chu kỳ) vẫn chỉ có 1 handler.
+    """
+    _routes[name] = (
+        os.path.join(LOG_DIR, filename),
+        os.path.join(LOG_DIR, last_filename) if last_filename else None,
+    )
+    handler = _ensure_started()
+    logger = logging.getLogger(name)
+    if handler not in logger.handlers:
+        logger.handlers = [handler]
+        logger.propagate = False
+    logger.setLevel(LOG_LEVEL)
+    return logger
+
+
+def begin_run(logger: logging.Logger) -> None:
+    """Đầu chu kỳ: file last job của logger được ghi lại từ đầu (như mode 'w' trước đây)."""
+    _, last_path = _routes.get(logger.name, (None, None))
+    if last_path:
+        _ensure_started().enqueue(logging.makeLogRecord({"name": _TRUNCATE, "msg": last_path}))
+
+
+class NodeLogger(logging.LoggerAdapter):
+    """Gắn type / node vào bản ghi (extra node_type, node) và tiền tố [TYPE/node] cho message."""
+
+    def __init__(self, logger: logging.Logger, node_type: str, node: str):
+        super().__init__(logger, {"node_type": node_type, "node": node})
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+        return f"[{self.extra['node_type']}/{self.extra['node']}] {msg}", kwargs
+
+
+def node_logger(logger: logging.Logger, node_type: str, node: str) -> NodeLogger:
+    return NodeLogger(logger, node_type, node)
+
+
+def logging_stats() -> dict:
+    return {
+        "running": _listener is not None,
+        "queued": _queue.qsize(),
+        "dropped": _handler.dropped if _handler is not None else 0,
+        "loggers": sorted(_routes),
+    }
+
+
+def stop_logging() -> None:
+    """Ghi nốt hàng đợi rồi dừng listener (FastAPI shutdown / atexit)."""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+        for h in listener.handlers:
+            h.close()
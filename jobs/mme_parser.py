@@ -0,0 +1,119 @@
+# jobs/mme_parser.py
+
+import datetime
+import re
+import threading
+from typing import Iterable, List, NamedTuple, Optional, Sequence
+
+from db_utils.kpi_record import KpiRecord
+
+UTC = datetime.timezone.utc
+
+# Output 'pdc_kpi.pl -q 1,5 -i 3 | grep %': (KPI, index dòng trong output kể cả dòng echo lệnh,
+# cột lấy giá trị). Giữ đúng vị trí đang dùng trên node thật.
+QCI_FIELDS = (("qci1", 2, 4), ("qci5", 3, 3))
+
+
+class MmeKpiBlock(NamedTuple):
+    """Kết quả parse output 'pdc_kpi.pl -l'."""
+    records: List[KpiRecord]
+    full_date: Optional[str]   # 'YYYY-MM-DD' của dòng Day cuối
+    time_str: Optional[str]    # 'HH:MM' của dòng Time cuối
+
+
+def mme_ts(full_date: str, time_str: str) -> datetime.datetime:
+    """'YYYY-MM-DD' + 'HH:MM' -> datetime UTC (parse 1 lần cho cả khối Day/Time)."""
+    return datetime.datetime.strptime(f"{full_date} {time_str[:5]}", "%Y-%m-%d %H:%M").replace(tzinfo=UTC)
+
+
+class MmeParser:
+    """
+    Parser output pdc_kpi.pl cho 1 danh sách KPI, biên dịch 1 lần:
+    - 1 regex (không phân biệt hoa thường) nhận diện dòng Day / Time / KPI ngay đầu dòng,
+      thay cho vòng startswith qua từng KPI -> mỗi dòng chỉ 1 lần match.
+    - Ngày hiện tại lấy 1 lần / lần parse (không gọi date.today() cho từng dòng Day).
+    """
+
+    def __init__(self, kpi_list: Sequence[str]):
+        self.kpis = tuple(kpi_list)
+        # KPI dài trước để 'attach_lte' không bị 'attach' chặn trước
+        names = sorted({k.strip().lower() for k in self.kpis if k and k.strip()}, key=len, reverse=True)
+        alts = [r"(?P<day>day\s*:)", r"(?P<time>time\s*:)"]
+        if names:
+            alts.append("(?P<kpi>" + "|".join(map(re.escape, names)) + ")")
+        self._match = re.compile("|".join(alts), re.IGNORECASE).match
+
+    def parse_kpi(self, name: str, lines: Iterable[str], today: datetime.date = None) -> MmeKpiBlock:
+        """Parse từng dòng (có thể là generator đang nhận từ SSH) -> MmeKpiBlock."""
+        today = today or datetime.date.today()
+        match = self._match
+        records = []
+        full_date = time_str = ts = None
+        for line in lines:
+            line = line.strip()
+            m = match(line)
+            if m is None:
+                continue
+            kind = m.lastgroup
+            if kind == "kpi":
+                kpi_name, value = line.split(":", 1)
+                if ts is None:
+                    ts = mme_ts(full_date, time_str)
+                records.append(KpiRecord(name, kpi_name.strip(), ts, 100 - float(value.strip().rstrip("%"))))
+            elif kind == "day":
+                day = int(line.split(":")[1].strip())
+                full_date = f"{today.year}-{today.month:02d}-{day:02d}"
+                ts = None
+            else:
+                time_str = line.split(":", 1)[1].strip()
+                ts = None
+        return MmeKpiBlock(records, full_date, time_str)
+
+
+def parse_mme_output(raw: bytes, name: str, kpi_list: Sequence[str], today: datetime.date = None) -> MmeKpiBlock:
+    """Output 'pdc_kpi.pl -l' dạng bytes -> MmeKpiBlock; chạy được trong ParsePool (parser cache theo process)."""
+    return get_mme_parser(kpi_list).parse_kpi(name, raw.decode("utf-8", errors="replace").splitlines(), today)
+
+
+def parse_qci(name: str, output: str, full_date: Optional[str], time_str: Optional[str]) -> List[KpiRecord]:
+    """
+    Output lệnh QCI -> records qci1/qci5 (theo QCI_FIELDS).
+    Chỉ trả record khi có đủ cả 2 giá trị và có mốc Day/Time từ output KPI.
+    """
+    lines = output.strip().splitlines()
+    values = {}
+    for kpi, idx, col in QCI_FIELDS:
+        if idx >= len(lines) or "%" not in lines[idx]:
+            continue
+        parts = lines[idx].split()
+        if len(parts) >= 5:
+            values[kpi] = 100 - float(parts[col].replace('%', ''))
+
+    if len(values) < len(QCI_FIELDS) or not (full_date and time_str):
+        return []
+    ts = mme_ts(full_date, time_str)
+    return [KpiRecord(name, kpi, ts, values[kpi]) for kpi, _, _ in QCI_FIELDS]
+
+
+_parser: Optional[MmeParser] = None
+_parser_lock = threading.Lock()
+
+
+def get_mme_parser(kpi_list: Sequence[str]) -> MmeParser:
+    """Parser dùng chung cho mọi node MME; biên dịch lại khi danh sách KPI (config_nguong) đổi."""
+    global _parser
+    key = tuple(kpi_list)
+    parser = _parser
+    if parser is not None and parser.kpis == key:
+        return parser
+    with _parser_lock:
+        if _parser is None or _parser.kpis != key:
+            _parser = MmeParser(key)
+        return _parser
+
+
+def invalidate_mme_parser() -> None:
+    """Gọi khi config_nguong thay đổi (thêm/sửa/xoá KPI)."""
+    global _parser
+    with _parser_lock:
+        _parser = None
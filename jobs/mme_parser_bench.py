@@ -0,0 +1,140 @@
+# jobs/mme_parser_bench.py
+# Benchmark thủ công parser output pdc_kpi.pl: vòng startswith qua từng KPI (cách cũ)
+# vs MmeParser (1 regex biên dịch sẵn). Trước khi đo, so kết quả 2 cách trên các
+# output mẫu (FIXTURES) để chắc chắn parser mới cho cùng records.
+#   python -m jobs.mme_parser_bench [số KPI] [số dòng counter]
+
+import datetime
+import sys
+import time
+
+from db_utils.kpi_record import KpiRecord
+from jobs.mme_parser import MmeParser, mme_ts, parse_qci
+
+TODAY = datetime.date(2025, 3, 1)
+
+# Output mẫu (dòng đầu là echo lệnh, như khi đọc từ shell)
+FIXTURES = {
+    "basic": (
+        "pdc_kpi.pl -i 3 -l\n"
+        "Day: 7\n"
+        "Time: 10:35\n"
+        "attach_lte: 0.42%\n"
+        "paging_lte : 1.5%\n"
+        "Bearer_Establishment_LTE: 0.08%\n"
+        "counter_x: 12\n"
+        "attach_wcdma: 0.00%\n"
+    ),
+    "two_blocks": (
+        "pdc_kpi.pl -i 3 -l\n"
+        "Day: 28\n"
+        "Time: 23:55\n"
+        "attach_lte: 0.1%\n"
+        "Day: 28\n"
+        "Time: 23:58:00\n"
+        "attach_lte: 0.2%\n"
+        "paging_wcdma: 3%\n"
+    ),
+    "no_kpi": "pdc_kpi.pl -i 3 -l\nDay: 1\nTime: 00:00\nfoo: 1\n",
+}
+QCI_FIXTURE = (
+    "pdc_kpi.pl -q 1,5 -i 3 | grep %\n"
+    "QCI   Att   Succ   Fail%   Drop%\n"
+    "  1   1200   1195   0.15%   0.42%\n"
+    "  5   8800   8790   0.11%   0.08%\n"
+)
+KPIS = ["attach_lte", "paging_lte", "bearer_establishment_lte", "attach_wcdma", "paging_wcdma"]
+
+
+def legacy_parse(name, lines, kpiList, today=TODAY):
+    """Vòng lặp cũ của Kpi_MME: startswith từng KPI cho mỗi dòng."""
+    records = []
+    fullDate = time_str = ts = None
+    for line in lines:
+        line = line.strip()
+        if line.lower().startswith("day"):
+            day = int(line.split(":")[1].strip())
+            fullDate = f"{today.year}-{today.month:02d}-{day:02d}"
+            ts = None
+        elif line.lower().startswith("time"):
+            time_str = line.split(":", 1)[1].strip()
+            ts = None
+        for kpi in kpiList:
+            if line.lower().startswith(kpi):
+                KpiName, KpiValue = line.strip().split(":", 1)
+                KpiValue = 100 - float(KpiValue.strip().rstrip("%"))
+                if ts is None:
+                    ts = mme_ts(fullDate, time_str)
+                records.append(KpiRecord(name, KpiName.strip(), ts, KpiValue))
+    return records, fullDate, time_str
+
+
+def legacy_qci(name, output, fullDate, time_str):
+    qci1 = qci5 = None
+    for idx, line in enumerate(output.strip().splitlines()):
+        if "%" in line:
+            parts = line.split()
+            if len(parts) >= 5:
+                if idx == 2:
+                    qci1 = 100 - float(parts[4].replace('%', ''))
+                if idx == 3:
+                    qci5 = 100 - float(parts[3].replace('%', ''))
+    if qci1 and qci5:
+        ts = mme_ts(fullDate, time_str)
+        return [KpiRecord(name, "qci1", ts, qci1), KpiRecord(name, "qci5", ts, qci5)]
+    return []
+
+
+def check_fixtures() -> None:
+    parser = MmeParser(KPIS)
+    for label, text in FIXTURES.items():
+        lines = text.splitlines()
+        old = legacy_parse("MME01", lines, KPIS)
+        new = parser.parse_kpi("MME01", lines, today=TODAY)
+        assert tuple(new) == old, (label, new, old)
+        print(f"  {label:<11}: {len(new.records)} records OK")
+    block = parser.parse_kpi("MME01", FIXTURES["basic"].splitlines(), today=TODAY)
+    qci = parse_qci("MME01", QCI_FIXTURE, block.full_date, block.time_str)
+    assert qci == legacy_qci("MME01", QCI_FIXTURE, block.full_date, block.time_str), qci
+    print(f"  qci        : {[(r.kpi_name, round(r.ratio, 2)) for r in qci]} OK")
+
+
+def make_output(n_kpis: int, n_counters: int):
+    kpis = [f"kpi_{i:04d}_lte" for i in range(n_kpis)]
+    lines = ["pdc_kpi.pl -i 3 -l", "Day: 7", "Time: 10:35"]
+    lines += [f"counter_{i:05d}: {i % 997}" for i in range(n_counters)]
+    lines += [f"{k}: {0.01 * (i % 100):.2f}%" for i, k in enumerate(kpis)]
+    return kpis, lines
+
+
+def bench(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main() -> None:
+    n_kpis = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    n_counters = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    print("fixtures")
+    check_fixtures()
+
+    kpis, lines = make_output(n_kpis, n_counters)
+    t0 = time.perf_counter()
+    parser = MmeParser(kpis)
+    compile_ms = (time.perf_counter() - t0) * 1000
+    assert tuple(parser.parse_kpi("MME01", lines, today=TODAY)) == legacy_parse("MME01", lines, kpis)
+
+    print(f"{n_kpis} KPI, {len(lines):,} dòng output (biên dịch {compile_ms:.1f} ms, 1 lần / KPI list)")
+    old = bench(lambda: legacy_parse("MME01", lines, kpis))
+    new = bench(lambda: parser.parse_kpi("MME01", lines, today=TODAY))
+    print(f"  startswith: {old:8.1f} ms")
+    print(f"  regex     : {new:8.1f} ms   x{old / new:.1f}")
+    print(f"  thông lượng: {len(lines) / new * 1000:,.0f} dòng/s")
+
+
+if __name__ == "__main__":
+    main()
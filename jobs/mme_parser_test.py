@@ -0,0 +1,104 @@
+# jobs/mme_parser_test.py
+# Test parser output pdc_kpi.pl (MmeParser / parse_mme_output / parse_qci) trên output mẫu
+# như đọc từ shell node MME: dòng echo lệnh, banner '#', header Day/Time, KPI hoa thường lẫn lộn, QCI.
+#   python -m pytest jobs/mme_parser_test.py   hoặc   python -m jobs.mme_parser_test
+
+import datetime
+
+from db_utils.kpi_record import KpiRecord
+from jobs.mme_parser import MmeParser, get_mme_parser, invalidate_mme_parser, parse_mme_output, parse_qci
+
+UTC = datetime.timezone.utc
+TODAY = datetime.date(2025, 3, 1)
+KPIS = ["attach_lte", "paging_lte", "bearer_establishment_lte", "attach_wcdma", "paging_wcdma", "sub_lte"]
+
+# 'pdc_kpi.pl -i 3 -l' : banner, 2 khối Day/Time, counter không phải KPI, hoa thường lẫn lộn
+PDC_KPI_OUTPUT = (
+    "pdc_kpi.pl -i 3 -l\n"
+    "##############################################\n"
+    "# PDC KPI report, interval 3 min             #\n"
+    "##############################################\n"
+    "Day: 7\n"
+    "Time: 10:32\n"
+    "attach_lte: 0.42%\n"
+    "Paging_LTE : 1.5%\n"
+    "BEARER_ESTABLISHMENT_LTE: 0.08 %\n"
+    "attach_counter: 12\n"
+    "attach_wcdma:0.00%\n"
+    "DAY : 07\n"
+    "time: 10:35:00\n"
+    "attach_lte: 0.40%\n"
+    "sub_lte: 2%\n"
+    "# end of report #\n"
+    "MME01#"
+)
+
+# 'pdc_kpi.pl -q 1,5 -i 3 | grep %' : echo lệnh, header, dòng QCI1, QCI5 (Fail% cột 4, cột 3)
+QCI_OUTPUT = (
+    "pdc_kpi.pl -q 1,5 -i 3 | grep %\n"
+    "QCI   Att   Succ   Fail%   Drop%\n"
+    "  1   1200   1195   0.15%   0.42%\n"
+    "  5   8800   8790   0.11%   0.08%\n"
+)
+
+
+def ts(day, hhmm):
+    h, m = map(int, hhmm.split(":"))
+    return datetime.datetime(2025, 3, day, h, m, tzinfo=UTC)
+
+
+def test_day_time_headers_and_mixed_case():
+    block = MmeParser(KPIS).parse_kpi("MME01", PDC_KPI_OUTPUT.splitlines(), TODAY)
+    assert block.records == [
+        KpiRecord("MME01", "attach_lte", ts(7, "10:32"), 100 - 0.42),
+        KpiRecord("MME01", "Paging_LTE", ts(7, "10:32"), 100 - 1.5),
+        KpiRecord("MME01", "BEARER_ESTABLISHMENT_LTE", ts(7, "10:32"), 100 - 0.08),
+        KpiRecord("MME01", "attach_wcdma", ts(7, "10:32"), 100.0),
+        KpiRecord("MME01", "attach_lte", ts(7, "10:35"), 100 - 0.40),
+        KpiRecord("MME01", "sub_lte", ts(7, "10:35"), 98.0),
+    ]
+    # Day/Time của khối cuối (dùng cho QCI)
+    assert block.full_date == "2025-03-07"
+    assert block.time_str == "10:35:00"
+
+
+def test_no_kpi_lines():
+    block = MmeParser(KPIS).parse_kpi("MME01", ["pdc_kpi.pl -i 3 -l", "Day: 1", "Time: 00:00", "foo: 1"], TODAY)
+    assert block.records == []
+    assert (block.full_date, block.time_str) == ("2025-03-01", "00:00")
+
+
+def test_parse_mme_output_bytes():
+    block = parse_mme_output(PDC_KPI_OUTPUT.encode(), "MME01", KPIS, TODAY)
+    assert len(block.records) == 6
+    assert block.records[1].kpi_name == "Paging_LTE"
+
+
+def test_qci_lines():
+    records = parse_qci("MME01", QCI_OUTPUT, "2025-03-07", "10:35:00")
+    assert records == [
+        KpiRecord("MME01", "qci1", ts(7, "10:35"), 100 - 0.42),
+        KpiRecord("MME01", "qci5", ts(7, "10:35"), 100 - 0.11),
+    ]
+
+
+def test_qci_needs_both_values_and_day_time():
+    truncated = "\n".join(QCI_OUTPUT.splitlines()[:3])
+    assert parse_qci("MME01", truncated, "2025-03-07", "10:35") == []
+    assert parse_qci("MME01", QCI_OUTPUT, None, None) == []
+
+
+def test_parser_cache_follows_kpi_list():
+    invalidate_mme_parser()
+    p1 = get_mme_parser(KPIS)
+    assert get_mme_parser(list(KPIS)) is p1
+    p2 = get_mme_parser(KPIS[:2])
+    assert p2 is not p1 and p2.kpis == tuple(KPIS[:2])
+    invalidate_mme_parser()
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"✅ {name}")
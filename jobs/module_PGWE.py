@@ -1,20 +1,45 @@
 import os
+import socket
 import paramiko
 from typing import List, Tuple
-from config import LOG_DIR, DIRPATH, LOG_FILE, DB_FILE
+from config import LOG_DIR, DIRPATH, LOG_FILE, DB_FILE, SSH_PORT, TAIL_CURSOR_ENABLED
+from db_utils.tail_cursor import TailCursorStore, get_tail_cursor_store
+from db_utils.kpi_record import KpiRecord, parse_ts
+from jobs.collector_stats import CONNECT, READ, PARSE, phase, add_bytes
+from jobs.debug_log import write_debug_log
+from jobs.log_service import get_logger
+from jobs.pgw_kpi_engine import compute_intervals_bytes, window_average
+from jobs.parse_pool import PARSE_POOL
+from jobs.sftp_reader import BackwardReader
+from jobs.sftp_tail import UNCHANGED, APPENDED, read_delta, new_cursor, advance, keep_last_lines
+
+# Log driver node PGW (chạy trong thread thu thập -> qua hàng đợi của log_service)
+_log = get_logger("PGW_nodes", "pgw_schedule.log")
+
 class SFTP_PGWE:
-    def __init__(self, host: str, username: str, password: str, port: int = 22):
+    def __init__(self, host: str, username: str, password: str, port: int = SSH_PORT,
+                 connect_timeout: float = None, timeout: float = None):
         self.host = host
         self.port = port
         self.username = username
         self.password = password
+        self.connect_timeout = connect_timeout  # None -> mặc định paramiko
+        self.timeout = timeout                  # timeout mỗi thao tác SFTP
         self.transport = None
         self.sftp = None
 
     def connect(self):
-        self.transport = paramiko.Transport((self.host, self.port))
+        if self.connect_timeout:
+            sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+            self.transport = paramiko.Transport(sock)
+            self.transport.banner_timeout = self.transport.handshake_timeout = self.connect_timeout
+            self.transport.auth_timeout = self.connect_timeout
+        else:
+            self.transport = paramiko.Transport((self.host, self.port))
         self.transport.connect(username=self.username, password=self.password)
         self.sftp = paramiko.SFTPClient.from_transport(self.transport)
+        if self.timeout:
+            self.sftp.get_channel().settimeout(self.timeout)
 
     def close(self):
         if self.sftp:
@@ -24,6 +49,28 @@ class SFTP_PGWE:
             try: self.transport.close()
             except: pass
 
+    def _scan_head2_and_tail(self, f, file_size: int, tail_n: int, chunk_size: int) -> Tuple[str, bytes]:
+        """Line 2 + đoạn cuối file (đọc ngược tới khi đủ tail_n dòng); head đọc chung lượt readv đầu."""
+        reader = BackwardReader(f, file_size, chunk_size, head=(0, min(chunk_size, file_size)))
+        buf = reader.last_lines(tail_n)
+
+        lines = reader.head.split(b'\n', 2)
+        if len(lines) < 3 and len(reader.head) < file_size:
+            # header dài hơn 1 chunk -> đọc tuần tự như cũ
+            f.seek(0)
+            _ = f.readline()  # line1
+            line2 = f.readline()
+        else:
+            line2 = lines[1] if len(lines) > 1 else b''
+        return line2.decode('utf-8', errors='replace').rstrip('\r\n'), buf
+
+    @staticmethod
+    def _last_lines(buf: bytes, tail_n: int) -> List[str]:
+        return [
+            lb.decode('utf-8', errors='replace').rstrip('\r\n')
+            for lb in buf.splitlines()[-tail_n:]
+        ]
+
     def read_head2_and_tail(self, remote_path: str, tail_n: int = 4, chunk_size: int = 131072) -> Tuple[str, List[str]]:
         """Đọc line 2 và tail_n dòng cuối qua SFTP."""
         try:
@@ -31,116 +78,113 @@ class SFTP_PGWE:
                 st = f.stat()
                 if st.st_size == 0:
                     return "", []
+                line2, buf = self._scan_head2_and_tail(f, st.st_size, tail_n, chunk_size)
+                return line2, self._last_lines(buf, tail_n)
+        except Exception as e:
+            raise RuntimeError(f"SFTP error reading {remote_path}: {e}")
 
-                _ = f.readline()  # line1
-                line2 = f.readline().decode('utf-8', errors='replace').rstrip('\r\n')
-
-                # Tail đọc ngược
-                file_size = st.st_size
-                pos = file_size
-                buf = bytearray()
-                nl_count = 0
-
-                while nl_count < tail_n and pos > 0:
-                    read_size = min(chunk_size, pos)
-                    pos -= read_size
-                    f.seek(pos)
-                    chunk = f.read(read_size)
-                    buf[:0] = chunk
-                    nl_count = buf.count(b'\n')
-
-                lines = bytes(buf).splitlines()
-                last_lines = [
-                    lb.decode('utf-8', errors='replace').rstrip('\r\n')
-                    for lb in lines[-tail_n:]
-                ]
-                return line2, last_lines
+    def read_head2_and_tail_incremental(
+        self, remote_path: str, node: str, tail_n: int = 4,
+        chunk_size: int = 131072, store: TailCursorStore = None,
+    ) -> Tuple[str, List[str]]:
+        """
+        Như read_head2_and_tail nhưng dùng cursor (node, path): file không đổi -> chỉ stat;
+        có ghi thêm -> chỉ đọc phần mới; rotate/truncate -> quét lại như cũ.
+        Cursor giữ line 2 + đoạn bytes chứa tail_n dòng cuối.
+        """
+        store = store or get_tail_cursor_store()
+        try:
+            cursor = store.get(node, remote_path)
+            kind, attr, data = read_delta(self.sftp, remote_path, cursor, store)
+            if kind == UNCHANGED:
+                line2, buf = cursor.state.split(b'\n', 1)
+                return line2.decode('utf-8', errors='replace'), self._last_lines(buf, tail_n)
+
+            if kind == APPENDED:
+                line2, buf = cursor.state.split(b'\n', 1)
+                buf = keep_last_lines(buf + data, tail_n)
+                store.put(node, remote_path, advance(cursor, attr, line2 + b'\n' + buf))
+                return line2.decode('utf-8', errors='replace'), self._last_lines(buf, tail_n)
+
+            with self.sftp.open(remote_path, 'rb') as f:
+                st = f.stat()
+                if st.st_size == 0:
+                    store.delete(node, remote_path)
+                    return "", []
+                line2, buf = self._scan_head2_and_tail(f, st.st_size, tail_n, chunk_size)
+                buf = keep_last_lines(buf, tail_n)
+                state = line2.encode('utf-8', errors='replace') + b'\n' + buf
+                store.put(node, remote_path, new_cursor(f, st.st_size, int(st.st_mtime), state))
+                return line2, self._last_lines(buf, tail_n)
         except Exception as e:
             raise RuntimeError(f"SFTP error reading {remote_path}: {e}")
 
+# File counter PGW trên node
+PGW_KPI_FILE = "/var/log/services/epg/pdc/work/tmp/pm_job_epg-kpi.csv"
+
+# KPI PGW: tên -> (counter completed, counter attempted) trong pm_job_epg-kpi.csv
+PGW_KPI_DEFS = {
+    "PgwS5CreateSessionFR": (
+        "pgw-completed-eps-bearer-stats:pgw-completed-eps-bearer-activation",
+        "pgw-attempted-eps-bearer-stats:pgw-attempted-eps-bearer-activation"
+    ),
+    "SgwS4S11CreateSessionFR": (
+        "sgw-gtp-tunnel-mgmt-s4-s11:sm-create-session-resp-acc-sent",
+        "sgw-gtp-tunnel-mgmt-s4-s11:sm-create-session-req-rcvd"
+    ),
+    "GgsnCreatePdpCtxFR": (
+        "ggsn-pdp-contexts-stats-completed:ggsn-completed-activation",
+        "ggsn-pdp-contexts-stats-attempted:ggsn-attempted-activation"
+    ),
+}
+
+
 def calculate_kpi_from_lines(
     Node: str, header: str, last_lines: List[str],
-    kpi_defs: dict, node_log_dir: str
-):
-    """Tính KPI và ghi log."""
+    kpi_defs: dict, node_log_dir: str = None
+) -> List[KpiRecord]:
+    """Tính KPI (trung bình các khoảng), trả về list[KpiRecord]; log debug ghi nền."""
     if not header or not last_lines:
-        print(f"[{Node}] File rỗng hoặc không đọc được")
-        return
-
-    os.makedirs(node_log_dir, exist_ok=True)
-
-    data = ''
-    header_parts = header.split("|")
-    prev_parts = None
-    sum_kpi = {k: 0.0 for k in kpi_defs.keys()}
-    count_kpi = {k: 0 for k in kpi_defs.keys()}
-    last_time_str = ""
-
-    for ln in last_lines:
-        parts = ln.split("|")
-        if prev_parts is not None:
-            time_str = parts[0]
-            last_time_str = time_str
-            for kpi_name, (completed_counter, attempted_counter) in kpi_defs.items():
-                try:
-                    idx_completed = header_parts.index(completed_counter)
-                    idx_attempted = header_parts.index(attempted_counter)
-
-                    completed_prev = int(prev_parts[idx_completed])
-                    completed_curr = int(parts[idx_completed])
-                    attempted_prev = int(prev_parts[idx_attempted])
-                    attempted_curr = int(parts[idx_attempted])
-
-                    attempted_diff = attempted_curr - attempted_prev
-                    completed_diff = completed_curr - completed_prev
-
-                    if attempted_diff > 0:
-                        ratio = completed_diff * 100.0 / attempted_diff
-                    else:
-                        ratio = 0.0
-
-                    sum_kpi[kpi_name] += ratio
-                    count_kpi[kpi_name] += 1
-
-                    data += f"{Node};{time_str};{kpi_name};{ratio:.2f}\n"
-                except ValueError:
-                    pass
-        prev_parts = parts
-
-    # Thêm dòng avg cuối
+        _log.warning(f"[{Node}] File rỗng hoặc không đọc được")
+        return []
+
+    # delta/ratio của mọi KPI x mọi khoảng tính 1 lần (jobs/pgw_kpi_engine.py); tail dài -> ParsePool
+    iv = PARSE_POOL.run(compute_intervals_bytes, "\n".join(last_lines).encode("utf-8"), header, kpi_defs)
+    last_time_str, averages = window_average(iv)
+
+    # Giá trị avg tại mốc thời gian cuối
+    records = []
     if last_time_str:
-        for kpi_name in kpi_defs.keys():
-            if count_kpi[kpi_name] > 0:
-                avg_ratio = sum_kpi[kpi_name] / count_kpi[kpi_name]
-                data += f"insertDB;{Node};{last_time_str};{kpi_name};{avg_ratio:.2f}\n"
-
-    file_path = os.path.join(node_log_dir, f"log_{Node}.txt")
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(data)
-    # print(data)
-
-def KPI_PGW(node: str, ip: str, user: str, password: str, filename: str, node_log_dir: str):
-    """Worker PGW."""
-    kpi_defs = {
-        "PgwS5CreateSessionFR": (
-            "pgw-completed-eps-bearer-stats:pgw-completed-eps-bearer-activation",
-            "pgw-attempted-eps-bearer-stats:pgw-attempted-eps-bearer-activation"
-        ),
-        "SgwS4S11CreateSessionFR": (
-            "sgw-gtp-tunnel-mgmt-s4-s11:sm-create-session-resp-acc-sent",
-            "sgw-gtp-tunnel-mgmt-s4-s11:sm-create-session-req-rcvd"
-        ),
-        "GgsnCreatePdpCtxFR": (
-            "ggsn-pdp-contexts-stats-completed:ggsn-completed-activation",
-            "ggsn-pdp-contexts-stats-attempted:ggsn-attempted-activation"
-        ),
-    }
-
-    client = SFTP_PGWE(ip, user, password)
+        ts = parse_ts(last_time_str)
+        records = [KpiRecord(Node, kpi_name, ts, avg_ratio) for kpi_name, avg_ratio in averages]
+
+    if node_log_dir:
+        data = [
+            f"{Node};{time_str};{kpi_name};{iv.ratio[i, j]:.2f}\n"
+            for i, time_str in enumerate(iv.times)
+            for j, kpi_name in enumerate(iv.kpi_names) if iv.valid[i, j]
+        ]
+        data += [f"insertDB;{Node};{last_time_str};{kpi_name};{avg_ratio:.2f}\n" for kpi_name, avg_ratio in averages]
+        write_debug_log(os.path.join(node_log_dir, f"log_{Node}.txt"), "".join(data))
+    return records
+
+def KPI_PGW(node: str, ip: str, user: str, password: str, filename: str, node_log_dir: str = None,
+            connect_timeout: float = None, timeout: float = None) -> List[KpiRecord]:
+    """Worker PGW: trả về list[KpiRecord]."""
+    kpi_defs = PGW_KPI_DEFS
+
+    client = SFTP_PGWE(ip, user, password, connect_timeout=connect_timeout, timeout=timeout)
     try:
-        client.connect()
-        header, last_lines = client.read_head2_and_tail(filename, tail_n=4)
+        with phase(CONNECT):
+            client.connect()
+        with phase(READ):
+            if TAIL_CURSOR_ENABLED:
+                header, last_lines = client.read_head2_and_tail_incremental(filename, node, tail_n=4)
+            else:
+                header, last_lines = client.read_head2_and_tail(filename, tail_n=4)
+        add_bytes(READ, len(header) + sum(len(line) + 1 for line in last_lines))
     finally:
         client.close()
 
-    calculate_kpi_from_lines(node, header, last_lines, kpi_defs, node_log_dir)
\ No newline at end of file
+    with phase(PARSE):
+        return calculate_kpi_from_lines(node, header, last_lines, kpi_defs, node_log_dir)
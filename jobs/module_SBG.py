@@ -1,51 +1,58 @@
 import os
-import re
 import paramiko
 import logging
-from datetime import datetime
-from stat import S_ISREG
+from datetime import datetime, timezone
+
+from config import LOG_DIR, DIRPATH, SFTP_CMD_NOPASS, SSH_PORT, TAIL_CURSOR_ENABLED
+from db_utils.tail_cursor import TailCursorStore, get_tail_cursor_store
+from db_utils.kpi_record import KpiRecord, format_insertdb
+from jobs.collector_stats import CONNECT, READ, PARSE, phase, add_bytes
+from jobs.debug_log import write_debug_log
+from jobs.log_service import get_logger, node_logger
+from jobs.sbg_dir_index import SBG_DIR_INDEX
+from jobs.sbg_kpi_engine import SbgAggregates, SbgBlock, aggregate_lines, parse_sbg_block
+from jobs.parse_pool import PARSE_POOL
+from jobs.sftp_reader import read_from_last
+from jobs.sftp_tail import UNCHANGED, APPENDED, read_delta, new_cursor, advance
+
+# Dòng header mở đầu mỗi block trong sbgKPIsLog
+SBG_HEADER_LINE = "Timestamp,PmpId,CpuLoadCh,CpuLoadSb,MemoryLoadCh,MemoryLoadSb,CpRegUsers,CpSessions"
+
+
+def sbg_node_logger(type_filter: str = "SBG"):
+    """Log driver node SBG: <type>_schedule.log + last_job.log (ghi đè mỗi chu kỳ ở WorkerSBG)."""
+    return get_logger(f"{type_filter}_nodes", f"{type_filter.lower()}_schedule.log", "last_job.log")
 
-from config import LOG_DIR, DIRPATH, SFTP_CMD_NOPASS
 
 class Kpi_SBG:
-    def __init__(self, node: str, ip: str, user: str, password: str, port: int = 22, type_filter: str = "SBG"):
+    def __init__(self, node: str, ip: str, user: str, password: str, port: int = SSH_PORT, type_filter: str = "SBG",
+                 connect_timeout: float = None, timeout: float = None):
         self.node = node
         self.ip = ip
         self.user = user
         self.password = password
         self.port = port
         self.type_filter = type_filter
+        self.connect_timeout = connect_timeout  # None -> mặc định paramiko
+        self.timeout = timeout                  # timeout mỗi thao tác SFTP
         self.client: paramiko.SSHClient | None = None
         self.sftp: paramiko.SFTPClient | None = None
         self.logger = self._init_logger()
 
     # ----------------- Logging -----------------
     def _init_logger(self):
-        logger = logging.getLogger(f"{self.type_filter}_{self.node}")
-        logger.setLevel(logging.INFO)
-
-        # log rotate (per type)
-        log_path = os.path.join(LOG_DIR, f"{self.type_filter.lower()}_schedule.log")
-        fh = logging.FileHandler(log_path, mode="a", encoding="utf-8")
-        fh.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
-
-        # overwrite last job
-        last_path = os.path.join(LOG_DIR, "last_job.log")
-        fh_last = logging.FileHandler(last_path, mode="w", encoding="utf-8")
-        fh_last.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
-
-        # tránh add handler nhiều lần khi gọi nhiều job
-        if not logger.handlers:
-            logger.addHandler(fh)
-            logger.addHandler(fh_last)
-        return logger
+        # 1 logger chung cho mọi node (queue, không mở file mỗi node), tiền tố [SBG/node]
+        return node_logger(sbg_node_logger(self.type_filter), self.type_filter, self.node)
 
     # ----------------- SSH/SFTP -----------------
     def connect(self):
         self.client = paramiko.SSHClient()
         self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        self.client.connect(self.ip, self.port, self.user, self.password)
-        self.sftp = self._open_sftp_via_sudo_su()
+        self.client.connect(self.ip, self.port, self.user, self.password, timeout=self.connect_timeout,
+                            banner_timeout=self.connect_timeout, auth_timeout=self.connect_timeout)
+        self.sftp = self._open_sftp_via_sudo_su(timeout=self.connect_timeout or 30)
+        if self.timeout:
+            self.sftp.get_channel().settimeout(self.timeout)
         self.logger.info(f"Connected to {self.node} ({self.ip})")
 
     def _sftp_from_channel_compat(self, chan: paramiko.Channel) -> paramiko.SFTPClient:
@@ -69,19 +76,8 @@ class Kpi_SBG:
 
     # ----------------- File & Data -----------------
     def _newest_file_in_dir(self, dirpath: str):
-        latest_attr = None
-        latest_name = None
-        for attr in self.sftp.listdir_attr(dirpath):
-            if not S_ISREG(attr.st_mode):
-                continue
-            if (latest_attr is None
-                or attr.st_mtime > latest_attr.st_mtime
-                or (attr.st_mtime == latest_attr.st_mtime and attr.st_size > latest_attr.st_size)):
-                latest_attr = attr
-                latest_name = attr.filename
-        if latest_attr is None:
-            return None, None
-        return f"{dirpath.rstrip('/')}/{latest_name}", latest_attr
+        # index theo node: chỉ stat file active, list lại thư mục khi rotate / file đứng yên
+        return SBG_DIR_INDEX.newest(self.sftp, self.node, dirpath)
 
     def _read_from_last_header_to_eof_sftp(
         self,
@@ -90,131 +86,134 @@ class Kpi_SBG:
         chunk_size: int = 65536,
         max_scan_bytes: int | None = 16 * 1024 * 1024,
         encoding: str = "utf-8",
-    ) -> str:
+    ) -> bytes:
         needle = header_line.encode(encoding, errors="ignore")
         with self.sftp.open(filepath, "rb") as f:
             st = f.stat()
             if st.st_size == 0:
-                return ""
-
-            size = st.st_size
-            pos = size
-            scanned = 0
-            acc = bytearray()
-
-            while pos > 0 and (max_scan_bytes is None or scanned < max_scan_bytes):
-                rd = min(chunk_size, pos)
-                pos -= rd
-                f.seek(pos)
-                block = f.read(rd)
-                scanned += rd
-                acc[:0] = block
-
-                idx = acc.rfind(needle)
-                if idx != -1:
-                    header_pos = pos + idx
-                    f.seek(header_pos)
-                    tail = f.read(size - header_pos)
-                    return tail.decode(encoding, errors="replace")
-            return ""
-
-    def _average(self, seq):
-        seq = [x for x in seq if x is not None]
-        return (sum(seq) / len(seq)) if seq else 0.0
-
-    def _analyze_kpi_lines(self, lines, current_time, node_log_dir, skip_if_all_ratios_zero=True):
-        subIPv4 = subIPv6 = sub = 0
-        InitRegTimeIPv4 = InitRegTimeIPv6 = InitRegTime_ = 0
-        succRegisIPv4, IncSessionRateIv4, OutSessionRateIv4 = [], [], []
-        succRegisIPv6, IncSessionRateIv6, OutSessionRateIv6 = [], [], []
-        succRegis, IncSessionRate, OutSessionRate = [], [], []
-
-        for line in lines:
-            fields = [c.strip() for c in line.split(',')]
-            if len(fields) < 15:
-                continue
-            try:
-                ipVersion = fields[4]
-                numSub   = int(float(fields[5] or 0))
-                InitRegTime = float(fields[7] or 0)
-                ratio    = float(fields[6]  or 0)
-                incRatio = float(fields[13] or 0)
-                outRatio = float(fields[14] or 0)
-
-                if numSub == 0:
-                    continue
-                if skip_if_all_ratios_zero and (ratio == 0 and incRatio == 0 and outRatio == 0):
-                    continue
-
-                if ipVersion == 'IPv4':
-                    InitRegTimeIPv4 += InitRegTime
-                    subIPv4 += numSub
-                    succRegisIPv4.append(ratio)
-                    IncSessionRateIv4.append(incRatio)
-                    OutSessionRateIv4.append(outRatio)
-                elif ipVersion == 'IPv6':
-                    InitRegTimeIPv6 += InitRegTime
-                    subIPv6 += numSub
-                    succRegisIPv6.append(ratio)
-                    IncSessionRateIv6.append(incRatio)
-                    OutSessionRateIv6.append(outRatio)
-
-                InitRegTime_ += InitRegTime
-                sub += numSub
-                succRegis.append(ratio)
-                IncSessionRate.append(incRatio)
-                OutSessionRate.append(outRatio)
-            except Exception as e:
-                self.logger.warning(f"Error processing line: {line} => {e}")
-
-        data = ""
-        if subIPv4 and InitRegTimeIPv4:
-            data += f"insertDB;{self.node};{current_time};subIPv4;{subIPv4}\n"
-            data += f"insertDB;{self.node};{current_time};subIPv6;{subIPv6}\n"
-            data += f"insertDB;{self.node};{current_time};InitRegTimeIPv4;{InitRegTimeIPv4:.0f}\n"
-            data += f"insertDB;{self.node};{current_time};InitRegTimeIPv6;{InitRegTimeIPv6:.0f}\n"
-            data += f"insertDB;{self.node};{current_time};RegRatioV4;{self._average(succRegisIPv4):.2f}\n"
-            data += f"insertDB;{self.node};{current_time};RegRatioV6;{self._average(succRegisIPv6):.2f}\n"
-            data += f"insertDB;{self.node};{current_time};IncSessionRateIv4;{self._average(IncSessionRateIv4):.2f}\n"
-            data += f"insertDB;{self.node};{current_time};IncSessionRateIv6;{self._average(IncSessionRateIv6):.2f}\n"
-            data += f"insertDB;{self.node};{current_time};OutSessionRateIv4;{self._average(OutSessionRateIv4):.2f}\n"
-            data += f"insertDB;{self.node};{current_time};OutSessionRateIv6;{self._average(OutSessionRateIv6):.2f}\n"
-            data += f"insertDB;{self.node};{current_time};sub;{sub}\n"
-            data += f"insertDB;{self.node};{current_time};InitRegTime_;{InitRegTime_:.0f}\n"
-            data += f"insertDB;{self.node};{current_time};succRegis;{self._average(succRegis):.2f}\n"
-            data += f"insertDB;{self.node};{current_time};IncSessionRate;{self._average(IncSessionRate):.2f}\n"
-            data += f"insertDB;{self.node};{current_time};OutSessionRate;{self._average(OutSessionRate):.2f}\n"
-
-        file_path = os.path.join(node_log_dir, f"log_{self.node}.txt")
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(data)
+                return b""
+            return read_from_last(f, st.st_size, needle, chunk_size, max_scan_bytes)
+
+    def _read_last_block_incremental(
+        self,
+        filepath: str,
+        header_line: str,
+        chunk_size: int = 65536,
+        max_scan_bytes: int | None = 16 * 1024 * 1024,
+        encoding: str = "utf-8",
+        store: TailCursorStore = None,
+    ) -> bytes:
+        """
+        Như _read_from_last_header_to_eof_sftp nhưng dùng cursor (node, file):
+        cursor giữ block từ header cuối tới offset đã đọc; chu kỳ sau chỉ đọc
+        phần ghi thêm và tìm header mới trong (block cũ + phần mới).
+        Chưa thấy header -> state chỉ giữ vài byte cuối (header nằm vắt qua 2 lần đọc).
+        """
+        store = store or get_tail_cursor_store()
+        needle = header_line.encode(encoding, errors="ignore")
+        cursor = store.get(self.node, filepath)
+        kind, attr, data = read_delta(self.sftp, filepath, cursor, store)
+
+        if kind == UNCHANGED:
+            block = cursor.state
+        elif kind == APPENDED:
+            combined = cursor.state + data
+            idx = combined.rfind(needle)
+            if idx != -1 and (max_scan_bytes is None or len(combined) - idx <= max_scan_bytes):
+                block = combined[idx:]
+                store.put(self.node, filepath, advance(cursor, attr, block))
+            else:
+                block = b""
+                store.put(self.node, filepath, advance(cursor, attr, combined[-(len(needle) - 1):]))
+        else:
+            with self.sftp.open(filepath, "rb") as f:
+                st = f.stat()
+                if st.st_size == 0:
+                    store.delete(self.node, filepath)
+                    return b""
+                block = read_from_last(f, st.st_size, needle, chunk_size, max_scan_bytes)
+                state = block or b""
+                store.put(self.node, filepath, new_cursor(f, st.st_size, int(st.st_mtime), state))
+
+        return block if block.startswith(needle) else b""
+
+    def _analyze_block(self, parsed: SbgBlock, current_time, node_log_dir=None):
+        for line in parsed.bad_lines:
+            self.logger.warning(f"Error processing line: {line}")
+        records = sbg_records(self.node, parsed.agg, current_time)
+        if node_log_dir:
+            write_debug_log(os.path.join(node_log_dir, f"log_{self.node}.txt"), format_insertdb(records))
+        return records
 
     # ----------------- Public API -----------------
-    def run(self, node_log_dir: str):
+    def run(self, node_log_dir: str = None) -> list[KpiRecord]:
         try:
-            self.connect()
-            fullpath, attr = self._newest_file_in_dir(DIRPATH)
-            if not fullpath:
-                self.logger.warning(f"No file found in {DIRPATH}")
-                return
-            block = self._read_from_last_header_to_eof_sftp(
-                fullpath,
-                header_line="Timestamp,PmpId,CpuLoadCh,CpuLoadSb,MemoryLoadCh,MemoryLoadSb,CpRegUsers,CpSessions",
-            )
+            with phase(CONNECT):
+                self.connect()
+            with phase(READ):
+                fullpath, attr = self._newest_file_in_dir(DIRPATH)
+                if not fullpath:
+                    self.logger.warning(f"No file found in {DIRPATH}")
+                    return []
+                read_block = (self._read_last_block_incremental if TAIL_CURSOR_ENABLED
+                              else self._read_from_last_header_to_eof_sftp)
+                block = read_block(fullpath, header_line=SBG_HEADER_LINE)
+            add_bytes(READ, len(block or b""))
             if not block:
                 self.logger.warning("No header found in scanned region")
-                return
-
-            lines = [line.strip() for line in block.split("\n") if 'IPv' in line and 'access' in line]
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
-            self._analyze_kpi_lines(lines, current_time, node_log_dir)
-            self.logger.info(f"Processed KPI for {self.node}, lines={len(lines)}")
+                return []
+
+            with phase(PARSE):
+                # parse block thô (lọc dòng + tổng hợp) ở ParsePool, block nhỏ parse ngay trong thread
+                parsed = PARSE_POOL.run(parse_sbg_block, block)
+                # giờ local, cắt tới phút, gắn nhãn UTC (giữ nguyên như khi đi qua file log)
+                current_time = datetime.now().replace(second=0, microsecond=0, tzinfo=timezone.utc)
+                records = self._analyze_block(parsed, current_time, node_log_dir)
+            self.logger.info(f"Processed KPI for {self.node}, lines={parsed.n_lines}")
+            return records
         finally:
             self.close()
 
 
 
 
-def Kpi_SBG_run(node, ip, user, password, node_log_dir, port=22):
-    worker = Kpi_SBG(node=node, ip=ip, user=user, password=password, port=port, type_filter="SBG")
-    worker.run(node_log_dir)
\ No newline at end of file
+def analyze_sbg_lines(node, lines, current_time, skip_if_all_ratios_zero=True, logger=None) -> list[KpiRecord]:
+    """Tổng hợp KPI IPv4/IPv6/total từ các dòng 'IPv...access' của 1 block sbgKPIsLog."""
+    # parse + tổng hợp dạng cột (jobs/sbg_kpi_engine.py)
+    agg = aggregate_lines(lines, skip_if_all_ratios_zero)
+    for i in agg.bad_lines:
+        (logger or logging.getLogger(__name__)).warning(f"Error processing line: {lines[i]}")
+    return sbg_records(node, agg, current_time)
+
+
+def sbg_records(node, agg: SbgAggregates, current_time) -> list[KpiRecord]:
+    """15 KPI SBG từ kết quả tổng hợp (rỗng nếu không có IPv4)."""
+    v4, v6, total = agg.ipv4, agg.ipv6, agg.total
+    records = []
+    if v4.sub and v4.init_reg_time:
+        values = [
+            ("subIPv4", v4.sub),
+            ("subIPv6", v6.sub),
+            ("InitRegTimeIPv4", round(v4.init_reg_time)),
+            ("InitRegTimeIPv6", round(v6.init_reg_time)),
+            ("RegRatioV4", round(v4.reg_ratio, 2)),
+            ("RegRatioV6", round(v6.reg_ratio, 2)),
+            ("IncSessionRateIv4", round(v4.inc_session, 2)),
+            ("IncSessionRateIv6", round(v6.inc_session, 2)),
+            ("OutSessionRateIv4", round(v4.out_session, 2)),
+            ("OutSessionRateIv6", round(v6.out_session, 2)),
+            ("sub", total.sub),
+            ("InitRegTime_", round(total.init_reg_time)),
+            ("succRegis", round(total.reg_ratio, 2)),
+            ("IncSessionRate", round(total.inc_session, 2)),
+            ("OutSessionRate", round(total.out_session, 2)),
+        ]
+        records = [KpiRecord(node, name, current_time, float(value)) for name, value in values]
+    return records
+
+
+def Kpi_SBG_run(node, ip, user, password, node_log_dir=None, port=SSH_PORT,
+                connect_timeout=None, timeout=None) -> list[KpiRecord]:
+    worker = Kpi_SBG(node=node, ip=ip, user=user, password=password, port=port, type_filter="SBG",
+                     connect_timeout=connect_timeout, timeout=timeout)
+    return worker.run(node_log_dir)
@@ -0,0 +1,160 @@
+# jobs/node_health.py
+
+import socket
+import threading
+import time
+from collections import deque
+from typing import Dict, Tuple
+
+from config import (
+    NODE_HEALTH_WINDOW, NODE_HEALTH_MIN_SAMPLES, NODE_TIMEOUT_FACTOR, NODE_CONNECT_TIMEOUT,
+    NODE_COMMAND_TIMEOUT, NODE_CONNECT_TIMEOUT_DEFAULT, NODE_COMMAND_TIMEOUT_DEFAULT,
+    NODE_FAILURE_THRESHOLD, NODE_COOLDOWN,
+)
+
+# Trạng thái circuit
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+# Kết quả before()
+RUN, PROBE, SKIP = "run", "probe", "skip"
+
+
+class CircuitOpen(Exception):
+    """Node đang bị bỏ qua (circuit mở) trong chu kỳ này."""
+
+
+def probe_tcp(ip: str, port: int, timeout: float) -> bool:
+    """Probe rẻ: chỉ mở kết nối TCP tới cổng SSH rồi đóng."""
+    try:
+        with socket.create_connection((ip, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def _percentile(ordered, q: float) -> float:
+    idx = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _adaptive(samples, default: float, bounds: Tuple[float, float]) -> float:
+    """p95 x hệ số kẹp trong bounds; chưa đủ mẫu -> default."""
+    if len(samples) < NODE_HEALTH_MIN_SAMPLES:
+        return default
+    want = _percentile(sorted(samples), 0.95) * NODE_TIMEOUT_FACTOR
+    return min(max(want, bounds[0]), bounds[1])
+
+
+class _Node:
+    __slots__ = ("latencies", "connect", "command", "failures", "state", "opened_at", "last_error",
+                 "last_ok", "ok", "failed", "skipped")
+
+    def __init__(self):
+        self.latencies = deque(maxlen=NODE_HEALTH_WINDOW)  # cả task (hiển thị p50/p95)
+        self.connect = deque(maxlen=NODE_HEALTH_WINDOW)    # phase connect (session mới)
+        self.command = deque(maxlen=NODE_HEALTH_WINDOW)    # phase command / read
+        self.failures = 0        # lỗi liên tiếp
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.last_error = None
+        self.last_ok = None      # epoch giây
+        self.ok = self.failed = self.skipped = 0
+
+
+class NodeHealth:
+    """
+    Sức khoẻ từng node theo (type, node), dùng chung cho các worker:
+    - Độ trễ connect và lệnh/đọc của các lần chạy gần nhất (đo riêng) -> p95 -> timeout
+      connect / lệnh thích nghi; chưa đủ mẫu -> timeout mặc định cũ (không phải mức tối đa).
+    - Circuit breaker: lỗi liên tiếp >= threshold -> mở, bỏ qua node trong `cooldown` giây;
+      hết cooldown -> half-open: probe TCP, thông thì chạy thử 1 lần, OK thì đóng lại.
+    """
+
+    def __init__(self, failure_threshold: int = NODE_FAILURE_THRESHOLD, cooldown: float = NODE_COOLDOWN):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self._nodes: Dict[Tuple[str, str], _Node] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key) -> _Node:
+        st = self._nodes.get(key)
+        if st is None:
+            st = self._nodes[key] = _Node()
+        return st
+
+    def before(self, node_type: str, node: str) -> str:
+        """RUN / PROBE (half-open) / SKIP (circuit mở, chưa hết cooldown)."""
+        with self._lock:
+            st = self._get((node_type, node))
+            if st.state == CLOSED:
+                return RUN
+            if st.state == OPEN and time.monotonic() - st.opened_at < self.cooldown:
+                st.skipped += 1
+                return SKIP
+            st.state = HALF_OPEN
+            return PROBE
+
+    def record_success(self, node_type: str, node: str, seconds: float,
+                       connect: float = None, command: float = None) -> None:
+        with self._lock:
+            st = self._get((node_type, node))
+            st.latencies.append(seconds)
+            if connect is not None:
+                st.connect.append(connect)
+            if command is not None:
+                st.command.append(command)
+            st.failures = 0
+            st.state = CLOSED
+            st.last_ok = time.time()
+            st.ok += 1
+
+    def record_failure(self, node_type: str, node: str, error) -> None:
+        with self._lock:
+            st = self._get((node_type, node))
+            st.failures += 1
+            st.failed += 1
+            st.last_error = str(error)[:200]
+            if st.state == HALF_OPEN or st.failures >= self.failure_threshold:
+                st.state = OPEN
+                st.opened_at = time.monotonic()
+
+    def timeouts(self, node_type: str, node: str) -> Tuple[float, float]:
+        """(connect_timeout, command_timeout): mỗi loại = p95 của chính nó x hệ số, kẹp trong khoảng cấu hình."""
+        with self._lock:
+            st = self._nodes.get((node_type, node))
+            connect = list(st.connect) if st is not None else []
+            command = list(st.command) if st is not None else []
+        return (
+            _adaptive(connect, NODE_CONNECT_TIMEOUT_DEFAULT, NODE_CONNECT_TIMEOUT),
+            _adaptive(command, NODE_COMMAND_TIMEOUT_DEFAULT, NODE_COMMAND_TIMEOUT),
+        )
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        nodes = []
+        with self._lock:
+            items = [(k, st, sorted(st.latencies), list(st.connect), list(st.command)) for k, st in self._nodes.items()]
+        for (node_type, node), st, samples, connect, command in sorted(items, key=lambda x: x[0]):
+            nodes.append({
+                "type": node_type,
+                "node": node,
+                "state": st.state,
+                "consecutive_failures": st.failures,
+                "ok": st.ok,
+                "failed": st.failed,
+                "skipped": st.skipped,
+                "p50_s": round(_percentile(samples, 0.5), 3) if samples else None,
+                "p95_s": round(_percentile(samples, 0.95), 3) if samples else None,
+                "timeouts_s": [round(_adaptive(connect, NODE_CONNECT_TIMEOUT_DEFAULT, NODE_CONNECT_TIMEOUT), 1),
+                               round(_adaptive(command, NODE_COMMAND_TIMEOUT_DEFAULT, NODE_COMMAND_TIMEOUT), 1)],
+                "reopen_in_s": round(max(0.0, self.cooldown - (now - st.opened_at)), 1) if st.state == OPEN else None,
+                "last_ok": st.last_ok,
+                "last_error": st.last_error,
+            })
+        return {
+            "open": [f"{n['type']}/{n['node']}" for n in nodes if n["state"] != CLOSED],
+            "nodes": nodes,
+        }
+
+
+# Trạng thái dùng chung cho các job MME/PGW/SBG
+NODE_HEALTH = NodeHealth()
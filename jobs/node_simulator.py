@@ -0,0 +1,335 @@
+# jobs/node_simulator.py
+"""
+Giả lập N node (MME/PGW/SBG) bằng paramiko server chạy local, để thử
+CollectorEngine mà không cần thiết bị thật.
+
+    SSH_PORT=2222 python -m jobs.node_simulator --nodes 200 --latency 0.3
+
+Mỗi node nghe trên 1 IP loopback riêng (127.1.0.1, 127.1.0.2, ...) cùng port SSH_PORT:
+  - shell: prompt '#', trả output giả của pdc_kpi.pl (MME)
+  - SFTP: qua subsystem 'sftp' (PGW) hoặc exec 'sudo ... sftp-server' (SBG),
+    đọc file giả trong thư mục tạm của từng node
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import logging
+import os
+import selectors
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import paramiko
+
+from config import SSH_PORT, DIRPATH
+from jobs.module_PGWE import PGW_KPI_DEFS, PGW_KPI_FILE
+from jobs.module_SBG import SBG_HEADER_LINE
+
+SIM_USER = "sim"
+SIM_PASSWORD = "sim"
+SIM_MME_KPIS = ["attach_lte", "paging_lte", "bearer_establishment_lte", "attach_wcdma", "paging_wcdma"]
+
+
+# ----------------- Dữ liệu giả -----------------
+def _mme_kpi_output(now: datetime, extra_lines: int = 0) -> str:
+    # extra_lines: dòng counter không thuộc KPI list (output dài như node thật)
+    lines = [f"Day: {now.day}", f"Time: {now:%H:%M}"]
+    lines += [f"counter_{i:05d}: {i % 997}" for i in range(extra_lines)]
+    lines += [f"{kpi}: {0.1 * (i + 1):.2f}%" for i, kpi in enumerate(SIM_MME_KPIS)]
+    return "\r\n".join(lines)
+
+
+def _mme_qci_output() -> str:
+    return "\r\n".join([
+        "  1   1200   1195   0.15%   0.42%",
+        "  5   8800   8790   0.11%   0.08%",
+        "  9  12000  11990   0.08%   0.05%",
+    ])
+
+
+def _write_pgw_csv(path: str, now: datetime, rows: int = 6) -> None:
+    counters = [c for pair in PGW_KPI_DEFS.values() for c in pair]
+    start = now.replace(second=0, microsecond=0) - timedelta(minutes=5 * (rows - 1))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("pm_job_epg-kpi\n")
+        f.write("|".join(["time"] + counters) + "\n")
+        for r in range(rows):
+            ts = (start + timedelta(minutes=5 * r)).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+            # completed = 99% attempted
+            values = []
+            for _ in PGW_KPI_DEFS:
+                attempted = 1000 * (r + 1)
+                values += [str(attempted * 99 // 100), str(attempted)]
+            f.write("|".join([ts] + values) + "\n")
+
+
+def _write_sbg_log(path: str, now: datetime, blocks: int = 3, pmps: int = 8) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for b in range(blocks):
+            ts = (now - timedelta(minutes=5 * (blocks - 1 - b))).strftime("%Y-%m-%dT%H:%M:%S")
+            f.write(SBG_HEADER_LINE + "\n")
+            for p in range(pmps):
+                for ip_ver in ("IPv4", "IPv6"):
+                    fields = [ts, f"pmp{p}", "access", "sip", ip_ver, "500", "99.5", "120",
+                              "0", "0", "0", "0", "0", "98.7", "97.9"]
+                    f.write(",".join(fields) + "\n")
+
+
+# ----------------- SFTP -----------------
+class _SimHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+
+
+class _SimSFTP(paramiko.SFTPServerInterface):
+    """SFTP chỉ đọc, gốc là thư mục tạm của node (server.root)."""
+
+    def __init__(self, server, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = server.root
+
+    def _local(self, path):
+        return os.path.join(self.root, os.path.normpath("/" + path).lstrip("/"))
+
+    def list_folder(self, path):
+        local = self._local(path)
+        try:
+            out = []
+            for name in os.listdir(local):
+                attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(local, name)))
+                attr.filename = name
+                out.append(attr)
+            return out
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._local(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        try:
+            f = open(self._local(path), "rb")
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle = _SimHandle(flags)
+        handle.readfile = f
+        handle.filename = path
+        return handle
+
+
+# ----------------- SSH server -----------------
+class _SimServer(paramiko.ServerInterface):
+    def __init__(self, node, latency: float = 0.0, extra_lines: int = 0):
+        self.node = node
+        self.root = node["root"]
+        self.latency = latency
+        self.extra_lines = extra_lines
+
+    def check_auth_password(self, username, password):
+        if username == SIM_USER and password == SIM_PASSWORD:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED_OPEN_REQUEST
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        threading.Thread(target=self._shell, args=(channel,), daemon=True).start()
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        if b"sftp-server" not in command:
+            return False
+        # SBG: SFTP chạy qua exec 'sudo su -c sftp-server'
+        paramiko.SFTPServer(channel, "sftp", self, _SimSFTP).start()
+        return True
+
+    def _shell(self, channel):
+        prompt = f"\r\n{self.node['name']}# "
+        try:
+            channel.sendall(f"Welcome to {self.node['name']}{prompt}")
+            buf = ""
+            while True:
+                data = channel.recv(1024)
+                if not data:
+                    break
+                buf += data.decode("utf-8", errors="replace")
+                while "\n" in buf:
+                    cmd, buf = buf.split("\n", 1)
+                    cmd = cmd.strip()
+                    if self.latency:
+                        time.sleep(self.latency)
+                    # nhiều lệnh nối bằng ';' (batch có sentinel) -> output nối tiếp, 1 prompt
+                    out = "".join(self._run_command(part.strip()) for part in cmd.split(";"))
+                    channel.sendall(f"{cmd}\r\n{out}{prompt}")
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            channel.close()
+
+    def _run_command(self, cmd: str) -> str:
+        if cmd.startswith("pdc_kpi.pl -q"):
+            return _mme_qci_output()
+        if cmd.startswith("pdc_kpi.pl"):
+            return _mme_kpi_output(datetime.now(), self.extra_lines)
+        if cmd.startswith("printf '\\n%s\\n' "):
+            return f"\r\n{cmd.split()[-1]}\r\n"
+        return ""
+
+
+class NodeSimulator:
+    """N node giả trên 127.1.0.x:port; start()/stop(), danh sách node ở self.nodes."""
+
+    def __init__(self, n_nodes: int, port: int = SSH_PORT, latency: float = 0.0,
+                 base_ip: str = "127.1.0.1", extra_lines: int = 0):
+        self.port = port
+        self.latency = latency
+        self.extra_lines = extra_lines
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.workdir = tempfile.mkdtemp(prefix="dbnoc_sim_")
+        base = ipaddress.IPv4Address(base_ip)
+        now = datetime.now(timezone.utc)
+        self.nodes = []
+        for i in range(n_nodes):
+            name = f"SIM{i:04d}"
+            root = os.path.join(self.workdir, name)
+            pgw_path = os.path.join(root, PGW_KPI_FILE.lstrip("/"))
+            sbg_dir = os.path.join(root, DIRPATH.lstrip("/"))
+            os.makedirs(os.path.dirname(pgw_path), exist_ok=True)
+            os.makedirs(sbg_dir, exist_ok=True)
+            _write_pgw_csv(pgw_path, now)
+            _write_sbg_log(os.path.join(sbg_dir, "sbgKPIsLog_001.log"), now)
+            self.nodes.append({"name": name, "ip": str(base + i), "root": root})
+        self._by_ip = {n["ip"]: n for n in self.nodes}
+        self._sel = selectors.DefaultSelector()
+        self._stop = threading.Event()
+        self._thread = None
+        self._transports = []
+
+    def rows(self, type_filter: str):
+        """Dòng giống config_node_schedule cho worker tương ứng."""
+        if type_filter == "PGW":
+            return [(n["name"], n["ip"], SIM_USER, SIM_PASSWORD, type_filter) for n in self.nodes]
+        return [(n["name"], n["ip"], SIM_USER, SIM_PASSWORD, "", type_filter) for n in self.nodes]
+
+    def start(self) -> "NodeSimulator":
+        for node in self.nodes:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind((node["ip"], self.port))
+            sock.listen(64)
+            sock.setblocking(False)
+            self._sel.register(sock, selectors.EVENT_READ, node)
+        self._thread = threading.Thread(target=self._accept_loop, name="node-sim", daemon=True)
+        self._thread.start()
+        return self
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            for key, _ in self._sel.select(timeout=0.2):
+                try:
+                    conn, _ = key.fileobj.accept()
+                except OSError:
+                    continue
+                conn.setblocking(True)
+                t = paramiko.Transport(conn)
+                t.add_server_key(self.host_key)
+                t.set_subsystem_handler("sftp", paramiko.SFTPServer, _SimSFTP)
+                # có event -> không chờ bắt tay xong, accept tiếp node khác
+                t.start_server(event=threading.Event(), server=_SimServer(key.data, self.latency, self.extra_lines))
+                self._transports.append(t)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        for key in list(self._sel.get_map().values()):
+            self._sel.unregister(key.fileobj)
+            key.fileobj.close()
+        for t in self._transports:
+            t.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+# ----------------- Chạy thử engine -----------------
+async def _collect(engine, sim, type_filter, dead=0):
+    from jobs.ssh_module import Kpi_MME
+    from jobs.module_PGWE import KPI_PGW
+    from jobs.module_SBG import Kpi_SBG_run
+    from jobs.node_health import NODE_HEALTH, CircuitOpen
+
+    def timeouts(row):
+        return NODE_HEALTH.timeouts(type_filter, row[0])
+
+    tasks = {
+        "MME": lambda row: Kpi_MME(row[0], row[1], row[2], row[3], SIM_MME_KPIS, None, *timeouts(row)),
+        "PGW": lambda row: KPI_PGW(row[0], row[1], row[2], row[3], PGW_KPI_FILE, None, *timeouts(row)),
+        "SBG": lambda row: Kpi_SBG_run(row[0], row[1], row[2], row[3], port=sim.port,
+                                       connect_timeout=timeouts(row)[0], timeout=timeouts(row)[1]),
+    }
+    # node chết: IP không có gì lắng nghe -> kết nối bị từ chối
+    rows = sim.rows(type_filter) + [
+        (f"DEAD{i:03d}", f"127.2.0.{i + 1}", SIM_USER, SIM_PASSWORD, "", type_filter) for i in range(dead)
+    ]
+    started = time.perf_counter()
+    results = await engine.run_nodes(rows, tasks[type_filter], node_type=type_filter)
+    elapsed = time.perf_counter() - started
+    skipped = sum(isinstance(r, CircuitOpen) for r in results)
+    errors = [r for r in results if isinstance(r, BaseException) and not isinstance(r, CircuitOpen)]
+    records = sum(len(r) for r in results if not isinstance(r, BaseException))
+    print(f"[{type_filter}] nodes={len(results)} records={records} errors={len(errors)} skipped={skipped} "
+          f"⏱ {elapsed:.2f}s ({len(results) / elapsed:,.1f} node/s)")
+    if errors:
+        print(f"   lỗi đầu tiên: {errors[0]!r}")
+
+
+async def _main(args):
+    from jobs.collector_engine import CollectorEngine
+    from jobs.ssh_pool import SSH_POOL
+    from jobs.parse_pool import shutdown_parse_pool
+
+    sim = NodeSimulator(args.nodes, port=args.port, latency=args.latency,
+                        extra_lines=args.extra_lines).start()
+    engine = CollectorEngine(max_concurrency=args.concurrency)
+    try:
+        for type_filter in args.types:
+            for _ in range(args.cycles):
+                await _collect(engine, sim, type_filter, args.dead)
+    finally:
+        SSH_POOL.close_all()
+        engine.shutdown()
+        shutdown_parse_pool()
+        sim.stop()
+
+
+if __name__ == "__main__":
+    # client đóng kết nối trước -> transport server log 'Connection reset', bỏ qua
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    parser = argparse.ArgumentParser(description="Giả lập N node và chạy CollectorEngine")
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--port", type=int, default=SSH_PORT, help="Phải trùng SSH_PORT của collector")
+    parser.add_argument("--latency", type=float, default=0.0, help="Trễ mỗi lệnh shell (giây)")
+    parser.add_argument("--extra-lines", type=int, default=0, help="Thêm N dòng vào output pdc_kpi.pl")
+    parser.add_argument("--concurrency", type=int, default=128)
+    parser.add_argument("--dead", type=int, default=0, help="Thêm N node không kết nối được (thử circuit breaker)")
+    parser.add_argument("--cycles", type=int, default=2, help="Số chu kỳ mỗi loại (chu kỳ 2 dùng lại shell MME)")
+    parser.add_argument("--types", nargs="+", default=["MME", "PGW", "SBG"], choices=["MME", "PGW", "SBG"])
+    asyncio.run(_main(parser.parse_args()))
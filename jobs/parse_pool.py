@@ -0,0 +1,101 @@
+# jobs/parse_pool.py
+
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable
+
+from config import PARSE_POOL_WORKERS, PARSE_POOL_MIN_BYTES
+
+
+def _mp_context():
+    # không fork process đang có nhiều thread (paramiko, engine) -> forkserver / spawn
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+class ParsePool:
+    """
+    Tầng parse CPU-bound chạy ở process riêng: thread I/O gửi payload thô (bytes)
+    + tham số nhỏ, nhận lại kết quả gọn (aggregate / mảng numpy / KpiRecord).
+    - Payload < min_bytes (hoặc max_workers = 0): parse ngay trong thread gọi,
+      vì chi phí pickle + IPC lớn hơn phần parse.
+    - Số payload đang chờ bị chặn (2 x số process): thread gọi đứng chờ (không giữ GIL)
+      thay vì dồn hàng đợi không giới hạn.
+    - Pool hỏng (process con chết) -> tạo lại lần sau, lần này parse trong thread.
+    fn phải là hàm cấp module (pickle được), dạng fn(payload: bytes, *args).
+    """
+
+    def __init__(self, max_workers: int = PARSE_POOL_WORKERS, min_bytes: int = PARSE_POOL_MIN_BYTES):
+        self.max_workers = max(0, int(max_workers))
+        self.min_bytes = min_bytes
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, 2 * self.max_workers))
+        self.inline = 0
+        self.offloaded = 0
+        self.fallbacks = 0
+        self.bytes_offloaded = 0
+        self.wait_seconds = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_mp_context())
+            return self._executor
+
+    def _reset(self, broken) -> None:
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+                self.fallbacks += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, fn: Callable, payload: bytes, *args):
+        if self.max_workers == 0 or len(payload) < self.min_bytes:
+            with self._lock:
+                self.inline += 1
+            return fn(payload, *args)
+
+        started = time.monotonic()
+        with self._slots:
+            executor = self._get_executor()
+            try:
+                result = executor.submit(fn, payload, *args).result()
+            except BrokenProcessPool:
+                self._reset(executor)
+                return fn(payload, *args)
+        with self._lock:
+            self.offloaded += 1
+            self.bytes_offloaded += len(payload)
+            self.wait_seconds += time.monotonic() - started
+        return result
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "min_bytes": self.min_bytes,
+                "running": self._executor is not None,
+                "inline": self.inline,
+                "offloaded": self.offloaded,
+                "fallbacks": self.fallbacks,
+                "bytes_offloaded": self.bytes_offloaded,
+                "avg_offload_ms": round(self.wait_seconds / self.offloaded * 1000, 2) if self.offloaded else None,
+            }
+
+
+# Pool dùng chung cho MME/PGW/SBG (process con tạo khi có payload lớn đầu tiên)
+PARSE_POOL = ParsePool()
+
+
+def shutdown_parse_pool() -> None:
+    PARSE_POOL.shutdown()
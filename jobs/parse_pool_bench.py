@@ -0,0 +1,92 @@
+# jobs/parse_pool_bench.py
+# Benchmark thủ công: độ trễ của "request dashboard" trên event loop trong lúc N thread
+# collector parse block SBG lớn. So parse ngay trong thread (cách cũ, giành GIL với event loop)
+# với ParsePool (parse ở process riêng, thread chỉ chờ kết quả).
+# Request giả: mỗi 20 ms dựng + json.dumps 200 dòng (giống handler last_kpi nhỏ), đo thời gian
+# từ lúc đến hạn tới lúc xong (gồm cả thời gian chờ GIL).
+#   python -m jobs.parse_pool_bench [số block] [dòng/block] [threads] [workers]
+
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from jobs.module_SBG import SBG_HEADER_LINE
+from jobs.parse_pool import ParsePool
+from jobs.sbg_kpi_engine import parse_sbg_block
+from jobs.sbg_kpi_engine_bench import make_block
+
+REQUEST_EVERY = 0.02
+
+
+def make_payload(n_lines: int) -> bytes:
+    body = "\n".join(make_block(n_lines))
+    return f"{SBG_HEADER_LINE}\n{body}\n".encode("utf-8")
+
+
+def fake_request() -> str:
+    rows = [{"node": f"SBG{i % 20:02d}", "kpi": "RegRatioV4", "value": 99.5 + i % 7 * 0.01} for i in range(200)]
+    return json.dumps(rows)
+
+
+async def measure(pool: ParsePool, payloads, threads: int):
+    loop = asyncio.get_running_loop()
+    latencies = []
+    done = asyncio.Event()
+
+    async def dashboard():
+        due = loop.time()
+        while not done.is_set():
+            due += REQUEST_EVERY
+            await asyncio.sleep(max(0.0, due - loop.time()))
+            fake_request()
+            latencies.append(loop.time() - due)
+
+    probe = asyncio.create_task(dashboard())
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as ex:
+        results = await asyncio.gather(*(
+            loop.run_in_executor(ex, pool.run, parse_sbg_block, p) for p in payloads
+        ))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await probe
+    lat = np.array(latencies) * 1000
+    return results, elapsed, lat
+
+
+def report(label, elapsed, lat):
+    print(f"  {label:<14} cycle {elapsed * 1000:8.0f} ms | request p50 {np.percentile(lat, 50):6.1f} ms"
+          f"  p99 {np.percentile(lat, 99):6.1f} ms  max {lat.max():6.1f} ms  (n={len(lat)})")
+
+
+def main():
+    n_blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    n_lines = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 16
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+    payload = make_payload(n_lines)
+    payloads = [payload] * n_blocks
+    print(f"{n_blocks} block SBG x {n_lines:,} dòng ({len(payload) / 1e6:.1f} MB/block), "
+          f"{threads} thread collector, pool {workers} process")
+
+    inline = ParsePool(max_workers=0)
+    pooled = ParsePool(max_workers=workers, min_bytes=64 * 1024)
+    pooled.run(parse_sbg_block, payload)  # khởi động process con trước khi đo
+
+    try:
+        res_inline, t_inline, lat_inline = asyncio.run(measure(inline, payloads, threads))
+        report("trong thread", t_inline, lat_inline)
+        res_pool, t_pool, lat_pool = asyncio.run(measure(pooled, payloads, threads))
+        report("ParsePool", t_pool, lat_pool)
+        assert [r.agg for r in res_inline] == [r.agg for r in res_pool]
+        print(f"  kết quả giống nhau ✅  {pooled.stats()}")
+    finally:
+        pooled.shutdown()
+
+
+if __name__ == "__main__":
+    main()
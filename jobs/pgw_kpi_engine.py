@@ -0,0 +1,151 @@
+# jobs/pgw_kpi_engine.py
+
+import threading
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+# Counter 32-bit quay vòng: giá trị trước >= 2^31 mà giá trị sau nhỏ hơn -> cộng 2^32.
+# Giảm ở mức thấp hơn coi là reset (node/process khởi động lại): delta = giá trị sau.
+_WRAP32 = 1 << 32
+_WRAP32_FLOOR = 1 << 31
+
+
+class PgwPlan(NamedTuple):
+    """Header đã biên dịch: cột cần đọc + vị trí completed/attempted của từng KPI."""
+    kpi_names: Tuple[str, ...]
+    columns: np.ndarray        # index cột (trong dòng CSV) cần đọc, không trùng
+    completed: np.ndarray      # vị trí trong `columns` của counter completed theo KPI
+    attempted: np.ndarray      # vị trí trong `columns` của counter attempted theo KPI
+
+
+class PgwIntervals(NamedTuple):
+    """Giá trị từng khoảng: mảng (số khoảng x số KPI)."""
+    kpi_names: Tuple[str, ...]
+    times: List[str]           # mốc cuối của từng khoảng (cột 0 của dòng sau)
+    ratio: np.ndarray          # float64, completed/attempted * 100 (0 nếu attempted <= 0)
+    att: np.ndarray            # int64, số attempted trong khoảng
+    valid: np.ndarray          # bool, False nếu 1 trong 2 dòng thiếu/hỏng giá trị
+
+
+_plans: Dict[Tuple[int, int], PgwPlan] = {}
+_plans_lock = threading.Lock()
+
+
+def compile_header(header: str, kpi_defs: dict) -> PgwPlan:
+    """Map header -> PgwPlan, cache theo hash(header) + bộ KPI (header đổi -> biên dịch lại)."""
+    defs_key = tuple(kpi_defs.items())
+    key = (hash(header), hash(defs_key))
+    with _plans_lock:
+        plan = _plans.get(key)
+    if plan is not None:
+        return plan
+
+    col_of = {}
+    for i, name in enumerate(header.split("|")):
+        col_of.setdefault(name, i)
+    names, comp, att = [], [], []
+    for kpi_name, (completed_counter, attempted_counter) in defs_key:
+        if completed_counter in col_of and attempted_counter in col_of:
+            names.append(kpi_name)
+            comp.append(col_of[completed_counter])
+            att.append(col_of[attempted_counter])
+    columns = np.unique(np.asarray(comp + att, dtype=np.intp))
+    plan = PgwPlan(
+        tuple(names),
+        columns,
+        np.searchsorted(columns, np.asarray(comp, dtype=np.intp)),
+        np.searchsorted(columns, np.asarray(att, dtype=np.intp)),
+    )
+    with _plans_lock:
+        if len(_plans) > 256:
+            _plans.clear()
+        _plans[key] = plan
+    return plan
+
+
+def load_matrix(plan: PgwPlan, lines: Sequence[str]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    Các dòng CSV -> (times, ma trận int64 [dòng x cột cần đọc], mask hợp lệ).
+    Chỉ các ô hỏng mới đi đường chậm (int() từng ô).
+    """
+    cols = plan.columns.tolist()
+    need = (cols[-1] + 1) if cols else 0
+    times, cells, short = [], [], []
+    for ln in lines:
+        parts = ln.split("|")
+        times.append(parts[0])
+        if len(parts) < need:
+            short.append(len(times) - 1)
+            cells.append(["0"] * len(cols))
+        else:
+            cells.append([parts[c] for c in cols])
+
+    if not cells:
+        return times, np.empty((0, len(cols)), dtype=np.int64), np.empty((0, len(cols)), dtype=bool)
+    raw = np.asarray(cells)
+    valid = np.ones(raw.shape, dtype=bool)
+    try:
+        matrix = raw.astype(np.int64)
+    except ValueError:
+        matrix = np.zeros(raw.shape, dtype=np.int64)
+        for (r, c), cell in np.ndenumerate(raw):
+            try:
+                matrix[r, c] = int(cell)
+            except ValueError:
+                valid[r, c] = False
+    if short:
+        valid[short, :] = False
+    return times, matrix, valid
+
+
+def counter_delta(prev: np.ndarray, curr: np.ndarray) -> np.ndarray:
+    """curr - prev, xử lý quay vòng 32-bit và reset counter."""
+    delta = curr - prev
+    neg = delta < 0
+    if neg.any():
+        wrap = neg & (prev >= _WRAP32_FLOOR) & (prev < _WRAP32)
+        delta = np.where(wrap, delta + _WRAP32, delta)
+        delta = np.where(neg & ~wrap, curr, delta)
+    return delta
+
+
+def compute_intervals(header: str, lines: Sequence[str], kpi_defs: dict) -> PgwIntervals:
+    """Delta + ratio cho mọi KPI và mọi cặp dòng liên tiếp, tính 1 lần bằng numpy."""
+    plan = compile_header(header, kpi_defs)
+    times, matrix, valid = load_matrix(plan, lines)
+    k = len(plan.kpi_names)
+    if len(times) < 2 or k == 0:
+        empty = np.empty((0, k))
+        return PgwIntervals(plan.kpi_names, [], empty, empty.astype(np.int64), empty.astype(bool))
+
+    completed = matrix[:, plan.completed]
+    attempted = matrix[:, plan.attempted]
+    ok = valid[:, plan.completed] & valid[:, plan.attempted]
+
+    d_completed = counter_delta(completed[:-1], completed[1:])
+    d_attempted = counter_delta(attempted[:-1], attempted[1:])
+    positive = d_attempted > 0
+    ratio = np.where(positive, d_completed * 100.0 / np.where(positive, d_attempted, 1), 0.0)
+    return PgwIntervals(plan.kpi_names, times[1:], ratio, d_attempted, ok[:-1] & ok[1:])
+
+
+def compute_intervals_bytes(raw: bytes, header: str, kpi_defs: dict) -> PgwIntervals:
+    """Như compute_intervals nhưng nhận các dòng dạng bytes ('\\n' nối); chạy được trong ParsePool."""
+    return compute_intervals(header, raw.decode("utf-8", errors="replace").split("\n") if raw else [], kpi_defs)
+
+
+def window_average(iv: PgwIntervals) -> Tuple[str, List[Tuple[str, float]]]:
+    """
+    Trung bình các khoảng hợp lệ theo KPI, gắn vào mốc cuối (như cách tính live cũ).
+    Trả về (mốc cuối, [(kpi_name, ratio làm tròn 2 số)]).
+    """
+    if not iv.times:
+        return "", []
+    count = iv.valid.sum(axis=0)
+    total = np.where(iv.valid, iv.ratio, 0.0).sum(axis=0)
+    out = [
+        (name, round(float(total[j] / count[j]), 2))
+        for j, name in enumerate(iv.kpi_names) if count[j] > 0
+    ]
+    return iv.times[-1], out
@@ -0,0 +1,175 @@
+# jobs/sbg_dir_index.py
+
+import re
+import threading
+from stat import S_ISREG
+from typing import Dict, Optional, Tuple
+
+import paramiko
+
+_DIGITS = re.compile(r"(\d+)")
+
+
+def name_key(name: str) -> tuple:
+    """Khoá sort tự nhiên: 'sbgKPIsLog_9' < 'sbgKPIsLog_10'."""
+    return tuple(int(p) if p.isdigit() else p for p in _DIGITS.split(name))
+
+
+def next_name(name: str) -> Optional[str]:
+    """Tên file kế tiếp: tăng nhóm số cuối, giữ số chữ số ('log_009' -> 'log_010'); không có số -> None."""
+    parts = _DIGITS.split(name)
+    if len(parts) < 3:
+        return None
+    i = len(parts) - 2  # nhóm số cuối (split có group -> số ở vị trí lẻ)
+    parts[i] = str(int(parts[i]) + 1).zfill(len(parts[i]))
+    return "".join(parts)
+
+
+class _Active:
+    __slots__ = ("path", "name", "size", "mtime", "name_ordered")
+
+    def __init__(self, path, name, size, mtime, name_ordered):
+        self.path = path
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.name_ordered = name_ordered
+
+
+class DirIndex:
+    """
+    Nhớ file đang ghi (active) trong thư mục log của từng node.
+    - Mỗi chu kỳ chỉ stat file active; file còn lớn lên -> dùng luôn, không list thư mục.
+    - File đứng yên / bị đổi tên / nhỏ đi (rotate) -> list lại thư mục.
+    - Tên file tăng theo thời gian (phát hiện ở lần list trước): stat thẳng tên kế tiếp
+      (next_name, đi tiếp tối đa MAX_FOLLOW tên) thay vì list thư mục; không có -> list lại.
+    - List lại bằng listdir_iter (gửi trước nhiều READDIR), không dựng list attr.
+      Tên tăng dần: chỉ xét tên >= file active hiện tại; nếu không thì chọn theo
+      (mtime, size) như cũ.
+    """
+
+    MAX_FOLLOW = 16
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], _Active] = {}
+        self._lock = threading.Lock()
+        self.stat_hits = 0
+        self.relists = 0
+        self.next_hits = 0
+        self.rotations = 0
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            setattr(self, kind, getattr(self, kind) + 1)
+
+    def newest(self, sftp: paramiko.SFTPClient, node: str, dirpath: str):
+        """(fullpath, attr) của file mới nhất trong dirpath, hoặc (None, None)."""
+        key = (node, dirpath)
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is not None:
+            try:
+                attr = sftp.stat(entry.path)
+            except IOError:
+                attr = None  # file active đã bị đổi tên / xoá
+            if attr is not None and S_ISREG(attr.st_mode) and attr.st_size > entry.size:
+                entry.size, entry.mtime = attr.st_size, attr.st_mtime
+                self._count("stat_hits")
+                return entry.path, attr
+            if attr is None or attr.st_size < entry.size:
+                self._count("rotations")
+
+        if entry is not None and entry.name_ordered:
+            found = self._stat_next(sftp, dirpath.rstrip('/'), entry.name)
+            if found is not None:
+                path, name, attr = found
+                with self._lock:
+                    self._entries[key] = _Active(path, name, attr.st_size, attr.st_mtime, True)
+                self._count("next_hits")
+                return path, attr
+
+        return self._relist(sftp, key, dirpath, entry)
+
+    def _stat_next(self, sftp, base: str, name: str):
+        """
+        Stat các tên kế tiếp của file active: (path, name, attr) của tên cuối cùng tồn tại,
+        None nếu tên kế tiếp không có (hoặc đi quá MAX_FOLLOW tên -> để list lại cho chắc).
+        """
+        found = None
+        for _ in range(self.MAX_FOLLOW):
+            name = next_name(name)
+            if name is None:
+                break
+            try:
+                attr = sftp.stat(f"{base}/{name}")
+            except IOError:
+                break
+            if not S_ISREG(attr.st_mode):
+                break
+            found = (f"{base}/{name}", name, attr)
+        else:
+            return None
+        return found
+
+    def _relist(self, sftp, key, dirpath, entry: Optional[_Active]):
+        self._count("relists")
+        base = dirpath.rstrip('/')
+        by_time = by_name = None
+        floor = name_key(entry.name) if entry is not None and entry.name_ordered else None
+        for attr in sftp.listdir_iter(dirpath):
+            if not S_ISREG(attr.st_mode):
+                continue
+            if floor is not None:
+                k = name_key(attr.filename)
+                if k >= floor and (by_name is None or k > by_name[0]):
+                    by_name = (k, attr)
+                continue
+            if (by_time is None
+                or attr.st_mtime > by_time.st_mtime
+                or (attr.st_mtime == by_time.st_mtime and attr.st_size > by_time.st_size)):
+                by_time = attr
+            k = name_key(attr.filename)
+            if by_name is None or k > by_name[0]:
+                by_name = (k, attr)
+
+        if floor is not None:
+            if by_name is None:
+                # file active biến mất mà không có tên mới hơn -> bỏ fast path, list lại đủ
+                with self._lock:
+                    self._entries.pop(key, None)
+                return self._relist(sftp, key, dirpath, None)
+            latest = by_name[1]
+            name_ordered = True
+        else:
+            if by_time is None:
+                with self._lock:
+                    self._entries.pop(key, None)
+                return None, None
+            latest = by_time
+            # tên lớn nhất cũng là file mới nhất -> lần sau chọn theo tên
+            name_ordered = by_name[1].filename == by_time.filename
+
+        path = f"{base}/{latest.filename}"
+        with self._lock:
+            self._entries[key] = _Active(path, latest.filename, latest.st_size, latest.st_mtime, name_ordered)
+        return path, latest
+
+    def forget(self, node: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == node]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "nodes": len(self._entries),
+                "stat_hits": self.stat_hits,
+                "relists": self.relists,
+                "next_hits": self.next_hits,
+                "rotations": self.rotations,
+            }
+
+
+# Index dùng chung cho các job SBG
+SBG_DIR_INDEX = DirIndex()
@@ -0,0 +1,182 @@
+# jobs/sbg_kpi_engine.py
+
+import csv
+import io
+import operator
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:  # đường nhanh (C++, nhả GIL); không có thì dùng read_csv engine C của pandas
+    import pyarrow as pa
+    import pyarrow.compute as pa_compute
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+# Cột dùng trong dòng 'IPv...access' của sbgKPIsLog
+COL_IP, COL_SUB, COL_RATIO, COL_INIT_REG, COL_INC, COL_OUT = 4, 5, 6, 7, 13, 14
+_USECOLS = [COL_IP, COL_SUB, COL_RATIO, COL_INIT_REG, COL_INC, COL_OUT]
+_MIN_FIELDS = COL_OUT + 1
+_count_commas = operator.methodcaller("count", ",")
+
+
+class SbgGroup(NamedTuple):
+    """Tổng hợp 1 nhóm (IPv4 / IPv6 / tất cả)."""
+    sub: int
+    init_reg_time: float
+    reg_ratio: float       # trung bình, 0.0 nếu nhóm rỗng
+    inc_session: float
+    out_session: float
+
+
+class SbgAggregates(NamedTuple):
+    ipv4: SbgGroup
+    ipv6: SbgGroup
+    total: SbgGroup
+    bad_lines: List[int]   # index dòng không parse được (để log cảnh báo)
+
+
+def _seq_sum(values: np.ndarray) -> float:
+    # cộng tuần tự (cumsum) -> kết quả trùng sum() của Python theo đúng thứ tự dòng
+    return float(np.cumsum(values)[-1]) if len(values) else 0.0
+
+
+def _group(sub, init_reg, ratio, inc, out, mask) -> SbgGroup:
+    n = int(mask.sum())
+    if n == 0:
+        return SbgGroup(0, 0.0, 0.0, 0.0, 0.0)
+    return SbgGroup(
+        int(sub[mask].sum()),
+        _seq_sum(init_reg[mask]),
+        _seq_sum(ratio[mask]) / n,
+        _seq_sum(inc[mask]) / n,
+        _seq_sum(out[mask]) / n,
+    )
+
+
+def _numeric(col: pd.Series) -> np.ndarray:
+    # giống `float(field.strip() or 0)`: rỗng -> 0, hỏng -> NaN
+    col = col.str.strip()
+    return pd.to_numeric(col.mask(col == "", "0"), errors="coerce").to_numpy(dtype=np.float64)
+
+
+def _read_block(text: str, width: int) -> Tuple[np.ndarray, Dict[int, np.ndarray]]:
+    """
+    -> (cột ipVersion, {cột số: float64}); ô hỏng = NaN.
+    Đường nhanh: read_csv đổi số ngay trong C (ô rỗng -> 0). Có ô hỏng thì read_csv
+    báo ValueError -> đọc lại dạng chuỗi và đổi từng cột (chỉ gặp khi log lỗi).
+    """
+    kwargs = dict(header=None, names=range(width), usecols=_USECOLS, keep_default_na=False,
+                  quoting=csv.QUOTE_NONE, skip_blank_lines=False, engine="c")
+    try:
+        df = pd.read_csv(
+            io.StringIO(text),
+            dtype={c: (object if c == COL_IP else np.float64) for c in _USECOLS},
+            na_values=[""], skipinitialspace=True, **kwargs,
+        )
+        nums = {c: np.nan_to_num(df[c].to_numpy(dtype=np.float64), nan=0.0) for c in _USECOLS if c != COL_IP}
+    except ValueError:
+        df = pd.read_csv(io.StringIO(text), dtype=str, **kwargs)
+        nums = {c: _numeric(df[c]) for c in _USECOLS if c != COL_IP}
+    ip = df[COL_IP].astype(str).str.strip().to_numpy()
+    return ip, nums
+
+
+def _read_uniform(text: str, width: int) -> Tuple[np.ndarray, Dict[int, np.ndarray]]:
+    """
+    Block mà mọi dòng có cùng số trường: parse bằng pyarrow.csv (1 thread, nhả GIL
+    nên nhiều node SBG parse song song được). Ô hỏng -> ArrowInvalid (ValueError).
+    """
+    names = [f"c{i}" for i in range(width)]
+    use = [f"c{c}" for c in _USECOLS]
+    table = pa_csv.read_csv(
+        io.BytesIO(text.encode("utf-8")),
+        read_options=pa_csv.ReadOptions(column_names=names, use_threads=False),
+        parse_options=pa_csv.ParseOptions(quote_char=False),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=use,
+            column_types={f"c{c}": pa.float64() for c in _USECOLS if c != COL_IP},
+            null_values=[""],
+            strings_can_be_null=False,
+        ),
+    )
+    nums = {
+        c: np.nan_to_num(table[f"c{c}"].to_numpy(), nan=0.0)
+        for c in _USECOLS if c != COL_IP
+    }
+    ip = pa_compute.utf8_trim_whitespace(table[f"c{COL_IP}"]).to_numpy(zero_copy_only=False)
+    return ip, nums
+
+
+def aggregate_lines(lines: Sequence[str], skip_if_all_ratios_zero: bool = True) -> SbgAggregates:
+    """
+    Parse các dòng của 1 block bằng CSV reader viết bằng C (pyarrow nếu block đều
+    số trường, không thì read_csv engine C) rồi tổng hợp bằng mask numpy.
+    Quy tắc giống bản cũ: bỏ dòng < 15 trường, dòng hỏng, numSub == 0,
+    và (tuỳ chọn) dòng có cả 3 ratio = 0.
+    """
+    empty = SbgGroup(0, 0.0, 0.0, 0.0, 0.0)
+    if not lines:
+        return SbgAggregates(empty, empty, empty, [])
+
+    n_fields = np.fromiter(map(_count_commas, lines), dtype=np.int64, count=len(lines)) + 1
+    enough = n_fields >= _MIN_FIELDS
+    if not enough.any():
+        return SbgAggregates(empty, empty, empty, [])
+    width = int(n_fields.max())
+
+    ip = nums = None
+    if pa is not None and int(n_fields[enough].min()) == width:
+        rows = np.flatnonzero(enough)
+        text = "\n".join(lines) if len(rows) == len(lines) else "\n".join([lines[i] for i in rows])
+        try:
+            ip_r, nums_r = _read_uniform(text, width)
+        except ValueError:
+            pass  # có ô hỏng -> đọc lại bằng pandas để biết dòng nào
+        else:
+            ip = np.full(len(lines), "", dtype=object)
+            ip[rows] = ip_r
+            nums = {}
+            for c, values in nums_r.items():
+                nums[c] = np.zeros(len(lines))
+                nums[c][rows] = values
+    if ip is None:
+        ip, nums = _read_block("\n".join(lines), width)
+    # dòng thiếu trường: read_csv điền rỗng nên lọc theo số dấu phẩy (enough)
+    sub_f, ratio, init_reg = nums[COL_SUB], nums[COL_RATIO], nums[COL_INIT_REG]
+    inc, out = nums[COL_INC], nums[COL_OUT]
+    parsed = ~(np.isnan(sub_f) | np.isnan(ratio) | np.isnan(init_reg) | np.isnan(inc) | np.isnan(out))
+    bad = enough & ~parsed
+    sub = np.where(parsed, np.trunc(np.nan_to_num(sub_f)), 0).astype(np.int64)
+
+    keep = enough & parsed & (sub != 0)
+    if skip_if_all_ratios_zero:
+        keep &= ~((ratio == 0) & (inc == 0) & (out == 0))
+
+    return SbgAggregates(
+        _group(sub, init_reg, ratio, inc, out, keep & (ip == "IPv4")),
+        _group(sub, init_reg, ratio, inc, out, keep & (ip == "IPv6")),
+        _group(sub, init_reg, ratio, inc, out, keep),
+        np.flatnonzero(bad).tolist(),
+    )
+
+
+class SbgBlock(NamedTuple):
+    """Kết quả parse 1 block thô (gửi về từ ParsePool)."""
+    agg: SbgAggregates
+    bad_lines: List[str]   # nội dung các dòng hỏng (để log cảnh báo ở process chính)
+    n_lines: int           # số dòng 'IPv...access'
+
+
+def kpi_lines(text: str) -> List[str]:
+    """Các dòng 'IPv...access' của 1 block sbgKPIsLog."""
+    return [line.strip() for line in text.split("\n") if 'IPv' in line and 'access' in line]
+
+
+def parse_sbg_block(raw: bytes, skip_if_all_ratios_zero: bool = True) -> SbgBlock:
+    """Block thô (bytes, từ header cuối tới EOF) -> SbgBlock; chạy được trong ParsePool."""
+    lines = kpi_lines(raw.decode("utf-8", errors="replace"))
+    agg = aggregate_lines(lines, skip_if_all_ratios_zero)
+    return SbgBlock(agg, [lines[i] for i in agg.bad_lines], len(lines))
@@ -0,0 +1,98 @@
+# jobs/sbg_kpi_engine_bench.py
+# Benchmark thủ công 1 block sbgKPIsLog: parse/tổng hợp từng dòng bằng Python (cách cũ)
+# vs read_csv (engine C) + numpy (aggregate_lines). Chạy thêm N thread song song để
+# thấy ảnh hưởng của GIL khi nhiều node SBG xử lý cùng lúc.
+#   python -m jobs.sbg_kpi_engine_bench [lines] [threads]
+
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from jobs.sbg_kpi_engine import aggregate_lines
+
+
+def legacy_aggregate(lines, skip_if_all_ratios_zero=True):
+    """Vòng lặp cũ của analyze_sbg_lines (split + float từng ô, 9 list)."""
+    subIPv4 = subIPv6 = sub = 0
+    InitRegTimeIPv4 = InitRegTimeIPv6 = InitRegTime_ = 0
+    succRegisIPv4, IncSessionRateIv4, OutSessionRateIv4 = [], [], []
+    succRegisIPv6, IncSessionRateIv6, OutSessionRateIv6 = [], [], []
+    succRegis, IncSessionRate, OutSessionRate = [], [], []
+    for line in lines:
+        fields = [c.strip() for c in line.split(',')]
+        if len(fields) < 15:
+            continue
+        try:
+            ipVersion = fields[4]
+            numSub = int(float(fields[5] or 0))
+            InitRegTime = float(fields[7] or 0)
+            ratio = float(fields[6] or 0)
+            incRatio = float(fields[13] or 0)
+            outRatio = float(fields[14] or 0)
+            if numSub == 0:
+                continue
+            if skip_if_all_ratios_zero and (ratio == 0 and incRatio == 0 and outRatio == 0):
+                continue
+            if ipVersion == 'IPv4':
+                InitRegTimeIPv4 += InitRegTime
+                subIPv4 += numSub
+                succRegisIPv4.append(ratio)
+                IncSessionRateIv4.append(incRatio)
+                OutSessionRateIv4.append(outRatio)
+            elif ipVersion == 'IPv6':
+                InitRegTimeIPv6 += InitRegTime
+                subIPv6 += numSub
+                succRegisIPv6.append(ratio)
+                IncSessionRateIv6.append(incRatio)
+                OutSessionRateIv6.append(outRatio)
+            InitRegTime_ += InitRegTime
+            sub += numSub
+            succRegis.append(ratio)
+            IncSessionRate.append(incRatio)
+            OutSessionRate.append(outRatio)
+        except Exception:
+            pass
+    return subIPv4, subIPv6, sub, InitRegTime_
+
+
+def make_block(n: int):
+    rng = np.random.default_rng(0)
+    ip = np.where(rng.random(n) < 0.5, "IPv4", "IPv6")
+    sub = rng.integers(0, 2000, n)
+    ratio = rng.uniform(90, 100, (n, 4)).round(3)
+    return [
+        f"2025-01-01T00:00:00,pmp{i % 64},access,sip,{ip[i]},{sub[i]},{ratio[i, 0]},{ratio[i, 1]},"
+        f"0,0,0,0,0,{ratio[i, 2]},{ratio[i, 3]}"
+        for i in range(n)
+    ]
+
+
+def timed(fn, lines, threads):
+    started = time.perf_counter()
+    if threads <= 1:
+        out = fn(lines)
+    else:
+        with ThreadPoolExecutor(threads) as ex:
+            out = list(ex.map(fn, [lines] * threads))[0]
+    return out, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    lines = make_block(n)
+
+    old, t_old = timed(legacy_aggregate, lines, 1)
+    new, t_new = timed(aggregate_lines, lines, 1)
+    assert old == (new.ipv4.sub, new.ipv6.sub, new.total.sub, new.total.init_reg_time)
+    print(f"block {n:,} dòng")
+    print(f"  python     : {t_old * 1e3:8.1f} ms")
+    print(f"  read_csv+np: {t_new * 1e3:8.1f} ms   x{t_old / t_new:.1f}")
+
+    _, t_old = timed(legacy_aggregate, lines, threads)
+    _, t_new = timed(aggregate_lines, lines, threads)
+    print(f"{threads} thread x 1 block")
+    print(f"  python     : {t_old * 1e3:8.1f} ms")
+    print(f"  read_csv+np: {t_new * 1e3:8.1f} ms   x{t_old / t_new:.1f}")
@@ -0,0 +1,103 @@
+# jobs/sftp_reader.py
+
+from typing import Iterator, List, Tuple
+
+import paramiko
+
+CHUNK_SIZE = 65536
+MAX_WINDOW = 16  # tối đa 16 chunk / lần readv (1 MB với chunk 64 KB)
+
+
+class BackwardReader:
+    """
+    Đọc 1 file SFTP từ cuối về đầu theo block, dùng chung cho PGW và SBG.
+    - Mỗi lượt gửi 1 readv nhiều chunk (pipelined); số chunk tăng dần 1, 2, 4, ...
+      tới MAX_WINDOW nên file chỉ cần vài KB cuối vẫn chỉ tốn 1 round trip nhỏ.
+    - Block giữ trong list (không prepend vào bytearray), chỉ join 1 lần khi trả kết quả.
+    - Tìm delimiter vắt qua ranh giới 2 block bằng đoạn nối ngắn (len(needle) - 1 byte mỗi bên).
+    """
+
+    def __init__(self, f: paramiko.SFTPFile, size: int, chunk_size: int = CHUNK_SIZE,
+                 max_window: int = MAX_WINDOW, head: Tuple[int, int] = None):
+        self.f = f
+        self.size = size
+        self.chunk_size = chunk_size
+        self.max_window = max_window
+        self.blocks: List[bytes] = []   # block theo thứ tự đọc (cuối file trước)
+        self.pos = size                 # byte đầu của block đã đọc gần nhất
+        self.round_trips = 0
+        self.bytes_read = 0
+        self.head = b""
+        self._head_req = head           # (offset, length) đọc kèm lượt readv đầu tiên
+        self.limit = None               # không đọc quá bao nhiêu byte tính từ EOF
+
+    def _batches(self) -> Iterator[bytes]:
+        window = 1
+        while self.pos > 0:
+            chunks = []
+            pos = self.pos
+            for _ in range(window):
+                if pos <= 0 or (self.limit is not None and self.size - pos >= self.limit):
+                    break
+                rd = min(self.chunk_size, pos)
+                pos -= rd
+                chunks.append((pos, rd))
+            if not chunks:
+                return
+            reqs = list(chunks)
+            if self._head_req is not None:
+                reqs.append(self._head_req)
+            data = list(self.f.readv(reqs))
+            if self._head_req is not None:
+                self.head = data.pop()
+                self._head_req = None
+            self.round_trips += 1
+            for (offset, _), block in zip(chunks, data):
+                self.pos = offset
+                self.bytes_read += len(block)
+                self.blocks.append(block)
+                yield block
+            window = min(window * 2, self.max_window)
+
+    def tail_bytes(self, start: int) -> bytes:
+        """Bytes từ vị trí start (đã đọc) tới EOF, join 1 lần."""
+        data = b"".join(reversed(self.blocks))
+        return data[start - self.pos:]
+
+    def rfind(self, needle: bytes, max_scan_bytes: int = None) -> int:
+        """Vị trí (tuyệt đối) của needle cuối cùng trong file, -1 nếu không thấy trong max_scan_bytes."""
+        m = len(needle)
+        self.limit = max_scan_bytes
+        after = b""  # tối đa m - 1 byte ngay sau block hiện tại trong file
+        for block in self._batches():
+            start = self.pos
+            # needle vắt qua ranh giới (nằm sau mọi vị trí tìm thấy trong block)
+            if after and m > 1:
+                head = block[-(m - 1):]
+                sidx = (head + after).rfind(needle)
+                if sidx != -1:
+                    return start + len(block) - len(head) + sidx
+            idx = block.rfind(needle)
+            if idx != -1:
+                return start + idx
+            after = (block + after)[:m - 1] if len(block) < m - 1 else block[:m - 1]
+            if max_scan_bytes is not None and self.size - self.pos >= max_scan_bytes:
+                break
+        return -1
+
+    def last_lines(self, n: int) -> bytes:
+        """Đọc ngược tới khi đủ n ký tự xuống dòng, trả về đoạn bytes cuối file đó."""
+        count = 0
+        for block in self._batches():
+            count += block.count(b"\n")
+            if count >= n:
+                break
+        return self.tail_bytes(self.pos)
+
+
+def read_from_last(f: paramiko.SFTPFile, size: int, needle: bytes, chunk_size: int = CHUNK_SIZE,
+                   max_scan_bytes: int = None) -> bytes:
+    """Bytes từ needle cuối cùng tới EOF (b"" nếu không thấy), không đọc lại phần đã có."""
+    reader = BackwardReader(f, size, chunk_size)
+    idx = reader.rfind(needle, max_scan_bytes)
+    return reader.tail_bytes(idx) if idx != -1 else b""
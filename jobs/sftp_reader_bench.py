@@ -0,0 +1,101 @@
+# jobs/sftp_reader_bench.py
+# Benchmark thủ công: đọc ngược file lớn qua SFTP (server giả local của node_simulator).
+#   python -m jobs.sftp_reader_bench [MB]
+# So sánh cách cũ (seek+read từng chunk, prepend vào bytearray) với BackwardReader
+# (readv pipelined, block giữ trong list). Round trip = số lượt chờ server trả lời;
+# trên loopback chủ yếu thấy phần copy bộ nhớ, qua WAN phần round trip chiếm ưu thế.
+
+import logging
+import os
+import sys
+import time
+
+from jobs.module_SBG import SBG_HEADER_LINE
+from jobs.node_simulator import NodeSimulator, SIM_USER, SIM_PASSWORD
+from jobs.module_PGWE import SFTP_PGWE
+from jobs.sftp_reader import BackwardReader, read_from_last
+
+
+def legacy_read_from_last(f, size, needle, chunk_size=65536, max_scan_bytes=None):
+    """Cách cũ của Kpi_SBG: acc[:0] = block, đọc lại phần tail sau khi thấy header."""
+    pos, scanned, acc, trips = size, 0, bytearray(), 0
+    while pos > 0 and (max_scan_bytes is None or scanned < max_scan_bytes):
+        rd = min(chunk_size, pos)
+        pos -= rd
+        f.seek(pos)
+        block = f.read(rd)
+        trips += 1
+        scanned += rd
+        acc[:0] = block
+        idx = acc.rfind(needle)
+        if idx != -1:
+            f.seek(pos + idx)
+            trips += 1
+            return f.read(size - pos - idx), trips
+    return b"", trips
+
+
+def legacy_last_lines(f, size, n, chunk_size=131072):
+    """Cách cũ của SFTP_PGWE: buf[:0] = chunk tới khi đủ n dòng."""
+    pos, buf, trips = size, bytearray(), 0
+    while buf.count(b"\n") < n and pos > 0:
+        rd = min(chunk_size, pos)
+        pos -= rd
+        f.seek(pos)
+        buf[:0] = f.read(rd)
+        trips += 1
+    return bytes(buf), trips
+
+
+def make_files(root, mb):
+    needle = SBG_HEADER_LINE.encode()
+    line = b"2025-01-01T00:00:00,pmp0,access,sip,IPv4,500,99.5,120,0,0,0,0,0,98.7,97.9\n"
+    body = line * (mb * 1024 * 1024 // len(line))
+    sbg = os.path.join(root, "sbg_worst.log")     # header ở đầu -> phải quét hết file
+    with open(sbg, "wb") as f:
+        f.write(needle + b"\n" + body)
+    pgw = os.path.join(root, "pgw_longlines.csv")  # dòng rất dài (nhiều counter)
+    row = b"|".join([b"2025-01-01T00:00:00+00:00"] + [b"123456789"] * 30000) + b"\n"
+    with open(pgw, "wb") as f:
+        f.write(b"line1\n" + b"|".join([b"time"] + [b"c%d" % i for i in range(30000)]) + b"\n")
+        f.write(row * max(8, mb * 1024 * 1024 // len(row)))
+    return needle, "/sbg_worst.log", "/pgw_longlines.csv"
+
+
+def timed(fn):
+    started = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    logging.getLogger("paramiko").setLevel(logging.CRITICAL)
+    mb = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    sim = NodeSimulator(1, port=int(os.getenv("BENCH_PORT", "2299"))).start()
+    node = sim.nodes[0]
+    needle, sbg_path, pgw_path = make_files(node["root"], mb)
+    client = SFTP_PGWE(node["ip"], SIM_USER, SIM_PASSWORD, port=sim.port)
+    client.connect()
+    try:
+        with client.sftp.open(sbg_path, "rb") as f:
+            size = f.stat().st_size
+            (old, old_trips), t_old = timed(lambda: legacy_read_from_last(f, size, needle))
+            reader = BackwardReader(f, size)
+            new, t_new = timed(lambda: reader.tail_bytes(reader.rfind(needle)))
+            assert old == new == read_from_last(f, size, needle)
+        print(f"SBG scan {size / 1e6:.1f} MB (header ở đầu file)")
+        print(f"  cũ : {t_old:7.3f}s  round trips={old_trips}")
+        print(f"  mới: {t_new:7.3f}s  round trips={reader.round_trips}  x{t_old / t_new:.1f}")
+
+        with client.sftp.open(pgw_path, "rb") as f:
+            size = f.stat().st_size
+            (old, old_trips), t_old = timed(lambda: legacy_last_lines(f, size, 4))
+            reader = BackwardReader(f, size, 131072)
+            new, t_new = timed(lambda: reader.last_lines(4))
+            assert old.splitlines()[-4:] == new.splitlines()[-4:]
+        print(f"PGW tail 4 dòng, {size / 1e6:.1f} MB, dòng ~{len(new) // 5 / 1e3:.0f} KB")
+        print(f"  cũ : {t_old:7.3f}s  round trips={old_trips}")
+        print(f"  mới: {t_new:7.3f}s  round trips={reader.round_trips}  x{t_old / t_new:.1f}")
+    finally:
+        client.close()
+        sim.stop()
@@ -0,0 +1,63 @@
+# jobs/sftp_tail.py
+
+import zlib
+from typing import Optional, Tuple
+
+import paramiko
+
+from db_utils.tail_cursor import TailCursor, TailCursorStore
+
+HEAD_FP_BYTES = 4096  # fingerprint đầu file (phát hiện rotate khi size không giảm)
+
+UNCHANGED = "unchanged"  # file y như lần trước -> không đọc
+APPENDED = "appended"    # chỉ đọc phần ghi thêm
+RESET = "reset"          # chưa có cursor / bị rotate / truncate -> caller quét lại từ đầu
+
+
+def read_delta(
+    sftp: paramiko.SFTPClient, path: str, cursor: Optional[TailCursor], store: TailCursorStore
+) -> Tuple[str, paramiko.SFTPAttributes, bytes]:
+    """
+    So file remote với cursor, trả về (kind, attr, data):
+      - UNCHANGED: size + mtime không đổi, chỉ tốn 1 lệnh stat
+      - APPENDED : data = các byte [cursor.offset, size), đọc cùng head bằng readv
+      - RESET    : file nhỏ đi hoặc head khác (rotate) hoặc chưa có cursor
+    """
+    attr = sftp.stat(path)
+    size, mtime = attr.st_size, int(attr.st_mtime)
+    if cursor is None or size < cursor.offset:
+        store.count("resets")
+        return RESET, attr, b""
+    if size == cursor.offset and mtime == cursor.mtime:
+        store.count("hits")
+        return UNCHANGED, attr, b""
+
+    with sftp.open(path, "rb") as f:
+        head, data = f.readv([(0, cursor.head_len), (cursor.offset, size - cursor.offset)])
+    if len(head) != cursor.head_len or zlib.crc32(head) != cursor.head_crc:
+        store.count("resets", len(head) + len(data))
+        return RESET, attr, b""
+    store.count("appends", len(head) + len(data))
+    return APPENDED, attr, data
+
+
+def new_cursor(f: paramiko.SFTPFile, size: int, mtime: int, state: bytes) -> TailCursor:
+    """Cursor sau khi quét toàn bộ (nhánh RESET): đọc head để làm fingerprint."""
+    f.seek(0)
+    head = f.read(min(HEAD_FP_BYTES, size))
+    return TailCursor(size, mtime, len(head), zlib.crc32(head), size, state)
+
+
+def advance(cursor: TailCursor, attr: paramiko.SFTPAttributes, state: bytes) -> TailCursor:
+    """Cursor sau nhánh APPENDED (head giữ nguyên, offset = size mới)."""
+    return cursor._replace(size=attr.st_size, mtime=int(attr.st_mtime), offset=attr.st_size, state=state)
+
+
+def keep_last_lines(buf: bytes, n: int) -> bytes:
+    """Cắt buf, giữ vừa đủ n dòng cuối (n+1 ký tự xuống dòng tính từ cuối)."""
+    idx = len(buf)
+    for _ in range(n + 1):
+        idx = buf.rfind(b"\n", 0, idx)
+        if idx < 0:
+            return buf
+    return buf[idx + 1:]
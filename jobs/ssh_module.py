@@ -1,111 +1,186 @@
 # ssh_module.py
 
+import codecs
+import re
+import secrets
+import select
 import time
-from time import sleep
 
 import paramiko
-import os
 import datetime
+
+from db_utils.kpi_record import format_insertdb
+from jobs.collector_stats import CONNECT, COMMAND, PARSE, phase, add_bytes
+from jobs.debug_log import write_debug_log
+from jobs.mme_parser import parse_mme_output, parse_qci
+from jobs.parse_pool import PARSE_POOL
+from jobs.ssh_pool import SSH_POOL
+from config import SSH_PORT
+
+
 class SSH:
-    def __init__(self, ip, username, password, prompt='#', timeout=5):
+    def __init__(self, ip, username, password, prompt='#', timeout=5, connect_timeout=None, keepalive=0, port=SSH_PORT):
         self.prompt = prompt  # 👈 thêm dòng này
         self._client = paramiko.SSHClient()
         self._client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
         self._client.connect(
             hostname=ip,
+            port=port,
             username=username,
             password=password,
             look_for_keys=False,
-            allow_agent=False
+            allow_agent=False,
+            timeout=connect_timeout,
+            banner_timeout=connect_timeout,
+            auth_timeout=connect_timeout,
         )
-        self._ssh = self._client.invoke_shell()
+        if keepalive:
+            self._client.get_transport().set_keepalive(keepalive)
+        # pty rộng: dòng echo của run_batch không bị shell ngắt giữa sentinel
+        self._ssh = self._client.invoke_shell(width=self._PTY_WIDTH)
         self._wait_for_prompt(prompt=prompt, timeout=timeout)
 
+    _PTY_WIDTH = 4096
+
+    # ----------------- Đọc output (stream) -----------------
+    _RECV_SIZE = 65536   # đọc 1 lần tối đa 64 KB
+    _TAIL_SIZE = 256     # chỉ tìm prompt trong phần đuôi buffer
+
+    def _prompt_regex(self, prompt):
+        # prompt trên dòng cuối chưa xuống dòng (cho phép space/tab sau prompt, vd 'node# ').
+        # \Z chứ không phải $ / \s*: dòng output kết thúc bằng '#' + '\n' (comment, banner
+        # pdc_kpi.pl) ở cuối 1 lần recv không được coi là prompt -> không cắt cụt output
+        return re.compile(r"(?:^|\n)[^\n]*" + re.escape(prompt) + r"[ \t]*\Z")
+
+    def _stream(self, prompt, timeout):
+        """
+        Generator trả từng đoạn text vừa nhận, dừng khi đuôi output khớp prompt
+        hoặc hết deadline. Chờ bằng select() trên channel (không busy-poll).
+        """
+        prompt_re = self._prompt_regex(prompt)
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        deadline = time.monotonic() + timeout
+        tail = ''
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            if not self._ssh.recv_ready():
+                readable, _, _ = select.select([self._ssh], [], [], remaining)
+                if not readable:
+                    return
+            data = self._ssh.recv(self._RECV_SIZE)
+            if not data:  # kênh đóng
+                return
+            text = decoder.decode(data)
+            if not text:
+                continue
+            yield text
+            tail = (tail + text)[-self._TAIL_SIZE:]
+            if prompt_re.search(tail) and not self._ssh.recv_ready():
+                return
+
     def _wait_for_prompt(self, prompt='#', timeout=7):
         """Đợi đến khi thiết bị in ra dấu prompt (vd: #, >, $, ...)"""
-        buffer = ''
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if self._ssh.recv_ready():
-                recv = self._ssh.recv(1024).decode('utf-8')
-                buffer += recv
-                if prompt in buffer:
-                    break
-            time.sleep(0.01)
-        return buffer.strip()  # 👈 có thể trả lại nội dung nếu muốn dùng
+        return ''.join(self._stream(prompt, timeout)).strip()
 
     def send_show_command(self, command, timeout=5):
         """Gửi lệnh và chờ đến khi prompt xuất hiện trở lại"""
         self._ssh.send(command + '\n')
-        time.sleep(0.01)
-        output = self._wait_for_prompt(prompt=self.prompt, timeout=timeout)
-        return output
+        return self._wait_for_prompt(prompt=self.prompt, timeout=timeout)
+
+    def iter_command_lines(self, command, timeout=5):
+        """
+        Gửi lệnh, trả từng dòng output ngay khi nhận đủ dòng (parser xử lý
+        trong lúc output còn đang về). Dòng đầu là echo lệnh; dòng prompt cuối
+        không được trả về.
+        """
+        self._ssh.send(command + '\n')
+        prompt_re = self._prompt_regex(self.prompt)
+        pending = ''
+        for text in self._stream(self.prompt, timeout):
+            pending += text
+            *lines, pending = pending.split('\n')
+            for line in lines:
+                yield line.rstrip('\r')
+        if pending.strip() and not prompt_re.search(pending):
+            yield pending.rstrip('\r')
+
+    def run_batch(self, commands, timeout=10):
+        """
+        Chạy nhiều lệnh trong 1 lần gửi / 1 lần chờ prompt. Các lệnh nối bằng ';',
+        sau mỗi lệnh in 1 sentinel riêng (token ngẫu nhiên mỗi batch) để tách output.
+        Trả list output theo thứ tự lệnh, cùng dạng send_show_command (dòng đầu là lệnh).
+        Chưa thấy đủ sentinel khi hết timeout -> TimeoutError (kênh đóng -> EOFError),
+        không trả output cụt; shell còn đang in -> bên gọi phải bỏ session này.
+        """
+        token = secrets.token_hex(4)
+        markers = [f"__END_{token}_{i}__" for i in range(len(commands))]
+        line = "; ".join(f"{cmd}; printf '\\n%s\\n' {marker}" for cmd, marker in zip(commands, markers))
+
+        sections = [[] for _ in commands]
+        i = 0
+        echoed = False
+        for text in self.iter_command_lines(line, timeout):
+            text = text.strip()
+            if not echoed and markers[-1] in text and text != markers[-1]:
+                echoed = True  # dòng echo lệnh (có thể bị shell ngắt nhiều dòng) -> bỏ
+                sections[0].clear()
+                continue
+            if i < len(markers) and text == markers[i]:
+                i += 1
+                continue
+            if i < len(markers):
+                sections[i].append(text)
+        if i < len(markers):
+            if self._ssh.closed or self._ssh.exit_status_ready():
+                raise EOFError(f"Kênh shell đóng sau {i}/{len(markers)} lệnh")
+            raise TimeoutError(f"Hết {timeout}s, mới xong {i}/{len(markers)} lệnh")
+        return [(cmd + "\n" + "\n".join(lines)).strip() for cmd, lines in zip(commands, sections)]
+
+    def is_alive(self):
+        """Transport còn sống và shell chưa bị đóng (dùng khi lấy lại từ pool)."""
+        transport = self._client.get_transport()
+        return (
+            transport is not None and transport.is_active()
+            and not self._ssh.closed and not self._ssh.exit_status_ready()
+        )
+
+    def drain(self):
+        """Bỏ output còn sót trong shell (vd: từ lần chạy trước) trước khi gửi lệnh mới."""
+        while self._ssh.recv_ready():
+            self._ssh.recv(65536)
 
     def close_connection(self):
         self._client.close()
 
 
 
-def Kpi_MME(name, ip, username, password, kpiList, log_filepath):
+def Kpi_MME(name, ip, username, password, kpiList, log_filepath=None, connect_timeout=None, timeout=10):
+    """Thu thập KPI MME, trả về list[KpiRecord]; log debug ghi nền (tuỳ chọn)."""
     # kpiList = ['attach_wcdma', 'pdp_activation_wcdma','paging_wcdma', 'attach_lte', 'paging_lte', 'bearer_establishment_lte']
-    ssh = SSH(ip, username, password, prompt='#')
-    data = ''
-    datainsert = ''
     cmd = "pdc_kpi.pl -i 3 -l"
-    output = ssh.send_show_command(cmd)
-    data += output
-    for line in output.splitlines():
-        line = line.strip()
-        if line.lower().startswith("day"):
-            DateData = line.split(":")[1].strip()
-            today = datetime.date.today()
-            year = today.year
-            month = today.month
-            day = int(DateData)
-            fullDate = f"{year}-{month:02d}-{day:02d}"
-        elif line.lower().startswith("time"):
-            time_str = line.split(":", 1)[1].strip()
-
-        for kpi in kpiList:
-            if line.lower().startswith(kpi):
-                KpiName, KpiValue = line.strip().split(":", 1)
-                KpiName = KpiName.strip()
-                KpiValue = 100 - float(KpiValue.strip().rstrip("%"))
-                datainsert +=f"\ninsertDB;{name};{fullDate} {time_str};{KpiName};{KpiValue}\n"
-    output = ssh.send_show_command("pdc_kpi.pl -q 1,5 -i 3 | grep %")
-    data += output
-    lines = output.strip().splitlines()
-    qcilog = ""
-
-    i = 1
-    for idx, line in enumerate(lines):
-        if "%" in line:
-            parts = line.split()
-            if len(parts) >= 5:
-                qcilog += f"\n{i}-{parts[3]}-{parts[4]}-{line}"
-                if idx == 2:  # dòng thứ 2 (index 1)
-                    qci1 = parts[4].replace('%', '')
-                    qci1 = 100 - float(qci1)
-
-                if idx == 3:  # dòng thứ 3 (index 2)
-                    qci5 = parts[3].replace('%', '')
-                    qci5 = 100 - float(qci5)
+    cmd_qci = "pdc_kpi.pl -q 1,5 -i 3 | grep %"
 
-                i += 1
-    if qci1 and qci5:
-            datainsert += f"\ninsertDB;{name};{fullDate} {time_str};qci1;{qci1}\n"
-            datainsert += f"\ninsertDB;{name};{fullDate} {time_str};qci5;{qci5}\n"
-    data +=datainsert
-    # print(data)
-    # 🔻 Tạo folder nếu chưa có
-    # log_dir = f"logs/mme"
-    # os.makedirs(log_dir, exist_ok=True)
-    #
-    # # 🔻 Ghi log theo tên node
-    # file_path = os.path.join(log_dir, f"log_{name}.txt")
-    with open(log_filepath, "w", encoding="utf-8") as f:
-        f.write(data)
-    ssh.close_connection()
+    def collect(ssh):
+        # 2 lệnh trong 1 lần gửi / 1 lần chờ prompt, tách output theo sentinel
+        with phase(COMMAND):
+            outputs = ssh.run_batch([cmd, cmd_qci], timeout=timeout)
+        add_bytes(COMMAND, sum(len(o) for o in outputs))
+        return outputs
 
+    def factory(ip_, username_, password_):
+        with phase(CONNECT):
+            return SSH(ip_, username_, password_, prompt='#', connect_timeout=connect_timeout,
+                       keepalive=SSH_POOL.keepalive)
 
+    # Shell lấy từ pool (giữ giữa các chu kỳ); kênh chết -> pool tự kết nối lại
+    output_kpi, output_qci = SSH_POOL.run(ip, username, password, collect, factory=factory)
+    # parser biên dịch 1 lần / KPI list (cache theo process); output lớn -> ParsePool
+    with phase(PARSE):
+        block = PARSE_POOL.run(parse_mme_output, output_kpi.encode("utf-8"), name, tuple(kpiList), datetime.date.today())
+        records = block.records + parse_qci(name, output_qci, block.full_date, block.time_str)
 
+    if log_filepath:
+        write_debug_log(log_filepath, output_kpi + output_qci + "\n" + format_insertdb(records))
+    return records
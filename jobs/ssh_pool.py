@@ -0,0 +1,168 @@
+# jobs/ssh_pool.py
+
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+import paramiko
+
+from config import SSH_POOL_IDLE_TIMEOUT, SSH_KEEPALIVE
+
+# Lỗi kết nối/kênh: bỏ session và thử lại với kết nối mới
+_CHANNEL_ERRORS = (paramiko.SSHException, OSError, EOFError)
+# Lệnh hết giờ (SSH.run_batch): shell có thể vẫn đang in -> bỏ session, không thử lại
+# (TimeoutError là OSError nên phải bắt trước _CHANNEL_ERRORS)
+_TIMEOUT_ERRORS = (TimeoutError,)
+
+
+class _Entry:
+    __slots__ = ("ssh", "last_used")
+
+    def __init__(self, ssh):
+        self.ssh = ssh
+        self.last_used = time.monotonic()
+
+
+class SSHSessionPool:
+    """
+    Pool shell tương tác (class SSH) theo (ip, username), dùng lại giữa các chu kỳ.
+    - Transport bật keepalive; khi lấy ra sẽ kiểm tra is_alive() + drain().
+    - Session rảnh quá `idle_timeout` giây bị đóng.
+    - Kênh chết giữa chừng: bỏ session và kết nối lại 1 lần (trong `run`).
+    - Lệnh hết giờ / batch chưa xong: bỏ session (không trả về pool để chu kỳ sau
+      không đọc phải output cũ), ném lỗi ra ngoài.
+    - Sai mật khẩu: xoá mọi session của node, ném lỗi ra ngoài.
+    """
+
+    def __init__(self, idle_timeout: float = SSH_POOL_IDLE_TIMEOUT, keepalive: int = SSH_KEEPALIVE):
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self._idle: Dict[Tuple[str, str], List[_Entry]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reconnects = 0
+        self.auth_failures = 0
+        self.timeouts = 0
+
+    # ----------------- Lấy / trả session -----------------
+    def _checkout(self, ip, username, password, factory):
+        key = (ip, username)
+        self.evict_idle()
+        while True:
+            with self._lock:
+                entries = self._idle.get(key)
+                entry = entries.pop() if entries else None
+            if entry is None:
+                break
+            try:
+                if entry.ssh.is_alive():
+                    entry.ssh.drain()
+                    with self._lock:
+                        self.hits += 1
+                    return entry.ssh, True
+            except Exception:
+                pass
+            self._close(entry.ssh)
+
+        with self._lock:
+            self.misses += 1
+        try:
+            return factory(ip, username, password), False
+        except paramiko.AuthenticationException:
+            with self._lock:
+                self.auth_failures += 1
+            self.evict(ip, username)
+            raise
+
+    def _checkin(self, ip, username, ssh) -> None:
+        with self._lock:
+            self._idle.setdefault((ip, username), []).append(_Entry(ssh))
+
+    def _close(self, ssh) -> None:
+        with self._lock:
+            self.evictions += 1
+        try:
+            ssh.close_connection()
+        except Exception:
+            pass
+
+    def run(self, ip: str, username: str, password: str, fn: Callable, factory: Callable = None):
+        """
+        Chạy fn(ssh) trên 1 session của pool rồi trả session về pool.
+        Nếu session lấy lại từ pool bị chết giữa chừng -> kết nối mới và chạy lại 1 lần.
+        """
+        factory = factory or self._default_factory
+        for attempt in (0, 1):
+            ssh, warm = self._checkout(ip, username, password, factory)
+            try:
+                result = fn(ssh)
+            except _TIMEOUT_ERRORS:
+                with self._lock:
+                    self.timeouts += 1
+                self._close(ssh)
+                raise
+            except _CHANNEL_ERRORS:
+                self._close(ssh)
+                if warm and attempt == 0:
+                    with self._lock:
+                        self.reconnects += 1
+                    continue
+                raise
+            except BaseException:
+                self._close(ssh)
+                raise
+            self._checkin(ip, username, ssh)
+            return result
+
+    def _default_factory(self, ip, username, password):
+        from jobs.ssh_module import SSH
+        return SSH(ip, username, password, prompt='#', keepalive=self.keepalive)
+
+    # ----------------- Dọn dẹp -----------------
+    def evict(self, ip: str, username: str = None) -> None:
+        with self._lock:
+            keys = [k for k in self._idle if k[0] == ip and (username is None or k[1] == username)]
+            entries = [e for k in keys for e in self._idle.pop(k)]
+        for e in entries:
+            self._close(e.ssh)
+
+    def evict_idle(self) -> None:
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for key, entries in list(self._idle.items()):
+                keep = [e for e in entries if now - e.last_used < self.idle_timeout]
+                expired.extend(e for e in entries if now - e.last_used >= self.idle_timeout)
+                if keep:
+                    self._idle[key] = keep
+                else:
+                    del self._idle[key]
+        for e in expired:
+            self._close(e.ssh)
+
+    def close_all(self) -> None:
+        with self._lock:
+            entries = [e for es in self._idle.values() for e in es]
+            self._idle.clear()
+        for e in entries:
+            self._close(e.ssh)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "idle_sessions": sum(len(v) for v in self._idle.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "reconnects": self.reconnects,
+                "auth_failures": self.auth_failures,
+                "timeouts": self.timeouts,
+            }
+
+
+# Pool dùng chung cho các job MME
+SSH_POOL = SSHSessionPool()
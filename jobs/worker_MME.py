@@ -1,12 +1,15 @@
 # job/worker_MME.py
 import os
+import asyncio
 import sqlite3
-import logging
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
-from logging.handlers import RotatingFileHandler
 
 from jobs.ssh_module import Kpi_MME
+from jobs.collector_engine import get_engine
+from jobs.collection_scheduler import register_driver
+from jobs.node_health import NODE_HEALTH, CircuitOpen
+from jobs.collector_stats import COLLECTOR_STATS, INGEST, phase
+from jobs.log_service import get_logger, begin_run
 from db_utils.questdb_client import QuestDBClient
 from db_utils.check_signal import SignalChecker
 from config import LOG_DIR, DIRPATH, LOG_FILE, DB_FILE
@@ -19,99 +22,75 @@ class WorkerMME:
         self.client = QuestDBClient()
         # self.checker = SignalChecker(self.type_filter)
 
-        # Đảm bảo thư mục log tồn tại
-        os.makedirs(LOG_DIR, exist_ok=True)
-
-        # 🔹 Log riêng cho từng loại (rotate)
-        schedule_log = os.path.join(LOG_DIR, f"{self.type_filter.lower()}_schedule.log")
-        rotating_handler = RotatingFileHandler(
-            schedule_log,
-            maxBytes=5 * 1024 * 1024,  # 5 MB
-            backupCount=5,
-            encoding="utf-8"
-        )
-        rotating_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
-
-        # 🔹 Log last_job (overwrite mỗi lần)
-        last_job_log = os.path.join(LOG_DIR, f"last_job_{self.type_filter}.log")
-        last_handler = logging.FileHandler(last_job_log, mode="w", encoding="utf-8")
-        last_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
-
-        # Logger riêng cho worker
-        self.logger = logging.getLogger(f"Worker_{self.type_filter}")
-        self.logger.setLevel(logging.INFO)
-        self.logger.handlers = []  # clear tránh bị ghi log trùng
-        self.logger.addHandler(rotating_handler)
-        self.logger.addHandler(last_handler)
+        # 🔹 Log qua hàng đợi chung (handler mở 1 lần / process):
+        #    <type>_schedule.log (rotate) + last_job_<type>.log (ghi đè mỗi chu kỳ)
+        self.logger = get_logger(f"Worker_{self.type_filter}", f"{self.type_filter.lower()}_schedule.log",
+                                 f"last_job_{self.type_filter}.log")
+        begin_run(self.logger)
+
+    def _load_rows(self):
+        with sqlite3.connect(self.db_file) as conn:
+            return conn.execute(
+                '''
+                SELECT node, ip, user, password, path, type 
+                FROM config_node_schedule
+                WHERE type = ? AND status = 1
+                ''',
+                (self.type_filter,),
+            ).fetchall()
+
+    def prepare(self):
+        """Đầu chu kỳ: danh sách KPI dùng chung cho mọi node (từ config_nguong)."""
+        with sqlite3.connect(self.db_file) as conn:
+            kpi_list = conn.execute(
+                '''
+                SELECT kpi_name 
+                FROM config_nguong
+                WHERE type = ? AND status = 1
+                ''',
+                (self.type_filter,)
+            ).fetchall()
+            return [row[0] for row in kpi_list]
+
+    def run_task(self, row, kpi_list):
+        node, ip, user, password, path, type_ = row
+        try:
+            # 🔻 Tạo folder nếu chưa có
+            log_dir = f"{LOG_DIR}/{self.type_filter}"
+            os.makedirs(log_dir, exist_ok=True)
+            self.logger.info(f"▶️ Task: {node} ({ip})")
+
+            log_filepath = os.path.join(LOG_DIR, f"{self.type_filter}/log_{node}.txt")
+
+            # ssh2 node và lọc KPI list -> KpiRecord (log debug ghi nền); timeout theo độ trễ của node
+            connect_timeout, timeout = NODE_HEALTH.timeouts(self.type_filter, node)
+            records = Kpi_MME(node, ip, user, password, kpi_list, log_filepath, connect_timeout, timeout)
+            with phase(INGEST):
+                n = self.client.insert_records(self.type_filter, records)
+            self.logger.info(f"[{self.type_filter}] Node {node} done ✅: Inserted {n} records to QuestDB")
+        except Exception as e:
+            self.logger.error(f"[{self.type_filter}] Node {node} failed ❌: {e}")
+            raise  # để NODE_HEALTH ghi nhận lỗi
 
-    def run(self):
-        """Run scheduled KPI tasks from the configuration database for specific type."""
+    async def arun(self):
+        """Chạy 1 chu kỳ trên event loop (AsyncIOScheduler), các node chạy qua CollectorEngine."""
         start_time = datetime.now()
         self.logger.info(f"=== Worker {self.type_filter} started ===")
+        engine = get_engine()
 
         try:
-            with sqlite3.connect(self.db_file) as conn:
-                rows = conn.execute(
-                    '''
-                    SELECT node, ip, user, password, path, type 
-                    FROM config_node_schedule
-                    WHERE type = ? AND status = 1
-                    ''',
-                    (self.type_filter,),
-                ).fetchall()
-
-                # 🔹 Lấy danh sách KPI từ config_nguong
-                kpi_list = conn.execute(
-                    '''
-                    SELECT kpi_name 
-                    FROM config_nguong
-                    WHERE type = ? AND status = 1
-                    ''',
-                    (self.type_filter,)
-                ).fetchall()
-                kpi_list = [row[0] for row in kpi_list]
+            rows = await engine.run_blocking(self._load_rows)
 
             if not rows:
                 self.logger.info(f"⚠ Không có node nào có type = '{self.type_filter}'.")
                 return
 
-            def run_task(row):
-                node, ip, user, password, path, type_ = row
-                try:
-
-
-                    # 🔻 Tạo folder nếu chưa có
-                    log_dir = f"{LOG_DIR}/{self.type_filter}"
-                    os.makedirs(log_dir, exist_ok=True)
-                    self.logger.info(f"▶️ Task: {node} ({ip})")
-
-                    log_filepath = os.path.join(LOG_DIR, f"{self.type_filter}/log_{node}.txt")
-
-                    print("log_filepath", log_filepath)
-                    Kpi_MME(node, ip, user, password, kpi_list, log_filepath)  # ssh2 node và lọc KPI list + lưu log file LOG_DIR
-                    self.client.insert_from_log_db(
-                        log_filepath,
-                        node=node,
-                        table=self.type_filter
-                    )
-                    self.logger.info(f"[{self.type_filter}] Node {node} done ✅: Inserted log to QuestDB {log_filepath}")
-                except Exception as e:
-                    self.logger.error(f"[{self.type_filter}] Node {node} failed ❌: {e}")
-
-            # Chạy song song các node
-            max_workers = min(len(rows), os.cpu_count() * 2, 32)
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                list(executor.map(run_task, rows))
-            max_workers = min(len(rows), os.cpu_count() * 2, 32)
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = []
-                executor.map(run_task, rows)
-
-                # Đợi tất cả task kết thúc
-                for future in futures:
-                    future.result()
-            checker = SignalChecker(self.type_filter)
-            checker.run()
+            kpi_list = await engine.run_blocking(self.prepare)
+
+            # Chạy song song các node (giới hạn bởi semaphore của engine)
+            results = await engine.run_nodes(rows, lambda row: self.run_task(row, kpi_list), node_type=self.type_filter)
+            self._log_skipped(results)
+            await engine.run_blocking(self.finish, kpi_list)
 
             end_time = datetime.now()
             duration = (end_time - start_time).total_seconds()
@@ -119,3 +98,21 @@ class WorkerMME:
 
         except Exception as e:
             self.logger.error(f" Job [{self.type_filter}] ❌ DB Error: {e}")
+
+    def finish(self, ctx=None):
+        """Cuối chu kỳ: đẩy buffer ingestion (kèm collector_stats) rồi mới check signal."""
+        COLLECTOR_STATS.drain(self.client.ingest, self.type_filter)
+        self.client.flush()
+        SignalChecker(self.type_filter).run()
+
+    def _log_skipped(self, results):
+        skipped = [str(r) for r in results if isinstance(r, CircuitOpen)]
+        if skipped:
+            self.logger.warning(f"[{self.type_filter}] ⏭ Bỏ qua {len(skipped)} node (circuit mở): {', '.join(skipped)}")
+
+    def run(self):
+        """Run scheduled KPI tasks from the configuration database for specific type."""
+        asyncio.run(self.arun())
+
+
+register_driver("MME", WorkerMME)
@@ -1,14 +1,17 @@
 # job/worker_PGWE.py
 
 import os
+import asyncio
 import sqlite3
-import logging
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
-from logging.handlers import RotatingFileHandler
 
 from db_utils.questdb_client import QuestDBClient
-from jobs.module_PGWE import KPI_PGW
+from jobs.module_PGWE import KPI_PGW, PGW_KPI_FILE
+from jobs.collector_engine import get_engine
+from jobs.collection_scheduler import register_driver
+from jobs.node_health import NODE_HEALTH, CircuitOpen
+from jobs.collector_stats import COLLECTOR_STATS, INGEST, phase
+from jobs.log_service import get_logger, begin_run
 from config import LOG_DIR, DB_FILE
 
 
@@ -17,77 +20,60 @@ class WorkerPGW:
         self.db_file = DB_FILE
         self.type_filter = type_filter
         self.client = QuestDBClient()
+        self.node_log_dir = os.path.join(LOG_DIR, self.type_filter.upper())
+
+        # 🔹 Log qua hàng đợi chung (handler mở 1 lần / process):
+        #    <type>_schedule.log (rotate) + last_job_<type>.log (ghi đè mỗi chu kỳ)
+        self.logger = get_logger(f"Worker_{self.type_filter}", f"{self.type_filter.lower()}_schedule.log",
+                                 f"last_job_{self.type_filter}.log")
+        begin_run(self.logger)
+
+    def _load_rows(self):
+        with sqlite3.connect(self.db_file) as conn:
+            return conn.execute("""
+                SELECT node, ip, user, password, type
+                FROM config_node_schedule
+                WHERE type = ? AND status = 1
+            """, (self.type_filter,)).fetchall()
+
+    def run_task(self, row, ctx=None):
+        node, ip, user, password = row[:4]
+        try:
+            self.logger.info(f"▶️ Task: {node} ({ip})")
+            connect_timeout, timeout = NODE_HEALTH.timeouts(self.type_filter, node)
+            records = KPI_PGW(node, ip, user, password, PGW_KPI_FILE, self.node_log_dir, connect_timeout, timeout)
+
+            if records:
+                with phase(INGEST):
+                    n = self.client.insert_records(self.type_filter, records)
+                self.logger.info(f"[{self.type_filter}] Node {node} ✅ Inserted {n} records to QuestDB")
+            else:
+                self.logger.warning(f"[{self.type_filter}] Node {node} ⚠ No KPI records")
+        except Exception as e:
+            self.logger.error(f"[{self.type_filter}] Node {node} failed ❌: {e}")
+            raise  # để NODE_HEALTH ghi nhận lỗi
 
-        # Đảm bảo thư mục log tồn tại
-        os.makedirs(LOG_DIR, exist_ok=True)
-
-        # 🔹 Log rotate riêng (vd: pgw_schedule.log)
-        schedule_log = os.path.join(LOG_DIR, f"{self.type_filter.lower()}_schedule.log")
-        rotating_handler = RotatingFileHandler(
-            schedule_log,
-            maxBytes=5 * 1024 * 1024,  # 5 MB
-            backupCount=5,
-            encoding="utf-8"
-        )
-        rotating_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
-
-        # 🔹 Log last_job (overwrite mỗi lần chạy)
-        last_job_log = os.path.join(LOG_DIR, f"last_job_{self.type_filter}.log")
-        last_handler = logging.FileHandler(last_job_log, mode="w", encoding="utf-8")
-        last_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
-
-        # Logger riêng cho worker
-        self.logger = logging.getLogger(f"Worker_{self.type_filter}")
-        self.logger.setLevel(logging.INFO)
-        self.logger.handlers = []  # clear tránh bị ghi log trùng
-        self.logger.addHandler(rotating_handler)
-        self.logger.addHandler(last_handler)
-
-    def run(self):
+    async def arun(self):
+        """Chạy 1 chu kỳ trên event loop (AsyncIOScheduler), các node chạy qua CollectorEngine."""
         start_time = datetime.now()
         self.logger.info(f"=== Worker {self.type_filter} started ===")
+        engine = get_engine()
 
         try:
-            with sqlite3.connect(self.db_file) as conn:
-                rows = conn.execute("""
-                    SELECT node, ip, user, password, type
-                    FROM config_node_schedule
-                    WHERE type = ? AND status = 1
-                """, (self.type_filter,)).fetchall()
+            rows = await engine.run_blocking(self._load_rows)
 
             if not rows:
                 self.logger.info(f"⚠ Không có node nào có type = '{self.type_filter}'.")
                 return
 
             # Folder log cho từng type
-            node_log_dir = os.path.join(LOG_DIR, self.type_filter.upper())
-            os.makedirs(node_log_dir, exist_ok=True)
-
-            fileName = "/var/log/services/epg/pdc/work/tmp/pm_job_epg-kpi.csv"
-
-            def run_task(row):
-                node, ip, user, password, _ = row
-                try:
-                    self.logger.info(f"▶️ Task: {node} ({ip})")
-                    KPI_PGW(node, ip, user, password, fileName, node_log_dir)
-
-                    log_filepath = os.path.join(node_log_dir, f"log_{node}.txt")
-                    if os.path.exists(log_filepath):
-                        self.client.insert_from_log_PGW_db(
-                            log_filepath,
-                            node=node,
-                            table=self.type_filter
-                        )
-                        self.logger.info(f"[{self.type_filter}] Node {node} ✅ Inserted log to QuestDB: {log_filepath}")
-                    else:
-                        self.logger.warning(f"[{self.type_filter}] Node {node} ⚠ Log file not found: {log_filepath}")
-                except Exception as e:
-                    self.logger.error(f"[{self.type_filter}] Node {node} failed ❌: {e}")
-
-            # Chạy song song
-            max_workers = min(len(rows), os.cpu_count() * 2, 32)
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                list(executor.map(run_task, rows))
+            os.makedirs(self.node_log_dir, exist_ok=True)
+
+            # Chạy song song (giới hạn bởi semaphore của engine)
+            results = await engine.run_nodes(rows, self.run_task, node_type=self.type_filter)
+            self._log_skipped(results)
+
+            await engine.run_blocking(self.finish)
 
             end_time = datetime.now()
             duration = (end_time - start_time).total_seconds()
@@ -95,3 +81,23 @@ class WorkerPGW:
 
         except Exception as e:
             self.logger.error(f" Job [{self.type_filter}] ❌ DB Error: {e}")
+
+    def prepare(self):
+        """Đầu chu kỳ: không cần context dùng chung."""
+        return None
+
+    def finish(self, ctx=None):
+        """Cuối chu kỳ: đẩy nốt buffer ingestion (kèm collector_stats)."""
+        COLLECTOR_STATS.drain(self.client.ingest, self.type_filter)
+        self.client.flush()
+
+    def _log_skipped(self, results):
+        skipped = [str(r) for r in results if isinstance(r, CircuitOpen)]
+        if skipped:
+            self.logger.warning(f"[{self.type_filter}] ⏭ Bỏ qua {len(skipped)} node (circuit mở): {', '.join(skipped)}")
+
+    def run(self):
+        asyncio.run(self.arun())
+
+
+register_driver("PGW", WorkerPGW)
@@ -1,12 +1,15 @@
 # jobs/worker_SBG.py
 import os
+import asyncio
 import sqlite3
-import logging
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
-from logging.handlers import RotatingFileHandler
 
-from jobs.module_SBG import Kpi_SBG_run
+from jobs.module_SBG import Kpi_SBG_run, sbg_node_logger
+from jobs.collector_engine import get_engine
+from jobs.collection_scheduler import register_driver
+from jobs.node_health import NODE_HEALTH, CircuitOpen
+from jobs.collector_stats import COLLECTOR_STATS, INGEST, phase
+from jobs.log_service import get_logger, begin_run
 from db_utils.questdb_client import QuestDBClient
 from config import LOG_DIR, DB_FILE
 
@@ -17,79 +20,68 @@ class WorkerSBG:
         self.type_filter = type_filter
         self.client = QuestDBClient()
 
-        # Đảm bảo thư mục log tồn tại
-        os.makedirs(LOG_DIR, exist_ok=True)
-
-        # 🔹 Log riêng cho từng loại (rotate)
-        schedule_log = os.path.join(LOG_DIR, f"{self.type_filter.lower()}_schedule.log")
-        rotating_handler = RotatingFileHandler(
-            schedule_log,
-            maxBytes=5 * 1024 * 1024,  # 5 MB
-            backupCount=5,
-            encoding="utf-8"
-        )
-        rotating_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
-
-        # 🔹 Log last_job (overwrite mỗi lần)
-        last_job_log = os.path.join(LOG_DIR, f"last_job_{self.type_filter}.log")
-        last_handler = logging.FileHandler(last_job_log, mode="w", encoding="utf-8")
-        last_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
-
-        # Logger riêng cho worker
-        self.logger = logging.getLogger(f"Worker_{self.type_filter}")
-        self.logger.setLevel(logging.INFO)
-        self.logger.handlers = []  # clear tránh bị ghi log trùng
-        self.logger.addHandler(rotating_handler)
-        self.logger.addHandler(last_handler)
+        # 🔹 Log qua hàng đợi chung (handler mở 1 lần / process):
+        #    <type>_schedule.log (rotate) + last_job_<type>.log (ghi đè mỗi chu kỳ)
+        self.logger = get_logger(f"Worker_{self.type_filter}", f"{self.type_filter.lower()}_schedule.log",
+                                 f"last_job_{self.type_filter}.log")
+        begin_run(self.logger)
+        begin_run(sbg_node_logger(self.type_filter))
+
+    def _load_rows(self):
+        with sqlite3.connect(self.db_file) as conn:
+            return conn.execute(
+                '''
+                SELECT node, ip, user, password, path, type 
+                FROM config_node_schedule
+                WHERE type = ? AND status = 1
+                ''',
+                (self.type_filter,),
+            ).fetchall()
+
+    def run_task(self, row, ctx=None):
+        node, ip, user, password, path, type_ = row
+        try:
+            # 🔻 Tạo folder nếu chưa có
+            log_dir = f"{LOG_DIR}/{self.type_filter}"
+            os.makedirs(log_dir, exist_ok=True)
+            self.logger.info(f"▶️ Task: {node} ({ip})")
+
+            # 🔹 SSH và chạy thu thập KPI
+            connect_timeout, timeout = NODE_HEALTH.timeouts(self.type_filter, node)
+            records = Kpi_SBG_run(node, ip, user, password, log_dir,
+                                  connect_timeout=connect_timeout, timeout=timeout)
+
+            # 🔹 Insert QuestDB
+            if records:
+                with phase(INGEST):
+                    self.client.insert_records(self.type_filter, records)
+                    self.client.insert_records(f"{self.type_filter}_Long", records)
+                self.logger.info(f"[{self.type_filter}] Node {node} done ✅: Inserted {len(records)} records to QuestDB")
+            else:
+                self.logger.warning(f"[{self.type_filter}] Node {node} ⚠ No KPI records")
 
-    def run(self):
-        """Run scheduled KPI tasks from the configuration database for specific type."""
+        except Exception as e:
+            self.logger.error(f"[{self.type_filter}] Node {node} failed ❌: {e}")
+            raise  # để NODE_HEALTH ghi nhận lỗi
+
+    async def arun(self):
+        """Chạy 1 chu kỳ trên event loop (AsyncIOScheduler), các node chạy qua CollectorEngine."""
         start_time = datetime.now()
         self.logger.info(f"=== Worker {self.type_filter} started ===")
+        engine = get_engine()
 
         try:
-            with sqlite3.connect(self.db_file) as conn:
-                rows = conn.execute(
-                    '''
-                    SELECT node, ip, user, password, path, type 
-                    FROM config_node_schedule
-                    WHERE type = ? AND status = 1
-                    ''',
-                    (self.type_filter,),
-                ).fetchall()
+            rows = await engine.run_blocking(self._load_rows)
 
             if not rows:
                 self.logger.info(f"⚠ Không có node nào có type = '{self.type_filter}'.")
                 return
 
-            def run_task(row):
-                node, ip, user, password, path, type_ = row
-                try:
-                    # 🔻 Tạo folder nếu chưa có
-                    log_dir = f"{LOG_DIR}/{self.type_filter}"
-                    os.makedirs(log_dir, exist_ok=True)
-                    self.logger.info(f"▶️ Task: {node} ({ip})")
-
-                    log_filepath = os.path.join(log_dir, f"log_{node}.txt")
-
-                    # 🔹 SSH và chạy thu thập KPI
-                    Kpi_SBG_run(node, ip, user, password, log_dir)
-
-                    # 🔹 Insert QuestDB
-                    if os.path.exists(log_filepath):
-                        self.client.insert_from_log_db(log_filepath, node=node, table=self.type_filter)
-                        self.client.insert_from_log_db(log_filepath, node=node, table=f"{self.type_filter}_Long")
-                        self.logger.info(f"[{self.type_filter}] Node {node} done ✅: Inserted log to QuestDB {log_filepath}")
-                    else:
-                        self.logger.warning(f"[{self.type_filter}] Log file not found ⚠: {log_filepath}")
-
-                except Exception as e:
-                    self.logger.error(f"[{self.type_filter}] Node {node} failed ❌: {e}")
+            # Chạy song song các node (giới hạn bởi semaphore của engine)
+            results = await engine.run_nodes(rows, self.run_task, node_type=self.type_filter)
+            self._log_skipped(results)
 
-            # Chạy song song các node
-            max_workers = min(len(rows), os.cpu_count() * 2, 32)
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                list(executor.map(run_task, rows))
+            await engine.run_blocking(self.finish)
 
             end_time = datetime.now()
             duration = (end_time - start_time).total_seconds()
@@ -97,3 +89,24 @@ class WorkerSBG:
 
         except Exception as e:
             self.logger.error(f" Job [{self.type_filter}] ❌ DB Error: {e}")
+
+    def prepare(self):
+        """Đầu chu kỳ: không cần context dùng chung."""
+        return None
+
+    def finish(self, ctx=None):
+        """Cuối chu kỳ: đẩy nốt buffer ingestion (kèm collector_stats)."""
+        COLLECTOR_STATS.drain(self.client.ingest, self.type_filter)
+        self.client.flush()
+
+    def _log_skipped(self, results):
+        skipped = [str(r) for r in results if isinstance(r, CircuitOpen)]
+        if skipped:
+            self.logger.warning(f"[{self.type_filter}] ⏭ Bỏ qua {len(skipped)} node (circuit mở): {', '.join(skipped)}")
+
+    def run(self):
+        """Run scheduled KPI tasks from the configuration database for specific type."""
+        asyncio.run(self.arun())
+
+
+register_driver("SBG", WorkerSBG)
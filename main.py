@@ -14,9 +14,17 @@ from routers.config_nguong import router as config_nguong_router
 from routers.kpi_analysis import router as kpi_analysis_router
 from routers.last_kpi import router as last_kpi_router
 from routers.log_kpi import router as log_kpi_router
+from routers.status import router as status_router
+from routers.collector_stats import router as collector_stats_router
 from jobs.worker_PGWE import WorkerPGW
 from jobs.worker_SBG import WorkerSBG
 from jobs.worker_MME import WorkerMME
+from db_utils.questdb_ingest import shutdown_ingest_service
+from jobs.ssh_pool import SSH_POOL
+from jobs.collector_engine import get_engine, shutdown_engine
+from jobs.collection_scheduler import get_collection_scheduler
+from jobs.parse_pool import shutdown_parse_pool
+from jobs.log_service import stop_logging
 from datetime import datetime
 
 app = FastAPI()
@@ -38,19 +46,27 @@ templates = Jinja2Templates(directory="templates")
 
 scheduler = AsyncIOScheduler()
 
-def run_mme_job():
-    WorkerMME(DB_FILE, type_filter="MME").run()
+# Job là coroutine chạy trên event loop của AsyncIOScheduler; tạo worker (QuestDBClient,
+# Sender, spool) là blocking -> tạo trong executor của engine
+async def run_mme_job():
+    worker = await get_engine().run_blocking(WorkerMME, DB_FILE, type_filter="MME")
+    await worker.arun()
 
-def run_pgw_job():
-    WorkerPGW(DB_FILE, type_filter="PGW").run()
+async def run_pgw_job():
+    worker = await get_engine().run_blocking(WorkerPGW, DB_FILE, type_filter="PGW")
+    await worker.arun()
 
-def run_sbg_job():
-    WorkerSBG(DB_FILE, type_filter="SBG").run()
+async def run_sbg_job():
+    worker = await get_engine().run_blocking(WorkerSBG, DB_FILE, type_filter="SBG")
+    await worker.arun()
 
+# 1 chu kỳ cho mọi type (driver đăng ký trong jobs/worker_*.py): ngân sách đồng thời chung,
+# giới hạn theo type/IP, node rải trong chu kỳ theo offset type + jitter crc32
+async def run_collection_job():
+    await get_collection_scheduler().run_cycle()
 
-# scheduler.add_job(lambda: run_mme_job(),"cron",minute='2-59/5',id="worker-mme",coalesce=True,max_instances=1,replace_existing=True,next_run_time=datetime.now(),misfire_grace_time=60)
-# scheduler.add_job(lambda: run_pgw_job(),"cron",minute='2-59/5',id="worker-pgw",coalesce=True,max_instances=1,replace_existing=True,next_run_time=datetime.now(),misfire_grace_time=60)
-# scheduler.add_job(lambda: run_sbg_job(),"cron",minute='1-59/5',id="worker-sbg",coalesce=True,max_instances=1,replace_existing=True,next_run_time=datetime.now(),misfire_grace_time=60)
+
+# scheduler.add_job(run_collection_job,"cron",minute='*/5',id="collector",coalesce=True,max_instances=1,replace_existing=True,misfire_grace_time=60)
 
 
 
@@ -62,6 +78,15 @@ def on_startup():
     scheduler.start()
 
 
+@app.on_event("shutdown")
+def on_shutdown():
+    scheduler.shutdown(wait=False)
+    shutdown_ingest_service()  # flush nốt buffer + đóng Sender
+    SSH_POOL.close_all()
+    shutdown_engine()
+    shutdown_parse_pool()
+    stop_logging()  # ghi nốt hàng đợi log
+
 
 
 # === Root redirect (optional) ===
@@ -74,6 +99,8 @@ app.include_router(config_node_router)
 app.include_router(kpi_analysis_router)
 app.include_router(log_kpi_router)
 app.include_router(config_nguong_router)
+app.include_router(status_router)
+app.include_router(collector_stats_router)
 
 # === Serve schedule log (if you still want standalone) ===
 @app.get("/log_schedule")
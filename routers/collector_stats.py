@@ -0,0 +1,117 @@
+# routers/collector_stats.py
+from __future__ import annotations
+
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List
+
+import pandas as pd
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.templating import Jinja2Templates
+
+from db_utils.questdb_query import QuestDBQuery
+from jobs.collector_stats import COLLECTOR_STATS_TABLE, TOTAL
+
+router = APIRouter(prefix="/collector_stats", tags=["Collector Stats"])
+templates = Jinja2Templates(directory="templates")
+
+
+def _choose_sample_by(minutes: int) -> str:
+    # chu kỳ thu thập 1-5 phút -> bucket không nhỏ hơn 5m
+    if minutes <= 360:
+        return "5m"
+    if minutes <= 1440:
+        return "15m"
+    return "1h"
+
+
+def _records(df: pd.DataFrame) -> List[Dict]:
+    return [
+        {k: (None if pd.isna(v) else v) for k, v in row.items()}
+        for row in df.to_dict("records")
+    ]
+
+
+@router.get("", response_class=HTMLResponse)
+def collector_stats_page(request: Request):
+    return templates.TemplateResponse(
+        "collector_stats.html", {"request": request, "title": "Collector Stats"}
+    )
+
+
+@router.get("/api")
+def collector_stats_api(
+    node_type: str = Query("ALL"),
+    minutes: int = Query(360, ge=5, le=60 * 24 * 30),
+    top: int = Query(20, ge=1, le=200),
+):
+    """
+    JSON cho trang collector_stats:
+      - slow_nodes : node chậm nhất theo tổng thời gian (avg / max / p lỗi)
+      - phases     : phase nào chiếm thời gian (avg / max ms, tổng bytes) theo type
+      - series     : avg ms theo thời gian cho từng phase (SAMPLE BY), x = epoch seconds
+    """
+    node_type_up = node_type.upper()
+    q = QuestDBQuery()
+    cutoff = (datetime.now(timezone.utc) - timedelta(minutes=minutes)).isoformat()
+    sample_by = _choose_sample_by(minutes)
+
+    where = "timestamp > CAST(:cutoff AS TIMESTAMP)"
+    params: Dict[str, object] = {"cutoff": cutoff, "total": TOTAL}
+    if node_type_up != "ALL":
+        where += " AND type = :node_type"
+        params["node_type"] = node_type_up
+
+    slow_nodes = q.query(f"""
+        SELECT type, Node,
+               count() AS runs,
+               avg(ms) AS avg_ms,
+               max(ms) AS max_ms,
+               sum(CASE WHEN ok THEN 0 ELSE 1 END) AS failed
+        FROM {COLLECTOR_STATS_TABLE}
+        WHERE {where} AND phase = :total
+        GROUP BY type, Node
+        ORDER BY avg_ms DESC
+        LIMIT {int(top)}
+    """, params=params)
+
+    phases = q.query(f"""
+        SELECT type, phase,
+               count() AS runs,
+               avg(ms) AS avg_ms,
+               max(ms) AS max_ms,
+               sum(bytes) AS bytes
+        FROM {COLLECTOR_STATS_TABLE}
+        WHERE {where} AND phase != :total
+        GROUP BY type, phase
+        ORDER BY type, avg_ms DESC
+    """, params=params)
+
+    df = q.query(f"""
+        SELECT timestamp AS ts, phase, avg(ms) AS avg_ms
+        FROM {COLLECTOR_STATS_TABLE}
+        WHERE {where}
+        SAMPLE BY {sample_by}
+        ORDER BY ts
+    """, params=params)
+
+    series: List[Dict] = []
+    x_sec: List[int] = []
+    if not df.empty:
+        df["ts"] = pd.to_datetime(df["ts"], utc=True, errors="coerce")
+        df = df.dropna(subset=["ts"])
+        wide = df.pivot_table(index="ts", columns="phase", values="avg_ms", aggfunc="mean").sort_index()
+        x_sec = (wide.index.astype("int64") // 1_000_000_000).tolist()
+        for name in wide.columns:
+            vals = [None if pd.isna(v) else round(float(v), 1) for v in wide[name].tolist()]
+            series.append({"label": str(name), "data": vals})
+
+    return JSONResponse({
+        "node_type": node_type_up,
+        "minutes": minutes,
+        "sample_by": sample_by,
+        "slow_nodes": _records(slow_nodes),
+        "phases": _records(phases),
+        "x": x_sec,
+        "series": series,
+    })
@@ -4,6 +4,7 @@ from fastapi import APIRouter, Request, Form
 from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
 from db_utils.sqlite_db import SQLiteDB
+from jobs.mme_parser import invalidate_mme_parser
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
@@ -48,9 +49,11 @@ def config_nguong_add_or_update(
             VALUES (?, ?, ?, ?, ?, ?)
         """, (kpi_name, chuky, nguong_fix, type, db_val, status_val))
 
+    invalidate_mme_parser()  # KPI list đổi -> parser MME biên dịch lại ở chu kỳ sau
     return RedirectResponse(url="/config_nguong", status_code=303)
 
 @router.get("/config_nguong/delete/{id}")
 def config_nguong_delete(id: int):
     db.execute("DELETE FROM config_nguong WHERE rowid = ?", (id,))
+    invalidate_mme_parser()
     return RedirectResponse(url="/config_nguong", status_code=303)
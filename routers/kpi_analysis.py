@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 import io
+import numpy as np
 import pandas as pd
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List
@@ -10,6 +11,8 @@ from fastapi import APIRouter, Query, HTTPException, Request
 from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 
+from config import KPI_ANALYSIS_POINTS, KPI_ANALYSIS_LTTB_FACTOR, KPI_ANALYSIS_CHART_POINTS
+from db_utils.downsample import lttb_indices
 from db_utils.questdb_query import QuestDBQuery
 from db_utils.sqlite_db import SQLiteDB
 
@@ -17,16 +20,116 @@ router = APIRouter(prefix="/kpi_analysis", tags=["KPI Analysis"])
 templates = Jinja2Templates(directory="templates")
 
 
-def _choose_sample_by(minutes: int) -> str:
-    if minutes <= 30:
-        return "5s"
-    if minutes <= 180:
-        return "10s"
-    if minutes <= 720:
-        return "30s"
-    if minutes <= 1440:
-        return "1m"
-    return "5m"
+# Bucket SAMPLE BY hợp lệ (nhỏ nhất 3m ~ chu kỳ thu thập), tăng dần
+_BUCKETS = [("3m", 3), ("5m", 5), ("10m", 10), ("15m", 15), ("30m", 30), ("1h", 60),
+            ("2h", 120), ("3h", 180), ("6h", 360), ("12h", 720), ("1d", 1440)]
+
+
+def _choose_sample_by(minutes: int, max_points: int) -> str:
+    """Bucket nhỏ nhất để cửa sổ `minutes` cho không quá `max_points` điểm / series."""
+    for label, size in _BUCKETS:
+        if minutes / size <= max_points:
+            return label
+    return _BUCKETS[-1][0]
+
+
+def _codes(values: pd.Series, labels: List[str]) -> np.ndarray:
+    """Vị trí của từng giá trị trong labels (-1 nếu không có): factorize 1 lần rồi tra bảng nhỏ."""
+    codes, uniques = pd.factorize(values)
+    pos = {label: i for i, label in enumerate(labels)}
+    lookup = np.array([pos.get(str(u), -1) for u in uniques] + [-1], dtype=np.int64)
+    return lookup[codes]  # code -1 (NaN) -> phần tử cuối = -1
+
+
+def _pivot_long(df: pd.DataFrame, kpis: List[str], nodes: List[str]):
+    """
+    Dạng dài (ts, kpi_name, Node, v) -> với mỗi KPI có dữ liệu (theo thứ tự kpis):
+    (kpi, x epoch seconds, ma trận len(nodes) x len(x)), ô thiếu = NaN.
+    Cột của ma trận chung = các cặp (KPI, ts) khác nhau (1 lần np.unique trên khoá int64),
+    scatter giá trị 1 lần; mỗi KPI là 1 lát cột liên tiếp, ts tăng dần.
+    """
+    if df.empty:
+        return []
+    ts = pd.to_datetime(df["ts"], utc=True, errors="coerce")
+    t = ts.to_numpy(dtype="datetime64[ns]").astype("datetime64[s]").astype(np.int64)
+    k = _codes(df["kpi_name"], kpis)
+    n = _codes(df["Node"], nodes)
+    ok = ts.notna().to_numpy() & (k >= 0) & (n >= 0)
+    if not ok.all():
+        t, k, n = t[ok], k[ok], n[ok]
+    v = pd.to_numeric(df["v"], errors="coerce").to_numpy(dtype=np.float64)[ok]
+    if not len(t):
+        return []
+
+    t0 = t.min()
+    key = (k << 34) | (t - t0)  # ~540 năm giây trong 34 bit
+    col_key, col = np.unique(key, return_inverse=True)
+    grid = np.full((len(nodes), len(col_key)), np.nan)
+    grid[n, col] = v
+    col_kpi = col_key >> 34
+    col_ts = (col_key & ((1 << 34) - 1)) + t0
+
+    out = []
+    bounds = np.searchsorted(col_kpi, np.arange(len(kpis) + 1))
+    for i, kpi in enumerate(kpis):
+        lo, hi = bounds[i], bounds[i + 1]
+        if hi > lo:
+            out.append((kpi, col_ts[lo:hi].tolist(), grid[:, lo:hi]))
+    return out
+
+
+def _json_values(row: np.ndarray) -> list:
+    """Mảng float -> list cho JSON (làm tròn 2 số như ratio gốc, NaN -> None)."""
+    row = np.round(row, 2)
+    missing = np.isnan(row)
+    if not missing.any():
+        return row.tolist()
+    obj = row.astype(object)
+    obj[missing] = None
+    return obj.tolist()
+
+
+def _series_points(points: int, n_series: int, chart_points: int) -> int:
+    """Số điểm tối đa / series để cả chart (n_series series) không quá chart_points điểm."""
+    return max(3, min(points, chart_points // max(1, n_series)))
+
+
+def _build_charts(df: pd.DataFrame, kpis: List[str], nodes: List[str], thr_map: dict,
+                  points: int, lttb: bool, chart_points: int = KPI_ANALYSIS_CHART_POINTS) -> List[Dict]:
+    """
+    Kết quả query dạng dài -> danh sách chart (mỗi KPI có dữ liệu 1 chart).
+    Node không có điểm nào của KPI thì bỏ series. Tổng điểm mọi series của 1 chart
+    <= chart_points: mỗi series tối đa _series_points(...) điểm.
+    LTTB: x của chart là trục chung (mọi cột), series chỉ gửi chỉ số điểm được chọn ("i")
+    + giá trị, không lặp lại epoch seconds theo từng series.
+    """
+    charts: List[Dict] = []
+    for kpi, x_sec, values in _pivot_long(df, kpis, nodes):
+        has_data = ~np.isnan(values).all(axis=1)
+        labels = [node for node, keep in zip(nodes, has_data) if keep]
+        values = values[has_data]
+        per_series = _series_points(points, len(labels), chart_points)
+        if lttb and len(x_sec) > per_series:
+            # LTTB từng node -> điểm chọn khác nhau: gửi chỉ số vào x chung
+            idx = lttb_indices(np.asarray(x_sec, dtype=np.int64), values, per_series)
+            series_all = [
+                {"label": node, "i": sel.tolist(), "data": _json_values(values[j, sel])}
+                for j, (node, sel) in enumerate(zip(labels, idx))
+            ]
+        else:
+            # ---- series gốc (solid): mỗi node 1 dòng của ma trận ----
+            series_all = [{"label": node, "data": _json_values(row)} for node, row in zip(labels, values)]
+        chart = {"kpi": kpi, "x": x_sec, "series": series_all}
+
+        thr = thr_map.get(kpi)
+        if thr is not None and pd.notna(thr):
+            chart["threshold"] = {
+                "label": f"nguong_fix={float(thr)}",
+                "data": [float(thr)] * len(x_sec),
+            }
+
+        charts.append(chart)
+    return charts
 
 
 @router.get("", response_class=HTMLResponse)
@@ -80,10 +183,16 @@ def _load_common(node_type_up: str):
 def kpi_analysis_api(
     node_type: str = Query("MME"),
     minutes: int = Query(180, ge=5, le=60 * 24 * 14),
+    points: int = Query(KPI_ANALYSIS_POINTS, ge=50, le=5000),
+    lttb: bool = Query(True),
 ):
     """
     JSON cho ECharts: mỗi KPI = 1 chart (gồm series gốc cho từng Node).
     Trục X là epoch seconds (FE chuyển sang ms).
+    Mỗi series tối đa `points` điểm và cả chart tối đa KPI_ANALYSIS_CHART_POINTS điểm
+    bất kể cửa sổ / số node: bucket SAMPLE BY chọn theo số điểm / series đó;
+    lttb=1 -> query mịn hơn KPI_ANALYSIS_LTTB_FACTOR lần rồi LTTB (giữ đỉnh / đáy),
+    khi đó series có "i" = chỉ số điểm được chọn trong x của chart.
     """
     node_type_up = node_type.upper()
     q = QuestDBQuery()
@@ -100,70 +209,28 @@ def kpi_analysis_api(
         raise HTTPException(400, f"Loại node không hợp lệ: {node_type_up}")
 
     cutoff = (datetime.now(timezone.utc) - timedelta(minutes=minutes)).isoformat()
-    sample_by = _choose_sample_by(minutes)
-
-    charts: List[Dict] = []
-
-    for kpi in kpis:
-        prefix = "n"
-        node_clause, node_binds = QuestDBQuery.make_in_params(prefix, nodes)
-
-        # Pivot node thành nhiều cột
-        cols_sql = ",\n              ".join(
-            f'MAX(CASE WHEN Node = :{prefix}{i} THEN v END) AS "{nodes[i]}"'
-            for i in range(len(nodes))
-        )
-
-        sql = f"""
-            WITH base AS (
-              SELECT timestamp AS ts, Node, {val_col} AS v
-              FROM {table}
-              WHERE timestamp > CAST(:cutoff AS TIMESTAMP)
-                AND kpi_name = :kpi
-                AND Node IN ({node_clause})
-            )
-            SELECT
-              ts,
-              {cols_sql}
-            FROM base
-            TIMESTAMP(ts)
-            SAMPLE BY 3m
-            ORDER BY ts
-        """
-        params: Dict[str, str] = {"cutoff": cutoff, "kpi": kpi, **node_binds}
-        df = q.query(sql, params=params)
-        if df.empty:
-            continue
-
-        # Chuẩn hóa thời gian
-        df["ts"] = pd.to_datetime(df["ts"], utc=True, errors="coerce")
-        df = df.dropna(subset=["ts"]).sort_values("ts")
-        x_sec = (df["ts"].astype("int64") // 1_000_000_000).tolist()
-
-        series_all: List[Dict] = []
-
-        # ---- series gốc (solid) ----
-        for node in nodes:
-            col = pd.to_numeric(df.get(node), errors="coerce")
-            vals = [None if pd.isna(v) else float(v) for v in col.tolist()]
-            # đảm bảo khớp độ dài
-            if len(vals) < len(x_sec):
-                vals += [None] * (len(x_sec) - len(vals))
-            elif len(vals) > len(x_sec):
-                vals = vals[: len(x_sec)]
-            series_all.append({"label": node, "data": vals})
-
-        chart = {"kpi": kpi, "x": x_sec, "series": series_all}
-
-        thr = thr_map.get(kpi)
-        if thr is not None and pd.notna(thr):
-            chart["threshold"] = {
-                "label": f"nguong_fix={float(thr)}",
-                "data": [float(thr)] * len(x_sec),
-            }
+    factor = max(1, KPI_ANALYSIS_LTTB_FACTOR) if lttb else 1
+    per_series = _series_points(points, len(nodes), KPI_ANALYSIS_CHART_POINTS)
+    sample_by = _choose_sample_by(minutes, per_series * factor)
+
+    # 1 query cho mọi KPI, dạng dài (ts, kpi_name, Node, v): số cột / độ dài SQL không
+    # tăng theo số node, pivot bằng numpy ở _pivot_long
+    kpi_clause, kpi_binds = QuestDBQuery.make_in_params("k", kpis)
+    node_clause, node_binds = QuestDBQuery.make_in_params("n", nodes)
+    sql = f"""
+        SELECT timestamp AS ts, kpi_name, Node, avg({val_col}) AS v
+        FROM {table}
+        WHERE timestamp > CAST(:cutoff AS TIMESTAMP)
+          AND kpi_name IN ({kpi_clause})
+          AND Node IN ({node_clause})
+        SAMPLE BY {sample_by}
+    """
+    params: Dict[str, str] = {"cutoff": cutoff, **kpi_binds, **node_binds}
+    df = q.query(sql, params=params)
 
-        charts.append(chart)
+    charts = _build_charts(df, kpis, nodes, thr_map, points, lttb)
 
     return JSONResponse(
-        {"charts": charts, "node_type": node_type_up, "minutes": minutes, "sample_by": sample_by}
+        {"charts": charts, "node_type": node_type_up, "minutes": minutes, "sample_by": sample_by,
+         "points": per_series, "chart_points": KPI_ANALYSIS_CHART_POINTS, "lttb": lttb}
     )
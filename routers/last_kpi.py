@@ -7,12 +7,18 @@ from fastapi import APIRouter, Request, Query
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 
+from db_utils.frame_cache import LAST_KPI_CACHE
+from db_utils.kpi_window import last_n_sql, frame_with_ema, group_ends
+from db_utils.questdb_ingest import add_flush_listener
 from db_utils.questdb_query import QuestDBQuery
 from db_utils.sqlite_db import SQLiteDB
 
 router = APIRouter(prefix="/last_kpi", tags=["Last KPI"])
 templates = Jinja2Templates(directory="templates")
 
+# Ingest flush bảng MME/PGW/SBG -> xoá frame cache của type đó
+add_flush_listener(lambda table: LAST_KPI_CACHE.invalidate(table.upper()))
+
 
 def _build_frames(node_type_up: str) -> tuple[pd.DataFrame, pd.DataFrame, str | None]:
     """
@@ -57,40 +63,14 @@ def _build_frames(node_type_up: str) -> tuple[pd.DataFrame, pd.DataFrame, str |
         node_filter_sql = f"AND Node IN ({node_clause})"
         params.update(node_binds)
 
-    # 6) Query QuestDB
-    sql = f"""
-        SELECT
-          timestamp,
-          Node,
-          kpi_name,
-          ratio AS kpi_value
-        FROM {table}
-        WHERE kpi_name IN ({kpi_clause})
-          {node_filter_sql}
-          AND timestamp > CAST(:cutoff AS TIMESTAMP)
-        ORDER BY kpi_name, Node, timestamp DESC
-    """
-    df = q.query(sql, params=params)
+    # 6) Query QuestDB: 7 điểm gần nhất mỗi Node|KPI lấy ngay trong QuestDB (row_number);
+    #    dòng trùng timestamp (bảng chưa migrate WAL/DEDUP) đã gộp trong SQL
+    df = q.query(last_n_sql(table, kpi_clause, node_filter_sql, n=7), params=params)
     if df.empty:
         return pd.DataFrame(), pd.DataFrame(), "⚠ Không có dữ liệu."
 
-    # 7) 7 bản ghi gần nhất mỗi kpi_node
-    df["timestamp"] = pd.to_datetime(df["timestamp"], utc=True, errors="coerce")
-    df["kpi_value"] = pd.to_numeric(df["kpi_value"], errors="coerce")
-    df["kpi_node"] = df["Node"].astype(str) + "-" + df["kpi_name"].astype(str)
-    df = (
-        df.sort_values(["kpi_node", "timestamp"], ascending=[True, False])
-          .drop_duplicates(subset=["kpi_node", "timestamp"], keep="first")
-          .groupby("kpi_node", as_index=False, group_keys=False)
-          .head(7)
-          .sort_values(["kpi_node", "timestamp"], ascending=[True, True])
-    )
-
-    # 8) EMA
-    df["ema_kpi"] = (
-        df.groupby("kpi_node")["kpi_value"]
-          .transform(lambda s: s.ewm(span=3, adjust=False).mean())
-    )
+    # 7-8) kpi_node + EMA(span=3) bằng numpy trên các series đã sắp sẵn
+    df = frame_with_ema(df, span=3)
 
     # 9) Merge ngưỡng
     merged = df.merge(
@@ -108,10 +88,8 @@ def _build_frames(node_type_up: str) -> tuple[pd.DataFrame, pd.DataFrame, str |
 
     # Final frames
     final_df = merged[["timestamp", "kpi_node", "kpi_value", "ema_kpi", "nguong_fix", "signal"]]
-    latest_df = (
-        final_df.groupby("kpi_node", as_index=False, group_keys=False)
-                .tail(1)
-    )
+    # dòng cuối mỗi series (kết quả đã sắp theo series, timestamp tăng dần)
+    latest_df = final_df[group_ends(final_df["kpi_node"].to_numpy())]
     latest_df = latest_df[latest_df["signal"] == False]  # chỉ cảnh báo
 
     # Format time for display
@@ -124,6 +102,14 @@ def _build_frames(node_type_up: str) -> tuple[pd.DataFrame, pd.DataFrame, str |
     return final_df, latest_df, None
 
 
+def _cached_frames(node_type_up: str) -> tuple[pd.DataFrame, pd.DataFrame, str | None]:
+    """
+    _build_frames dùng chung cho 2 fragment + mọi màn hình: TTL ngắn, single-flight
+    (request đồng thời cùng type chờ 1 lần tính). Frame dùng chung -> chỉ đọc.
+    """
+    return LAST_KPI_CACHE.get(node_type_up, lambda: _build_frames(node_type_up))
+
+
 @router.get("", response_class=HTMLResponse)
 def last_kpi_page(request: Request, node_type: str = Query("MME")):
     # Render khung trang; htmx sẽ tự load các fragment
@@ -136,7 +122,7 @@ def last_kpi_page(request: Request, node_type: str = Query("MME")):
 @router.get("/frag/latest", response_class=HTMLResponse)
 def last_kpi_latest_fragment(request: Request, node_type: str = Query("MME")):
     node_type_up = node_type.upper()
-    _, latest_df, error = _build_frames(node_type_up)
+    _, latest_df, error = _cached_frames(node_type_up)
     if error:
         return HTMLResponse(f'<div class="alert alert-danger">{error}</div>')
 
@@ -150,7 +136,7 @@ def last_kpi_latest_fragment(request: Request, node_type: str = Query("MME")):
 @router.get("/frag/table", response_class=HTMLResponse)
 def last_kpi_table_fragment(request: Request, node_type: str = Query("MME")):
     node_type_up = node_type.upper()
-    final_df, _, error = _build_frames(node_type_up)
+    final_df, _, error = _cached_frames(node_type_up)
     if error:
         return HTMLResponse(f'<div class="alert alert-danger">{error}</div>')
 
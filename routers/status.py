@@ -0,0 +1,73 @@
+# routers/status.py
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from db_utils.questdb_ingest import all_ingest_stats
+from db_utils.ingest_spool import all_spool_stats
+from db_utils.ingest_watermark import WATERMARKS
+from db_utils.tail_cursor import tail_cursor_stats
+from jobs.ssh_pool import SSH_POOL
+from jobs.sbg_dir_index import SBG_DIR_INDEX
+from jobs.node_health import NODE_HEALTH
+from jobs.collection_scheduler import get_collection_scheduler
+from jobs.parse_pool import PARSE_POOL
+from jobs.log_service import logging_stats
+from db_utils.frame_cache import LAST_KPI_CACHE
+
+router = APIRouter(prefix="/status", tags=["Status"])
+
+
+@router.get("/ingest")
+def ingest_status():
+    """Thống kê ingestion QuestDB: rows/sec, độ trễ flush, số dòng đang chờ, spool."""
+    return JSONResponse({
+        "services": all_ingest_stats(),
+        "spools": all_spool_stats(),
+        "watermarks": WATERMARKS.stats(),
+    })
+
+
+@router.get("/ssh_pool")
+def ssh_pool_status():
+    """Pool SSH MME: số session đang giữ, hit/miss, số lần kết nối lại."""
+    return JSONResponse(SSH_POOL.stats())
+
+
+@router.get("/tail_cursor")
+def tail_cursor_status():
+    """Cursor SFTP PGW/SBG (bỏ qua / đọc phần mới / quét lại, tổng byte) + index thư mục SBG."""
+    return JSONResponse({
+        "cursors": tail_cursor_stats(),
+        "sbg_dir_index": SBG_DIR_INDEX.stats(),
+    })
+
+
+@router.get("/nodes")
+def nodes_status():
+    """Sức khoẻ từng node: trạng thái circuit, p50/p95 độ trễ, lỗi gần nhất, node đang bị bỏ qua."""
+    return JSONResponse(NODE_HEALTH.snapshot())
+
+
+@router.get("/scheduler")
+def scheduler_status():
+    """Scheduler thu thập chung: driver đã đăng ký, giới hạn đồng thời, thống kê chu kỳ gần nhất."""
+    return JSONResponse(get_collection_scheduler().stats())
+
+
+@router.get("/parse_pool")
+def parse_pool_status():
+    """Tầng parse ở process riêng: số payload parse trong thread / gửi sang pool, thời gian chờ trung bình."""
+    return JSONResponse(PARSE_POOL.stats())
+
+
+@router.get("/logging")
+def logging_status():
+    """Hàng đợi log: số bản ghi đang chờ thread listener, số bản ghi bị bỏ do đầy."""
+    return JSONResponse(logging_stats())
+
+
+@router.get("/frame_cache")
+def frame_cache_status():
+    """Cache frame last_kpi: hit / miss / request dùng chung lần tính đang chạy, key còn hạn."""
+    return JSONResponse(LAST_KPI_CACHE.stats())